@@ -1,6 +1,7 @@
 #cython: boundscheck=False, cdivision=True, wraparound=False, nonecheck=False
-from libc.math cimport pow, log, exp, log2
+from libc.math cimport pow, log, exp, log2, lgamma, log1p
 from libc.stdlib cimport malloc, free
+import numpy as np
 
 cdef double Ramanujan_logfact(double n, double logpi):
     cdef double lf
@@ -11,7 +12,152 @@ cdef double Ramanujan_logfact(double n, double logpi):
     lf += logpi
     return lf
 
+cdef void log_factorials(int n, double *logfact) noexcept nogil:
+    # Log-factorials of 0 to n, shared by the binomial terms of all sizes
+    cdef int k
+    for k in range(n + 1):
+        logfact[k] = lgamma(k + 1.0)
+
+cdef void binomial_terms(int n, double *logfact, double *log_choose, double *term) noexcept nogil:
+    # Log binomial coefficients and entropy terms of the counts 1 to n - 1 of
+    # a class in a sample of size n
+    cdef double freq
+    cdef int x
+    for x in range(1, n):
+        log_choose[x] = logfact[n] - logfact[x] - logfact[n - x]
+        freq = (<double>x) / n
+        term[x] = freq * log2(freq)
+
+cdef double expected_entropy(int n, double *pC, int numclasses, double *log_choose, double *term) noexcept nogil:
+    # By linearity the expected plug-in entropy of a multinomial sample is the
+    # sum over classes of E[-(X/n) log2(X/n)] with X ~ Binomial(n, p_j); the
+    # terms of X = 0 and X = n vanish
+    cdef double exact = 0.0
+    cdef double log_p, log_q
+    cdef int j, x
+    for j in range(numclasses):
+        if (pC[j] <= 0.0 or pC[j] >= 1.0):
+            continue
+        log_p = log(pC[j])
+        log_q = log1p(-pC[j])
+        for x in range(1, n):
+            exact -= exp(log_choose[x] + x * log_p + (n - x) * log_q) * term[x]
+    return exact
+
 def calc_exact(double n, list p, int numclasses):
+    """
+    Expected entropy in bits of the class frequencies of :obj:`n` samples
+    drawn from :obj:`numclasses` classes with proportions :obj:`p`, summed
+    over per class binomial terms in O(n numclasses) with exact log-gamma.
+    Return:
+        (:obj:`tuple`): :obj:`n` and the expected entropy.
+    """
+    cdef double exact
+    cdef int i
+    cdef double *pC
+    cdef double *logfact
+    cdef double *log_choose
+    cdef double *term
+    pC = <double *>malloc(numclasses * sizeof(double))
+    logfact = <double *>malloc((<int>n + 1) * sizeof(double))
+    log_choose = <double *>malloc((<int>n + 1) * sizeof(double))
+    term = <double *>malloc((<int>n + 1) * sizeof(double))
+    if pC is NULL or logfact is NULL or log_choose is NULL or term is NULL:
+        free(pC)
+        free(logfact)
+        free(log_choose)
+        free(term)
+        raise MemoryError()
+    for i in range(numclasses):
+        pC[i] = p[i]
+    log_factorials(<int>n, logfact)
+    binomial_terms(<int>n, logfact, log_choose, term)
+    exact = expected_entropy(<int>n, pC, numclasses, log_choose, term)
+    free(pC)
+    free(logfact)
+    free(log_choose)
+    free(term)
+    return (n, exact)
+
+def batch_exact(p, int n):
+    """
+    Expected entropies of sample sizes 1 to :obj:`n` for every row of the
+    (rows, classes) proportion matrix :obj:`p`, see :func:`calc_exact`. The
+    table is filled in one pass over the sizes, sharing one log-factorial
+    table and the binomial terms of each size across rows, without holding
+    the GIL.
+    Return:
+        (:class:`numpy.ndarray`): array of shape (rows, :obj:`n`).
+    """
+    cdef double[:, ::1] pC = np.ascontiguousarray(p, dtype=np.float64)
+    cdef Py_ssize_t rows = pC.shape[0]
+    cdef int numclasses = pC.shape[1]
+    cdef Py_ssize_t row
+    cdef int size
+    table = np.zeros((rows, n if n > 0 else 0))
+    if (n < 1 or rows == 0 or numclasses == 0):
+        return table
+    cdef double[:, ::1] out = table
+    cdef double *logfact = <double *>malloc((n + 1) * sizeof(double))
+    cdef double *log_choose = <double *>malloc((n + 1) * sizeof(double))
+    cdef double *term = <double *>malloc((n + 1) * sizeof(double))
+    if logfact is NULL or log_choose is NULL or term is NULL:
+        free(logfact)
+        free(log_choose)
+        free(term)
+        raise MemoryError()
+    with nogil:
+        log_factorials(n, logfact)
+        for size in range(1, n + 1):
+            binomial_terms(size, logfact, log_choose, term)
+            for row in range(rows):
+                out[row, size - 1] = expected_entropy(size, &pC[row, 0], numclasses, log_choose, term)
+    free(logfact)
+    free(log_choose)
+    free(term)
+    return table
+
+def binomial_entropy(p, int n):
+    """
+    Terms E[-(X/n) log2(X/n)], X ~ Binomial(n, p), of the expected entropy of
+    :obj:`n` samples for every proportion in the array :obj:`p`. The expected
+    entropy of a class background is the sum of the terms of its classes,
+    see :func:`calc_exact`.
+    Return:
+        (:class:`numpy.ndarray`): array of the shape of :obj:`p`.
+    """
+    p = np.asarray(p, dtype=np.float64)
+    cdef double[::1] pC = np.ascontiguousarray(p.ravel())
+    cdef Py_ssize_t i
+    cdef Py_ssize_t size = pC.shape[0]
+    terms = np.zeros(size)
+    if (n < 2 or size == 0):
+        return terms.reshape(p.shape)
+    cdef double[::1] out = terms
+    cdef double *logfact = <double *>malloc((n + 1) * sizeof(double))
+    cdef double *log_choose = <double *>malloc((n + 1) * sizeof(double))
+    cdef double *term = <double *>malloc((n + 1) * sizeof(double))
+    if logfact is NULL or log_choose is NULL or term is NULL:
+        free(logfact)
+        free(log_choose)
+        free(term)
+        raise MemoryError()
+    with nogil:
+        log_factorials(n, logfact)
+        binomial_terms(n, logfact, log_choose, term)
+        for i in range(size):
+            out[i] = expected_entropy(n, &pC[i], 1, log_choose, term)
+    free(logfact)
+    free(log_choose)
+    free(term)
+    return terms.reshape(p.shape)
+
+def calc_exact_enumerate(double n, list p, int numclasses):
+    """
+    Reference implementation of :func:`calc_exact` that enumerates every
+    composition of :obj:`n` into :obj:`numclasses` parts, with log-factorials
+    approximated by Ramanujan's formula.
+    """
     cdef double exact, log_probability, entropy
     cdef int j, y, r, i
     cdef double *counts
@@ -22,7 +168,7 @@ def calc_exact(double n, list p, int numclasses):
     counts = <double *>malloc(numclasses * sizeof(double))
     if counts is NULL or pC is NULL:
         raise MemoryError()
-    
+
     counts[0] = n
     for i in range(1,numclasses):
         counts[i] = 0
@@ -40,7 +186,7 @@ def calc_exact(double n, list p, int numclasses):
             if (counts[j] != 0):
                 entropy -= (counts[j]/n) * (log2(counts[j]/n))
         exact += (exp(log_probability) * entropy)
-    
+
         if (counts[0] != 0):
             counts[0] -= 1
             r = 1
@@ -52,7 +198,7 @@ def calc_exact(double n, list p, int numclasses):
                 counts[r] = 0
                 r += 1
         counts[r] = counts[r] + 1
-    
+
     free(counts)
     free(pC)
-    return (n, exact) 
+    return (n, exact)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains tests for the entropy estimator registry.
+"""
+
+from pytest import approx, raises
+import numpy as np
+import tsfm.entropy as entropy
+import tsfm.nsb_entropy as nb
+
+COUNTS = np.array([[4, 2, 3, 0, 2, 4, 0, 0, 2],
+                   [1, 1, 1, 0, 0, 0, 0, 0, 0],
+                   [9, 0, 0, 0, 0, 0, 0, 0, 1]])
+
+
+def chao_shen(row):
+    n = row.sum()
+    singletons = (row == 1).sum()
+    if singletons == n:
+        singletons = n - 1
+    p = (1 - singletons / n) * row[row > 0] / n
+    return -np.sum(p * np.log2(p) / (1 - (1 - p) ** n))
+
+
+def test_registry():
+    """
+    Testing that estimators are looked up by name, that unknown names are
+    rejected and that every backend estimates each row of a count matrix.
+    """
+    assert set(entropy.estimators) >= {"plugin", "MM", "NSB", "CS"}
+    assert entropy.estimator("MM") is entropy.estimators["MM"]
+    assert entropy.estimator("Miller") is entropy.estimators["MM"]
+    assert entropy.estimator(entropy.estimators["CS"]) is entropy.estimators["CS"]
+    with raises(ValueError):
+        entropy.estimator("ML")
+
+    plugin = entropy.plugin_entropy(COUNTS)
+    assert entropy.estimator("plugin").entropy(COUNTS) == approx(plugin)
+    assert entropy.estimator("MM").entropy(COUNTS) == approx(plugin)
+    assert entropy.estimator("MM").expected(2.0, 9, np.array([5, 10])) == approx(
+        [entropy.approx_expect(2.0, 9, 5), entropy.approx_expect(2.0, 9, 10)])
+    assert entropy.estimator("NSB").expected(2.0, 9, np.array([5, 10])) == approx([2.0, 2.0])
+    assert entropy.estimator("NSB").entropy(COUNTS) == approx(
+        [nb.S(nb.make_nxkx(row, 9), row.sum(), 9) for row in COUNTS])
+    assert entropy.estimator("NSB").entropy(COUNTS[:, :4], 9) == approx(
+        [nb.S(nb.make_nxkx(row, 9), row.sum(), 9) for row in COUNTS[:, :4]])
+    assert entropy.estimator("CS").entropy(COUNTS) == approx([chao_shen(row) for row in COUNTS])
+    assert (entropy.estimator("CS").entropy(COUNTS) >= plugin).all()
+
+
+def test_registered_estimator():
+    """
+    Testing that a registered estimator is used by the information kernel
+    for sample sizes without an exact correction.
+    """
+    class Constant(entropy.Estimator):
+        name = "constant"
+        description = "constant"
+
+        def entropy(self, counts, numclasses=None):
+            return np.full(np.shape(counts)[:-1], 0.25)
+
+    background = np.array([30, 20, 10, 5])
+    counts = np.array([[[3, 0, 0, 0], [6, 1, 0, 0]]])
+    entropy.register(Constant())
+    try:
+        info, height, present = entropy.information(counts, background, [0.0, 0.5, 0.75], "constant")
+    finally:
+        del entropy.estimators["constant"]
+    bg_entropy = entropy.plugin_entropy(background)
+    assert info[0] == approx([0.75, bg_entropy - 0.25])
+    info_mm = entropy.information(counts, background, [0.0, 0.5, 0.75], "MM")[0]
+    assert info_mm[0, 1] == approx(entropy.approx_expect(bg_entropy, 4, 7) -
+                                   entropy.plugin_entropy(counts[0, 1]))
+
+
+def test_estimator_benchmark():
+    """
+    Testing that the micro-benchmark times every estimator and leaves the
+    NSB cache in place.
+    """
+    cache = nb.cache
+    timings = entropy.benchmark(COUNTS, repeat=1)
+    assert set(timings) == set(entropy.estimators)
+    assert all(value > 0 for value in timings.values())
+    assert nb.cache is cache
+    assert set(entropy.benchmark(COUNTS, ["MM"], repeat=1)) == {"MM"}
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains tests for the gpd module.
+"""
+
+import numpy as np
+from pytest import approx
+import tsfm.gpd as gpd
+
+def test_tail_tracker():
+    """
+    Testing that the tracked tail matches the tail of the full history.
+    """
+    values = np.random.default_rng(1).exponential(size=5000)
+    tail = gpd.TailTracker(101)
+    for start in range(0, values.size, 377):
+        tail.update(values[start:start + 377])
+    assert tail.count == values.size
+    assert np.array_equal(tail.largest(101), np.sort(values)[-101:])
+
+    top = np.sort(values ** 5)[-51:]
+    threshold, sample = tail.exceedances(50, power=5)
+    assert threshold == approx((top[0] + top[1]) / 2)
+    assert sample == approx(top[1:] - threshold)
+
+def test_gpd_batched():
+    """
+    Testing the log-likelihood against scipy and that batched Fisher
+    information and confidence intervals match single fits.
+    """
+    from scipy.stats import genpareto
+    rng = np.random.default_rng(3)
+    samples = [np.sort(genpareto.rvs(c, scale=s, size=n, random_state=rng))
+               for c, s, n in [(0.2, 1.0, 50), (-0.1, 0.3, 120), (0.5, 2.0, 30)]]
+    fits = [genpareto.fit(sample, floc=0) for sample in samples]
+    shapes = [fit[0] for fit in fits]
+    scales = [fit[2] for fit in fits]
+    stats = [sample[-1] * 1.5 for sample in samples]
+    permcounts = [1000, 2000, 500]
+
+    assert gpd.log_likelihood(samples, shapes, scales) == approx(
+        [genpareto.logpdf(sample, c, 0, s).sum() for sample, c, s in zip(samples, shapes, scales)])
+    information = gpd.fisher_information(samples, shapes, scales)
+    intervals = gpd.confidence_intervals(0.05, samples, permcounts, shapes, scales, stats)
+    assert intervals.shape == (3, 2)
+    for i in range(3):
+        assert information[i] == approx(gpd.fisher_information(samples[i:i + 1], shapes[i:i + 1], scales[i:i + 1])[0])
+        assert intervals[i] == approx(gpd.confidence_intervals(0.05, samples[i:i + 1], permcounts[i:i + 1],
+                                                               shapes[i:i + 1], scales[i:i + 1], stats[i:i + 1])[0])
+        assert intervals[i][0] <= intervals[i][1]
+
+def test_profile_fit():
+    """
+    Testing that the fast GPD fit reaches the scipy likelihood, with and
+    without a warm start, and that both backends return the same decisions.
+    """
+    from scipy.stats import genpareto
+    rng = np.random.default_rng(5)
+    samples = [genpareto.rvs(c, scale=s, size=n, random_state=rng)
+               for c, s, n in [(0.2, 1.0, 50), (-0.3, 0.3, 120), (1.5, 2.0, 80), (0.0, 1.0, 200)]]
+    for sample in samples:
+        c, loc, s = genpareto.fit(sample, floc=0)
+        reference = gpd.log_likelihood([sample], [c], [s])[0]
+        shape, scale = gpd.profile_fit(sample)
+        assert gpd.log_likelihood([sample], [shape], [scale])[0] >= reference - 1e-6
+        warm = gpd.profile_fit(sample, gpd.TailFit(shape * 0.8, scale * 1.2, None, None))
+        assert warm == approx((shape, scale), rel=1e-6)
+
+    backend = gpd.BACKEND
+    try:
+        gpd.BACKEND = "fast"
+        fast = [gpd.fit(sample) for sample in samples]
+    finally:
+        gpd.BACKEND = backend
+    for sample, result in zip(samples, fast):
+        assert result.accepted == gpd.fit(sample).accepted
+
+    # ties at the threshold leave no maximum, and the degenerate fit is rejected
+    tied = np.concatenate([np.zeros(40), samples[0]])
+    assert not gpd.fit(tied).accepted
+    try:
+        gpd.BACKEND = "fast"
+        assert not gpd.fit(tied).accepted
+    finally:
+        gpd.BACKEND = backend
+
+def test_anderson_darling():
+    """
+    Testing the array Anderson-Darling test against ad_test, including
+    samples beyond the support and ties at the threshold.
+    """
+    from scipy.stats import genpareto
+    from tsfm import ad_test
+    from tsfm.addist import ad_unif, ad_unif_sf
+    rng = np.random.default_rng(7)
+    for shape, scale, n in [(0.3, 1.0, 200), (-0.4, 0.5, 60), (2.0, 1e-4, 25), (0.0, 3.0, 1)]:
+        sample = genpareto.rvs(shape, scale=scale, size=n, random_state=rng)
+        for c, s in [(shape, scale), (shape - 0.3, scale * 0.7)]:
+            reference = ad_test(sample, genpareto(c=c, scale=s, loc=0))
+            assert gpd.anderson_darling(sample, c, s) == approx(reference, rel=1e-12)
+    tied = np.concatenate([np.zeros(5), sample])
+    assert gpd.anderson_darling(tied, 0.0, 3.0).pvalue == 0
+
+    statistics = np.array([0, 0.2, 0.5, 1.9, 2, 5, 50, np.inf])
+    for n in [1, 3, 250]:
+        assert ad_unif_sf(statistics, n) == approx(ad_unif(n).sf(statistics), rel=1e-12)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains tests for the nsb_entropy module.
+"""
+
+import os
+from pytest import approx
+import numpy as np
+import tsfm.MolecularInformation
+import tsfm.nsb_entropy as nb
+
+KELLY2020 = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Kelly2020_data")
+
+def test_nsb_cache(tmp_path):
+    """
+    Testing that cached NSB estimates match direct estimates, are shared by
+    permuted count vectors, are evicted in least recently used order and
+    survive a save and load roundtrip.
+    """
+    nb.cache.clear()
+    counts = np.array([3, 0, 5, 1])
+    nxkx = nb.make_nxkx(counts, 4)
+    direct = nb.S(nxkx, 9, 4)
+    assert nb.cached_S(nxkx, 9, 4) == approx(direct)
+    assert nb.cached_S(nb.make_nxkx(np.array([1, 5, 0, 3]), 4), 9, 4) == approx(direct)
+    assert (nb.cache.hits, nb.cache.misses) == (1, 1)
+
+    cache = nb.NSBCache(maxsize=2)
+    cache.put("a", 1.0)
+    cache.put("b", 2.0)
+    cache.get("a")
+    cache.put("c", 3.0)
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+    nb.cache.save(str(tmp_path / "nsb_cache.pkl"))
+    loaded = nb.NSBCache()
+    loaded.load(str(tmp_path / "nsb_cache.pkl"))
+    assert loaded.get(nb.NSBCache.key(nxkx, 9, 4)) == approx(direct)
+    nb.cache.clear()
+
+def test_nsb_scipy_backend():
+    """
+    Testing the double precision NSB backend against mpmath quadrature on the
+    docstring example and on large samples of the Kelly2020 HOMO alignment.
+    """
+    nTest = np.array([[4, 2, 3, 0, 2, 4, 0, 0, 2]])
+    assert nb.validate(nTest, tol=1e-10) < 1e-10
+
+    with open(os.path.join(KELLY2020, "tRNA_L_skel_Leish.sites74.struct.cove")) as struct_file:
+        logo = tsfm.MolecularInformation.FunctionLogo(struct_file, "cove")
+    logo.parse_sequences(os.path.join(KELLY2020, "HOMO", "HOMO"))
+    counts = logo.counts.single_counts.reshape(-1, len(logo.counts.classes))
+    counts = counts[counts.sum(axis=1) > 5][::50]
+    assert nb.validate(counts, tol=1e-8, intervals=16) < 1e-8
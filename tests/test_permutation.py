@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains tests for the permutation module.
+"""
+
+import numpy as np
+import tsfm.permutation as permutation
+
+def test_permutation_generator():
+    """
+    Testing that permutation blocks are permutations of the input labels,
+    that spawned streams are independent and that seeding is reproducible.
+    """
+    labels = ["A"] * 5 + ["K"] * 3 + ["H"] * 2
+    permutation.seed(2020)
+    first, second = permutation.spawn(2)
+    block = first.permutations(labels, 50)
+    assert block.shape == (50, 10)
+    for row in block.tolist():
+        assert sorted(row) == sorted(labels)
+    assert not np.array_equal(block, second.permutations(labels, 50))
+
+    permutation.seed(2020)
+    assert np.array_equal(block, permutation.spawn(2)[0].permutations(labels, 50))
+    assert sorted(first.shuffled(labels)) == sorted(labels)
+    resample = first.resampled(labels)
+    assert len(resample) == len(labels) and set(resample) <= set(labels)
+
+    counts = first.class_counts([5, 3, 2], 4, 100)
+    assert counts.shape == (100, 3)
+    assert np.all(counts.sum(axis=1) == 4)
+    assert np.all(counts <= [5, 3, 2])
+
+def test_kld_null_cache():
+    """
+    Testing that KLD nulls depend only on the test signature, not on the
+    order or size of the blocks in which they are drawn, and that the cache
+    keeps the longest sequence of each signature.
+    """
+    permutation.seed(2020)
+    signature = permutation.kld_signature({"A": 3, "K": 2}, {"A": 1, "H": 4}, 21)
+    assert signature == permutation.kld_signature({"H": 3, "K": 2}, {"A": 4, "H": 1}, 21)
+
+    null = permutation.KLDNull(signature)
+    null.extend(10)
+    null.extend(500)
+    other = permutation.KLDNull(signature)
+    other.value(499)
+    assert np.array_equal(null.values[:500], other.values[:500])
+    assert np.all(null.values >= 0)
+
+    cache = permutation.KLDNullCache()
+    assert cache.null(signature) is cache.null(signature)
+    cache.update([null])
+    assert cache.null(signature) is null
+
+def test_kld_null_cache_seed(tmp_path):
+    """
+    Testing that cached KLD nulls drawn from another root seed are neither
+    used nor loaded.
+    """
+    permutation.seed(1)
+    signature = permutation.kld_signature({"A": 3, "K": 2}, {"A": 1, "H": 4}, 21)
+    cache = permutation.KLDNullCache()
+    null = cache.null(signature)
+    null.extend(50)
+    cache.save(str(tmp_path / "kld_nulls.pkl"))
+
+    permutation.seed(2)
+    assert cache.null(signature) is not null
+    loaded = permutation.KLDNullCache()
+    loaded.load(str(tmp_path / "kld_nulls.pkl"))
+    assert len(loaded) == 0
+
+    permutation.seed(1)
+    loaded.load(str(tmp_path / "kld_nulls.pkl"))
+    assert np.array_equal(loaded.null(signature).values, null.values)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains tests for the pvalues module.
+"""
+
+from pytest import approx
+import statsmodels.stats.multitest as smm
+from tsfm.pvalues import PValueTable
+
+def test_pvalue_table():
+    """
+    Testing that families are corrected separately and that corrected values
+    are scattered back to their features.
+    """
+    table = PValueTable()
+    table.add(3, "A", 0.01)
+    table.add(3, "G", 0.04)
+    table.add(3, "A", 0.03, aa_class="K")
+    table.add((1, 71), "GC", 0.02, family=1)
+    corrected = table.correct("fdr_bh")
+    expected = smm.multipletests([0.01, 0.04, 0.03], method="fdr_bh")[1]
+
+    stacks = table.nested(corrected)
+    letters = table.nested(corrected, letters=True)
+    assert [stacks[3]["A"], stacks[3]["G"], letters[3]["A"]["K"]] == approx(list(expected))
+    assert stacks[(1, 71)]["GC"] == approx(0.02)
+    assert "K" not in stacks[3]
@@ -3,8 +3,11 @@
 This module contains tests for the MolecularInformation module.
 """
 
+from collections import Counter
 from pytest import approx
+import numpy as np
 import tsfm.MolecularInformation
+import tsfm.permutation
 
 def test_functionlogo_text_setup(cove_files):
     """
@@ -38,22 +41,75 @@ def test_functionlogo_cove_setup(cove_files):
 def test_functionlogo_exact1(cove_files):
     cove_logo = tsfm.MolecularInformation.FunctionLogo(cove_files['cove'], "cove")
     cove_logo.parse_sequences(cove_files['prefix'])
-    cove_logo.calculate_exact(5, 1)
-    cove_logo.calculate_exact(5, 1, inverse=True)
+    cove_logo.calculate_exact(5)
+    cove_logo.calculate_exact(5, inverse=True)
     assert len(cove_logo.exact) == 5
-    assert approx([0.0, 0.44442903, 0.61221003, 0.69694880, 0.746884728]) == cove_logo.exact
+    assert approx([0.0, 0.444444444444, 0.612197222703, 0.696927468868, 0.746862550923]) == cove_logo.exact
     assert len(cove_logo.inverse_exact) == 5
-    assert approx([0.0, 0.444429036427, 0.612210037675, 0.696948806402, 0.746884728233]) == cove_logo.inverse_exact
+    assert approx([0.0, 0.444444444444, 0.612197222703, 0.696927468868, 0.746862550923]) == cove_logo.inverse_exact
 
 def test_functionlogo_exact2(cove_files):
     cove_logo = tsfm.MolecularInformation.FunctionLogo(cove_files['cove'], "cove")
     cove_logo.parse_sequences(cove_files['prefix'])
-    cove_logo.calculate_exact(5, 10)
-    cove_logo.calculate_exact(5, 10, inverse=True)
-    assert len(cove_logo.exact) == 5
-    assert approx([0.0, 0.44442903, 0.61221003, 0.69694880, 0.746884728]) == cove_logo.exact
-    assert len(cove_logo.inverse_exact) == 5
-    assert approx([0.0, 0.444429036427, 0.612210037675, 0.696948806402, 0.746884728233]) == cove_logo.inverse_exact
+    cove_logo.calculate_exact(60)
+    cove_logo.calculate_exact(60, inverse=True)
+    assert isinstance(cove_logo.exact, np.ndarray)
+    assert cove_logo.exact.shape == (60,)
+    assert approx([0.0, 0.444444444444, 0.612197222703, 0.696927468868, 0.746862550923]) == cove_logo.exact[:5]
+    assert np.all(np.diff(cove_logo.exact) > 0)
+    assert np.array_equal(cove_logo.exact, cove_logo.inverse_exact)
+
+def test_exact_kernel():
+    """
+    Testing that the binomial exact kernel agrees with enumerating every
+    composition, whose Ramanujan log-factorials are accurate to about 1e-4.
+    """
+    from tsfm import exact
+    rng = np.random.default_rng(3)
+    for numclasses, sizes in ((2, range(1, 13)), (4, range(1, 10)), (21, range(1, 6))):
+        p = list(rng.dirichlet(np.ones(numclasses)))
+        for n in sizes:
+            assert exact.calc_exact(n, p, numclasses)[1] == approx(exact.calc_exact_enumerate(n, p, numclasses)[1],
+                                                                  rel=1e-4, abs=1e-12)
+        table = exact.batch_exact(np.array([p, p[::-1]]), 5)
+        assert table.shape == (2, 5)
+        assert np.array_equal(table[0], [exact.calc_exact(n, p, numclasses)[1] for n in range(1, 6)])
+    assert exact.calc_exact(2, [0.5, 0.5], 2)[1] == approx(0.5)
+    assert exact.calc_exact(50, [1.0, 0.0], 2)[1] == 0.0
+
+def test_exact_cache(tmp_path):
+    """
+    Testing that cached exact corrections match direct calculations, are
+    shared by permuted proportion vectors, that the per class term tables
+    are evicted in least recently used order and that both survive a save
+    and load roundtrip.
+    """
+    from tsfm import exact
+    from tsfm.entropy import ExactCache
+    cache = ExactCache(terms_maxsize=2)
+    p = [0.5, 0.3, 0.2]
+    direct = [exact.calc_exact(n, p, 3)[1] for n in range(1, 6)]
+    table = cache.table(6, [[0.3, 0.0, 0.2, 0.5], [0.5, 0.5, 0.0, 0.0]])
+    assert table[0, :5] == approx(direct)
+    assert table[1] == approx([exact.calc_exact(n, [0.5, 0.5], 2)[1] for n in range(1, 7)])
+    assert np.array_equal(cache.table(5, [[0.2, 0.5, 0.3]])[0], table[0, :5])
+    assert (cache.hits, cache.misses, len(cache)) == (1, 2, 2)
+
+    terms = cache.class_terms(10, 4)
+    assert terms[[5, 3, 2]].sum() == approx(exact.calc_exact(4, p, 3)[1])
+    cache.class_terms(10, 3)
+    assert cache.class_terms(10, 4) is terms
+    cache.class_terms(20, 4)
+    assert list(cache._terms) == [(10, 4), (20, 4)]
+
+    cache.save(str(tmp_path / "exact_cache.sqlite"))
+    loaded = ExactCache()
+    loaded.load(str(tmp_path / "exact_cache.sqlite"))
+    assert len(loaded) == 2
+    assert np.array_equal(loaded.table(5, [p])[0], table[0, :5])
+    assert (loaded.hits, loaded.misses) == (1, 0)
+    assert np.array_equal(loaded.class_terms(10, 4), terms)
+    assert sorted(loaded._terms) == [(10, 4), (20, 4)]
 
 def test_functionlogo_cove_MM(cove_files):
     info_key1 = [(12, 24), (11, 25), (10, 26), (9, 27), (33, 41), (32, 42),
@@ -67,8 +123,8 @@ def test_functionlogo_cove_MM(cove_files):
                  71, 72, 73, 74, 75]
     cove_logo = tsfm.MolecularInformation.FunctionLogo(cove_files['cove'], "cove")
     cove_logo.parse_sequences(cove_files['prefix'])
-    cove_logo.calculate_exact(5, 1)
-    cove_logo.calculate_exact(5, 1, inverse=True)
+    cove_logo.calculate_exact(5)
+    cove_logo.calculate_exact(5, inverse=True)
     info, height = cove_logo.calculate_entropy_MM()
     inverse_info, inverse_height = cove_logo.calculate_entropy_inverse_MM()
     assert sorted(info_key1, key=str) == sorted(list(info.keys()), key=str)
@@ -93,8 +149,8 @@ def test_functionlogo_cove_NSB(cove_files):
                  71, 72, 73, 74, 75]
     cove_logo = tsfm.MolecularInformation.FunctionLogo(cove_files['cove'], "cove")
     cove_logo.parse_sequences(cove_files['prefix'])
-    cove_logo.calculate_exact(5, 1)
-    cove_logo.calculate_exact(5, 1, inverse=True)
+    cove_logo.calculate_exact(5)
+    cove_logo.calculate_exact(5, inverse=True)
     info, height = cove_logo.calculate_entropy_NSB()
     inverse_info, inverse_height = cove_logo.calculate_entropy_inverse_NSB()
     assert sorted(info_key1, key=str) == sorted(list(info.keys()), key=str)
@@ -111,7 +167,7 @@ def test_functionlogo_cove_NSB(cove_files):
 def test_functionlogo_cove_perm1(cove_files):
     cove_logo = tsfm.MolecularInformation.FunctionLogo(cove_files['cove'], "cove")
     cove_logo.parse_sequences(cove_files['prefix'])
-    cove_logo.permute(4, 1)
+    cove_logo.permute(4)
     perm_info_miller = cove_logo.permInfo("Miller", 1)
     perm_info_nsb = cove_logo.permInfo("NSB", 1)
     perm_inverse_miller = cove_logo.permInfo("Miller", 1, inverse=True)
@@ -120,12 +176,30 @@ def test_functionlogo_cove_perm1(cove_files):
 def test_functionlogo_cove_perm2(cove_files):
     cove_logo = tsfm.MolecularInformation.FunctionLogo(cove_files['cove'], "cove")
     cove_logo.parse_sequences(cove_files['prefix'])
-    cove_logo.permute(4, 8)
+    cove_logo.permute(4)
     perm_info_miller = cove_logo.permInfo("Miller", 8)
     perm_info_nsb = cove_logo.permInfo("NSB", 8)
     perm_inverse_miller = cove_logo.permInfo("Miller", 8, inverse=True)
     perm_inverse_nsb = cove_logo.permInfo("NSB", 8, inverse=True)
 
+def test_functionlogo_bootstrap(cove_files):
+    """
+    Testing that bootstrap replicates resample every functional class and
+    are reproduced from the seed.
+    """
+    cove_logo = tsfm.MolecularInformation.FunctionLogo(cove_files['cove'], "cove")
+    cove_logo.parse_sequences(cove_files['prefix'])
+    replicates = []
+    for proc in (2, 2):
+        tsfm.permutation.seed(11)
+        cove_logo.bootstrap(3, proc)
+        assert len(cove_logo.bootstrapList) == 3
+        replicates.append([[(seq.function, seq.seq) for seq in boot.sequences] for boot in cove_logo.bootstrapList])
+    assert replicates[0] == replicates[1]
+    functions = Counter(seq.function for seq in cove_logo.sequences)
+    for boot in cove_logo.bootstrapList:
+        assert Counter(seq.function for seq in boot.sequences) == functions
+
 def test_FunctionLogoResult(cove_files):
     cove_logo = tsfm.MolecularInformation.FunctionLogo(cove_files['cove'], "cove")
     cove_logo.parse_sequences(cove_files['prefix'])
@@ -139,7 +213,7 @@ def test_FunctionLogoResult(cove_files):
 def test_statTest(cove_files):
     cove_logo = tsfm.MolecularInformation.FunctionLogo(cove_files['cove'], "cove")
     cove_logo.parse_sequences(cove_files['prefix'])
-    cove_logo.permute(4, 8)
+    cove_logo.permute(4)
     perm_info_miller = cove_logo.permInfo("Miller", 8)
     perm_info_nsb = cove_logo.permInfo("NSB", 8)
     perm_inverse_miller = cove_logo.permInfo("Miller", 8, inverse=True)
@@ -169,3 +243,186 @@ def test_statTest(cove_files):
     result_miller.add_stats(perm_inverse_miller, 'fdr_bh', "both", False, inverse=True)
     result_nsb.add_stats(perm_info_nsb, 'fdr_bh', "both", False)
     result_nsb.add_stats(perm_inverse_nsb, 'fdr_bh', "both", False, inverse=True)
+
+def test_functionlogo_get(cove_files):
+    cove_logo = tsfm.MolecularInformation.FunctionLogo(cove_files['cove'], "cove")
+    cove_logo.parse_sequences(cove_files['prefix'])
+    for coord in [[0], [44], [75]]:
+        for state in cove_logo.singles:
+            expected = Counter(x.function for x in cove_logo.sequences if x.seq[coord[0]] == state)
+            assert expected == cove_logo.get(coord, state)
+    for coord in cove_logo.basepairs:
+        for state in cove_logo.pairs:
+            expected = Counter(x.function for x in cove_logo.sequences
+                               if x.seq[coord[0]] + x.seq[coord[1]] == state)
+            assert expected == cove_logo.get(coord, state)
+    assert Counter() == cove_logo.get([3], "X")
+
+def test_functionlogo_perm_info_calc(cove_files):
+    """
+    Testing that information of permuted class label vectors matches the
+    information of a function logo built from the relabeled sequences.
+    """
+    cove_logo = tsfm.MolecularInformation.FunctionLogo(cove_files['cove'], "cove")
+    cove_logo.parse_sequences(cove_files['prefix'])
+    labels = cove_logo.permutations(1, tsfm.permutation.PermutationGenerator(5))
+    bp_info, ss_info, bp_height, ss_height = cove_logo.perm_info_calc(labels, "MM")
+    perm_logo = tsfm.MolecularInformation.FunctionLogo(cove_logo.basepairs)
+    for label, seq in zip(labels[0], cove_logo.sequences):
+        perm_logo.add_sequence(cove_logo.counts.classes[label], seq.seq)
+    info, height = perm_logo.calculate_entropy_MM()
+    assert sorted(ss_info) == approx(sorted(info[x][s] for x in range(cove_logo.pos) for s in info[x]))
+    assert sorted(bp_info) == approx(sorted(info[x][s] for x in cove_logo.basepairs for s in info[x]))
+    assert sorted(bp_height) == approx(sorted(info[x][s] * h for x in cove_logo.basepairs
+                                              for s in info[x] for h in height[x][s].values()))
+
+def test_functionlogodist(tmpdir):
+    """
+    Testing right tail probabilities, merging and saving of permutation
+    distributions.
+    """
+    bp_info = [0.5, 0.5, 1.0, 2.0]
+    single_info = [0.1, 0.3, 0.3]
+    dist = tsfm.MolecularInformation.FunctionLogoDist()
+    dist.weighted_dist((bp_info, bp_info), (single_info, single_info))
+    assert dist.rtp("bpinfo", [0.5, 0.7, 2.0, 3.0, 0.0]).tolist() == approx([5 / 5, 3 / 5, 2 / 5, 1 / 5, 1.0])
+
+    other = tsfm.MolecularInformation.FunctionLogoDist()
+    other.weighted_dist(([1.0], [1.0]), ([0.3], [0.3]))
+    dist.merge(other)
+    assert dist.rtp("singleinfo", [0.3]).tolist() == approx([4 / 5])
+
+    dist.permutations = 6
+    dist.save(str(tmpdir.join("null.npz")), "signature")
+    loaded = tsfm.MolecularInformation.FunctionLogoDist()
+    loaded.from_file(str(tmpdir.join("null.npz")))
+    assert loaded.rtp("bpinfo", [1.0]).tolist() == approx([4 / 6])
+    assert loaded.signature == "signature"
+
+    from tsfm.tsfm import load_null
+    assert load_null(str(tmpdir.join("null.npz")), 6, "signature") is not None
+    assert load_null(str(tmpdir.join("null.npz")), 6, "other") is None
+    assert load_null(str(tmpdir.join("null.npz")), 7, "signature") is None
+    assert load_null(str(tmpdir.join("null.npz")), 5, "signature") is None
+
+def test_null_signature(cove_files):
+    """
+    Testing that saved permutation nulls are keyed on the alignment, the
+    exact corrections and the NSB backend.
+    """
+    from argparse import Namespace
+    from tsfm.tsfm import null_signature
+    import tsfm.nsb_entropy as nb
+    args = Namespace(entropy="NSB", seed=7, precision=None)
+    cove_logo = tsfm.MolecularInformation.FunctionLogo(cove_files['cove'], "cove")
+    cove_logo.parse_sequences(cove_files['prefix'])
+    signature = null_signature(args, cove_logo)
+    assert null_signature(args, cove_logo) == signature
+    backend = nb.BACKEND
+    nb.BACKEND = "scipy" if (backend != "scipy") else "mpmath"
+    try:
+        assert null_signature(args, cove_logo) != signature
+    finally:
+        nb.BACKEND = backend
+    cove_logo.calculate_exact(3)
+    assert null_signature(args, cove_logo) != signature
+
+    perm_logo = tsfm.MolecularInformation.FunctionLogo(cove_logo.basepairs)
+    for label, seq in zip(np.roll(cove_logo.counts.labels, 1), cove_logo.sequences):
+        perm_logo.add_sequence(cove_logo.counts.classes[label], seq.seq)
+    assert perm_logo.counts.digest() != cove_logo.counts.digest()
+
+def test_adaptive_pvalue():
+    """
+    Testing that adaptive stopping does not depend on the batch size and
+    that GPD fits are only attempted at checkpoints.
+    """
+    values = np.random.default_rng(5).exponential(size=4000)
+
+    def draw(start, stop):
+        return values[start:stop]
+
+    difference = tsfm.MolecularInformation.FunctionLogoDifference(1, Counter(), [], [], [])
+    ecdf = difference.adaptive_pvalue(draw, 3.0, 4000, 10, 0.05, ("", ""))
+    assert ecdf[3] == np.flatnonzero(values >= 3.0)[9] + 1
+    assert ecdf[0] == approx(10 / ecdf[3])
+    assert ecdf[11] == 0
+    assert ecdf[12] is None
+
+    gpd = difference.adaptive_pvalue(draw, 12.0, 4000, 10, 0.05, ("", ""), 1000, 250)
+    difference.perm_batch = 7
+    batched = difference.adaptive_pvalue(draw, 12.0, 4000, 10, 0.05, ("", ""), 1000, 250)
+    assert batched[:12] == gpd[:12]
+    assert np.array_equal(batched[12][0], gpd[12][0])
+    assert gpd[4] == "p_gpd"
+    assert gpd[3] in (1000, 2000, 4000)
+    assert gpd[11] >= 1
+    assert len(gpd[12][0]) == gpd[9]
+
+def test_id_statistic():
+    """
+    Testing that ID permutation statistics updated from fixed class totals
+    match recomputing the class backgrounds of every permuted sample, and
+    that the unpermuted samples tie with the observed difference.
+    """
+    from tsfm import exact
+    import tsfm.nsb_entropy as nb
+    b_functions = Counter({"A": 30, "C": 20, "D": 10})
+    f_functions = Counter({"A": 5, "C": 25, "E": 15})
+    class_counts_b = Counter({"A": 3, "C": 2})
+    class_counts_f = Counter({"C": 4, "E": 3})
+    difference = tsfm.MolecularInformation.FunctionLogoDifference(1, Counter(), [], [], [])
+
+    def info(sample, class_counts, functions, max_exact, method):
+        background = np.array(list((functions - class_counts + sample).values()), dtype=float)
+        p = background / background.sum()
+        counts = np.array(list(sample.values()) + [0] * (len(functions) - len(sample)))
+        size = counts.sum()
+        freqs = counts[counts > 0] / size
+        fg_entropy = -np.sum(freqs * np.log2(freqs))
+        if (size <= max_exact):
+            expected = exact.calc_exact(size, list(p), len(p))[1]
+        elif (method == "NSB"):
+            expected = -np.sum(p * np.log2(p))
+            fg_entropy = nb.S(nb.make_nxkx(counts, counts.size), size, counts.size)
+        else:
+            expected = -np.sum(p * np.log2(p)) - (len(functions) - 1) / (np.log(4) * size)
+        return max(expected - fg_entropy, 0)
+
+    for max_exact, method in ((10, "MM"), (5, "MM"), (3, "MM"), (3, "NSB")):
+        code, values, observed = difference.id_statistic(class_counts_b, class_counts_f, 5, b_functions,
+                                                         f_functions, max_exact, method)
+        samples = np.array([code[aa_class] for aa_class in "AAACCCCCCEEE"])
+        perms = tsfm.permutation.PermutationGenerator(1).permutations(samples, 20)
+        classes = sorted(code, key=code.get)
+        for row, value in zip(perms, values(perms)):
+            sample_b = Counter(classes[index] for index in row[:5])
+            sample_f = Counter(classes[index] for index in row[5:])
+            reference = (info(sample_f, class_counts_f, f_functions, max_exact, method) -
+                         info(sample_b, class_counts_b, b_functions, max_exact, method))
+            assert value == approx(max(reference, 0), abs=1e-9)
+        assert values(samples[None, :])[0] == observed
+
+
+def test_functionlogo_shared(cove_files):
+    """
+    Testing that logos with shared count tensors pickle without their
+    sequences and that copies read the same counts.
+    """
+    import os
+    import pickle
+    cove_logo = tsfm.MolecularInformation.FunctionLogo(cove_files['cove'], "cove")
+    cove_logo.parse_sequences(cove_files['prefix'])
+    size = len(pickle.dumps(cove_logo.share()))
+    path = cove_logo.counts._shared[0]
+    copy = pickle.loads(pickle.dumps(cove_logo))
+    assert copy.sequences is None and len(copy) == len(cove_logo) == 21
+    assert copy.get([10], "A") == cove_logo.get([10], "A")
+    assert copy.get((6, 68), "CG") == cove_logo.get((6, 68), "CG")
+    labels = np.roll(cove_logo.counts.labels, 3)
+    for shared, private in zip(copy.counts.tensors(labels), cove_logo.counts.tensors(labels)):
+        assert np.array_equal(shared, private)
+
+    cove_logo.counts.release()
+    assert not os.path.exists(path)
+    assert len(pickle.dumps(cove_logo)) > size
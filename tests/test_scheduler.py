@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains tests for the scheduler module.
+"""
+
+import io
+import tsfm.scheduler as scheduler
+
+def test_run():
+    """
+    Testing that results come back in job order whatever the costs, and
+    that the utilization of the workers is logged.
+    """
+    jobs = [(n, 7) for n in range(50)]
+    expected = [divmod(n, 7) for n in range(50)]
+    log = io.StringIO()
+    assert scheduler.run(divmod, jobs, 2) == expected
+    assert scheduler.run(divmod, jobs, 2, costs=[n % 9 for n in range(50)], name="divmod", file=log) == expected
+    lines = log.getvalue().splitlines()
+    assert lines[0].startswith("divmod: 50 tasks on 2 workers")
+    assert sum(int(line.split(": ")[1].split()[0]) for line in lines[1:]) == 50
+
+def test_persistent_pool():
+    """
+    Testing that stages reuse the workers of the persistent pool.
+    """
+    import os
+    jobs = [(n, 7) for n in range(20)]
+    expected = [divmod(n, 7) for n in range(20)]
+    scheduler.start(2)
+    try:
+        first = {output[1] for output in scheduler.imap(os.getpid, [()] * 20, 2)}
+        second = {output[1] for output in scheduler.imap(os.getpid, [()] * 20, 2)}
+        assert first | second <= set(scheduler._pool._pool[i].pid for i in range(2))
+        assert scheduler.run(divmod, jobs, 2) == expected
+    finally:
+        scheduler.stop()
+    assert scheduler._pool is None
+    assert scheduler.run(divmod, jobs, 2) == expected
+
+def worker_settings():
+    import tsfm.nsb_entropy as nb
+    import tsfm.gpd as gpd
+    import tsfm.permutation as permutation
+    return nb.BACKEND, gpd.BACKEND, permutation._root.entropy, len(permutation.kld_nulls)
+
+def test_spawned_workers():
+    """
+    Testing that workers started by spawn, which do not inherit the memory
+    of the parent process, receive the registered backends, seed and caches.
+    """
+    import multiprocessing
+    import tsfm.nsb_entropy as nb
+    import tsfm.gpd as gpd
+    import tsfm.permutation as permutation
+    method = multiprocessing.get_start_method()
+    settings = nb.BACKEND, gpd.BACKEND, permutation._root
+    multiprocessing.set_start_method("spawn", force=True)
+    try:
+        nb.BACKEND, gpd.BACKEND = "scipy", "fast"
+        permutation.seed(42)
+        permutation.kld_nulls.null(((2, 3), 2, 3))
+        expected = [("scipy", "fast", 42, len(permutation.kld_nulls))] * 2
+        assert scheduler.run(worker_settings, [()] * 2, 2) == expected
+        scheduler.start(2)
+        try:
+            assert scheduler.run(worker_settings, [()] * 2, 2) == expected
+        finally:
+            scheduler.stop()
+    finally:
+        multiprocessing.set_start_method(method, force=True)
+        nb.BACKEND, gpd.BACKEND, permutation._root = settings
+        permutation.kld_nulls.clear()
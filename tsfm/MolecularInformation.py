@@ -3,30 +3,28 @@
 
 """
 from collections import Counter, defaultdict
-from multiprocessing import Pool
 from operator import itemgetter
 from string import Template
 from ast import literal_eval as make_tuple
-import os
-import bisect
 import pkgutil
 import itertools
 import sys
-import random
-import time
 import glob
 import math as mt
 import re
 import numpy as np
-import statsmodels.stats.multitest as smm
 import pandas as pd
-import tsfm.nsb_entropy as nb
-import tsfm.exact as exact
+import tsfm.entropy as entropy
+import tsfm.permutation as permutation
+import tsfm.gpd as gpd
+import tsfm.scheduler as scheduler
+from tsfm.counts import AlignmentCounts
+from tsfm.entropy import exact_cache, PermutedInformation
+from tsfm.pvalues import PValueTable
 import warnings
 from operator import truediv
 from scipy import stats
 from scipy.stats import genpareto
-from tsfm import  ad_test
 from scipy.stats import norm
 
 class DistanceCalculator:
@@ -470,18 +468,17 @@ class FunctionLogoResults:
             self.p = distribution.stat_test(self.info, self.height, correction, test,
                                             nosingle)
 
+    @property
+    def counts(self):
+        """
+        :class:`tsfm.counts.AlignmentCounts` of :attr:`sequences`, built on first use.
+        """
+        if (getattr(self, "_counts", None) is None):
+            self._counts = AlignmentCounts(self.sequences, self.basepairs)
+        return self._counts
+
     def get(self, position, state):
-        ret_counter = Counter()
-        if (len(position) == 1):
-            for x in self.sequences:
-                if (x.seq[position[0]] == state[0]):
-                    ret_counter[x.function] += 1
-        if (len(position) == 2):
-            for x in self.sequences:
-                if (x.seq[position[0]] == state[0] and x.seq[position[1]] == state[1]):
-                    ret_counter[x.function] += 1
-
-        return ret_counter
+        return self.counts.get(position, state)
 
     def text_output(self, correction):
         """
@@ -737,42 +734,107 @@ class FunctionLogoDist:
     distribution are inferred from the permuted data and
     :class:`FunctionLogoDist` objects created using
     :meth:`FunctionLogo.permInfo`.
+    Each distribution is held as sorted distinct values together with the
+    reverse cumulative counts of values greater than or equal to each of
+    them, so that right tail probabilities are found by binary search.
     Attributes:
-        bpinfodist (:obj:`dict` of :obj:`float` mapping to :obj:`int`):
-            Discrete probability distribution of basepair feature information
-        bpheightdist (:obj:`dict` of :obj:`float` mapping to :obj:`int`):
-            Discrete probability distribution of functional class
-            information of basepair features
-        singleinfodist (:obj:`dict` of :obj:`float` mapping to :obj:`int`):
-            Discrete probability distribution of single base feature information
-        singleheightdist (:obj:`dict` of :obj:`float` mapping to :obj:`int`):
-            Discrete probability distribution of functional class
-            information of single base features
+        values (:obj:`dict` of :obj:`str` mapping to :class:`numpy.ndarray`):
+            Sorted distinct values of the ``bpinfo``, ``bpheight``,
+            ``singleinfo`` and ``singleheight`` distributions, i.e. basepair
+            feature information, functional class information of basepair
+            features, single base feature information and functional class
+            information of single base features.
+        counts (:obj:`dict` of :obj:`str` mapping to :class:`numpy.ndarray`):
+            Number of occurrences of each value.
+        tails (:obj:`dict` of :obj:`str` mapping to :class:`numpy.ndarray`):
+            Number of occurrences of values greater than or equal to each
+            value, followed by a zero.
+        permutations (:obj:`int`): Number of permutations the distributions
+            were estimated from.
     """
 
+    names = ("bpinfo", "bpheight", "singleinfo", "singleheight")
+
     def __init__(self):
+        self.values = {name: np.zeros(0) for name in self.names}
+        self.counts = {name: np.zeros(0, dtype=np.int64) for name in self.names}
+        self.tails = {name: np.zeros(1, dtype=np.int64) for name in self.names}
+        self.permutations = 0
+        #: Settings and data the distributions were estimated from, see :meth:`save`.
+        self.signature = ""
+        self._pending = {name: [] for name in self.names}
 
-        self.bpinfodist = defaultdict(int)
-        self.bpheightdist = defaultdict(int)
+    def weighted_dist(self, bpdata, singledata):
+        hists = [np.unique(np.asarray(data, dtype=float), return_counts=True)
+                 for data in (bpdata[0], bpdata[1], singledata[0], singledata[1])]
+        self.add_counts((hists[0], hists[1]), (hists[2], hists[3]))
+        self.cumulate()
 
-        self.singleinfodist = defaultdict(int)
-        self.singleheightdist = defaultdict(int)
+    def add_counts(self, bpdata, singledata):
+        """
+        Merge partial histograms into the distributions. Each of :obj:`bpdata`
+        and :obj:`singledata` is a pair of (info, height) histograms given as
+        (values, counts) arrays. Call :meth:`cumulate` after the last merge.
+        """
+        for name, hist in zip(self.names, (bpdata[0], bpdata[1], singledata[0], singledata[1])):
+            self._pending[name].append(hist)
+            pending = sum(values.size for values, counts in self._pending[name])
+            if (pending > max(self.values[name].size, 2 ** 16)):
+                self._consolidate(name)
+
+    def _consolidate(self, name):
+        if (not self._pending[name]):
+            return
+        values = np.concatenate([self.values[name]] + [values for values, counts in self._pending[name]])
+        counts = np.concatenate([self.counts[name]] + [counts for values, counts in self._pending[name]])
+        self.values[name], index = np.unique(values, return_inverse=True)
+        self.counts[name] = np.bincount(index, weights=counts, minlength=self.values[name].size).astype(np.int64)
+        self._pending[name] = []
+
+    def cumulate(self):
+        """
+        Merge pending histograms and compute reverse cumulative counts.
+        """
+        for name in self.names:
+            self._consolidate(name)
+            self.tails[name] = np.append(np.cumsum(self.counts[name][::-1])[::-1], 0)
 
-    def weighted_dist(self, bpdata, singledata):
-        for x in bpdata[0]:
-            self.bpinfodist[x] += 1
-        for x in bpdata[1]:
-            self.bpheightdist[x] += 1
+    def merge(self, other):
+        """
+        Add the distributions of another :class:`FunctionLogoDist`, e.g. one
+        estimated from independent permutations in a previous run.
+        """
+        for name in self.names:
+            self._pending[name].append((other.values[name], other.counts[name]))
+        self.permutations += other.permutations
+        self.cumulate()
 
-        for x in singledata[0]:
-            self.singleinfodist[x] += 1
-        for x in singledata[1]:
-            self.singleheightdist[x] += 1
+    def save(self, file_name, signature=None):
+        """
+        Save the distributions in :obj:`numpy` ``.npz`` format, together with
+        :obj:`signature`, a string identifying the alignment and settings
+        they were estimated from, :attr:`signature` by default.
+        """
+        if (signature is not None):
+            self.signature = signature
+        arrays = {}
+        for name in self.names:
+            arrays[name + "_values"] = self.values[name]
+            arrays[name + "_counts"] = self.counts[name]
+        np.savez(file_name, permutations=self.permutations, signature=self.signature, **arrays)
 
-        self.bpinfo_sorted_keys = sorted(self.bpinfodist.keys())
-        self.bpheight_sorted_keys = sorted(self.bpheightdist.keys())
-        self.ssinfo_sorted_keys = sorted(self.singleinfodist.keys())
-        self.ssheight_sorted_keys = sorted(self.singleheightdist.keys())
+    def from_file(self, file_name):
+        """
+        Replace the distributions with those saved by :meth:`save`.
+        """
+        with np.load(file_name) as arrays:
+            for name in self.names:
+                self.values[name] = arrays[name + "_values"]
+                self.counts[name] = arrays[name + "_counts"]
+                self._pending[name] = []
+            self.permutations = int(arrays["permutations"])
+            self.signature = str(arrays["signature"]) if ("signature" in arrays.files) else ""
+        self.cumulate()
 
     def stat_test(self, info, height, correction, test, features):
         """
@@ -792,108 +854,46 @@ class FunctionLogoDist:
             test (:obj:`str`): Indicate statistical testing and multiple test correction of only stack height, only letter height, or both.
             features (:obj:`str`): Indicate statistical testing and multiple test correction of basepair features only, single sites only or both.
         """
-        P = defaultdict(lambda: defaultdict(float))
-        P_corrected = defaultdict(lambda: defaultdict(float))
-        p = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
-        p_corrected = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
-        bp_coords = []
-        ss_coords = []
-        test_bp_stack = []
-        test_ss_stack = []
-        test_bp_letter = []
-        test_ss_letter = []
-
+        # collect the query points of each distribution, then look all of them up at once
+        queries = {name: ([], []) for name in self.names}
         for coord in info:
             for pairtype in info[coord]:
                 if "," in str(coord) and (features == "pairs" or features == "both"):
-                    bp_coords.append(coord)
-                    if test == "stacks" or test == "both":
-                        P[coord][pairtype] = self.rtp(self.bpinfodist, info[coord][pairtype], self.bpinfo_sorted_keys)
-                    if test == "letters" or test == "both":
-                        for aa in height[coord][pairtype]:
-                            p[coord][pairtype][aa] = self.rtp(self.bpheightdist,
-                                                              info[coord][pairtype] * height[coord][pairtype][aa],
-                                                              self.bpheight_sorted_keys)
-
-                elif features == "singles" or features == "both":
-                    ss_coords.append(coord)
-                    if test == "stacks" or test == "both":
-                        P[coord][pairtype] = self.rtp(self.singleinfodist, info[coord][pairtype],
-                                                      self.ssinfo_sorted_keys)
-                    if test == "letters" or test == "both":
-                        for aa in height[coord][pairtype]:
-                            p[coord][pairtype][aa] = self.rtp(self.singleheightdist,
-                                                              info[coord][pairtype] * height[coord][pairtype][aa],
-                                                              self.ssheight_sorted_keys)
-
-        if test == "stacks" or test == "both":
-            if features == "pairs" or features == "both":
-                bp_coords.sort()
-                for coord in bp_coords:
-                    for pairtype in sorted(P[coord]):
-                        test_bp_stack.append(P[coord][pairtype])
-            if features == "singles" or features == "both":
-                ss_coords.sort()
-                for coord in ss_coords:
-                    for pairtype in sorted(P[coord]):
-                        test_ss_stack.append(P[coord][pairtype])
-
-        if test == "letters" or test == "both":
-            if features == "pairs" or features == "both":
-                for coord in bp_coords:
-                    for pairtype in sorted(p[coord]):
-                        for aa in sorted(p[coord][pairtype]):
-                            test_bp_letter.append(p[coord][pairtype][aa])
-
-            if features == "singles" or features == "both":
-                for coord in ss_coords:
-                    for pairtype in sorted(p[coord]):
-                        for aa in sorted(p[coord][pairtype]):
-                            test_ss_letter.append(p[coord][pairtype][aa])
-
-        test_bpss_results = \
-        smm.multipletests(test_bp_stack + test_ss_stack + test_bp_letter + test_ss_letter, method=correction)[
-            1].tolist()
-
-        if test == "stacks" or test == "both":
-            if features == "pairs" or features == "both":
-                for coord in bp_coords:
-                    for pairtype in sorted(P[coord]):
-                        P_corrected[coord][pairtype] = test_bpss_results.pop(0)
-
-            if features == "singles" or features == "both":
-                for coord in ss_coords:
-                    for pairtype in sorted(P[coord]):
-                        P_corrected[coord][pairtype] = test_bpss_results.pop(0)
-
-        if test == "letters" or test == "both":
-            if features == "pairs" or features == "both":
-                for coord in bp_coords:
-                    for pairtype in sorted(p[coord]):
-                        for aa in sorted(p[coord][pairtype]):
-                            p_corrected[coord][pairtype][aa] = test_bpss_results.pop(0)
-
-            if features == "singles" or features == "both":
-                for coord in ss_coords:
-                    for pairtype in sorted(p[coord]):
-                        for aa in sorted(p[coord][pairtype]):
-                            p_corrected[coord][pairtype][aa] = test_bpss_results.pop(0)
-
+                    info_name, height_name = "bpinfo", "bpheight"
+                elif "," not in str(coord) and (features == "singles" or features == "both"):
+                    info_name, height_name = "singleinfo", "singleheight"
+                else:
+                    continue
+                if test == "stacks" or test == "both":
+                    queries[info_name][0].append((coord, pairtype, None))
+                    queries[info_name][1].append(info[coord][pairtype])
+                if test == "letters" or test == "both":
+                    for aa in height[coord][pairtype]:
+                        queries[height_name][0].append((coord, pairtype, aa))
+                        queries[height_name][1].append(info[coord][pairtype] * height[coord][pairtype][aa])
+
+        table = PValueTable()
+        for name, (keys, points) in queries.items():
+            for (coord, pairtype, aa), value in zip(keys, self.rtp(name, points).tolist()):
+                table.add(coord, pairtype, value, aa)
+        corrected = table.correct(correction)
+
+        P = table.nested(table.p)
+        p = table.nested(table.p, letters=True)
+        P_corrected = table.nested(corrected)
+        p_corrected = table.nested(corrected, letters=True)
         return {'P': P, 'p': p, "P_corrected": P_corrected, "p_corrected": p_corrected}
 
-    def rtp(self, data, point, keys_sorted):
-        if (point > 0):
-            part = 0
-            total = sum(data.values())
-            i = bisect.bisect_left(keys_sorted, point)
-            if (point <= keys_sorted[-1]):
-                for y in keys_sorted[i:]:
-                    part += data[y]
-                return (part + 1) / (total + 1)
-            else:
-                return 1 / (total + 1)
-        else:
-            return 1.0
+    def rtp(self, name, points):
+        """
+        Right tail probabilities of :obj:`points` under distribution
+        :obj:`name`, with a pseudocount added to the tail and the total.
+        Points that are not positive have a probability of one.
+        """
+        points = np.asarray(points, dtype=float)
+        tails = self.tails[name]
+        part = tails[np.searchsorted(self.values[name], points, side="left")]
+        return np.where(points > 0, (part + 1) / (tails[0] + 1), 1.0)
 
 
 class Seq:
@@ -912,6 +912,9 @@ class Seq:
         return len(self.seq)
 
 
+_perm_logo = None
+
+
 class FunctionLogo:
     """
     Parses structural and sequence infomation and provides methods for Function Logo calculations
@@ -925,15 +928,18 @@ class FunctionLogo:
         kind (:obj:`str`): secondary structure notation format.
     """
 
+    #: Number of permutations drawn and evaluated per :meth:`permInfo` task.
+    perm_chunk = 100
+
     def __init__(self, struct_file, kind=None, exact_init=None, inverse_init=None):
-        if exact_init:
-            self.exact = exact_init
+        if exact_init is not None:
+            self.exact = np.asarray(exact_init, dtype=float)
         else:
-            self.exact = []
-        if inverse_init:
-            self.inverse_exact = inverse_init
+            self.exact = np.zeros(0)
+        if inverse_init is not None:
+            self.inverse_exact = np.asarray(inverse_init, dtype=float)
         else:
-            self.inverse_exact = []
+            self.inverse_exact = np.zeros(0)
 
         if kind:
             if kind == "s":
@@ -948,6 +954,7 @@ class FunctionLogo:
         self.pairs = set()
         self.singles = set()
         self.functions = Counter()
+        self._counts = None
 
     def parse_sequences(self, file_prefix):
         """
@@ -1092,561 +1099,250 @@ class FunctionLogo:
         self.basepairs = basepairs
 
     def approx_expect(self, H, k, N):
-        return H - ((k - 1) / ((mt.log(4)) * N))
-
-    def exact_run(self, n, p, numclasses):
-        j = exact.calc_exact(n, p, numclasses)
-        print("{:2} {:07.5f}".format(n, j[1]), file=sys.stderr)
-        return j
-
-    def permuted(self, items, pieces=2):
-        random.seed(int.from_bytes(os.urandom(4), byteorder='little'))
-        sublists = [[] for i in range(pieces)]
-        for x in items:
-            sublists[random.randint(0, pieces - 1)].append(x)
-        permutedList = []
-        for i in range(pieces):
-            time.sleep(0.01)
-            random.seed()
-            random.shuffle(sublists[i])
-            permutedList.extend(sublists[i])
-        return permutedList
-
-    def permutations(self, numPerm, aa_classes):
-        indices = []
-        permStructList = []
-        for p in range(numPerm):
-            indices.append(self.permuted(aa_classes))
-        for index in indices:
-            permStruct = FunctionLogo(self.basepairs, exact_init=self.exact, inverse_init=self.inverse_exact)
-            for i, seqs in enumerate(self.sequences):
-                permStruct.add_sequence(index[i], seqs.seq)
-            permStructList.append(permStruct)
-        return permStructList
-
-    def permute(self, permute_num, proc):
+        return entropy.approx_expect(H, k, N)
+
+    def permutations(self, numPerm, rng):
+        """
+        Permuted functional class labels of the alignment.
+        Args:
+            numPerm (:obj:`int`): Number of permutations.
+            rng (:class:`tsfm.permutation.PermutationGenerator`): random stream.
+        Return:
+            (:class:`numpy.ndarray`): array of shape (numPerm, sequences) of
+            class indices into :attr:`tsfm.counts.AlignmentCounts.classes`,
+            stored with the smallest unsigned integer type that fits.
+        """
+        labels = self.counts.labels.astype(np.min_scalar_type(len(self.counts.classes)))
+        return rng.permutations(labels, numPerm)
+
+    def permute(self, permute_num):
         """
         Creates permuted datasets by shuffling functional annotation labels of sequences.
+        Only the number of permutations and a random stream are stored;
+        :meth:`permInfo` regenerates the class label vectors in blocks of
+        :attr:`perm_chunk` permutations, so memory does not grow with
+        :obj:`permute_num`.
         Args:
             permute_num (:obj:`int`): Number of permutations to perform
-            proc (:obj:`int`): Number of concurrent processes to run
         """
-        with Pool(processes=proc) as pool:
-            perm_jobs = []
-            for x in range(proc):
-                if (x == 0):
-                    perm_jobs.append((permute_num // proc + permute_num % proc, self.get_functions()))
-                else:
-                    perm_jobs.append((permute_num // proc, self.get_functions()))
-
-            perm_results = pool.starmap(self.permutations, perm_jobs)
-            self.permutationList = []
-            for x in perm_results:
-                self.permutationList += x
+        self.permutationNum = permute_num
+        self.permutationGenerator = permutation.spawn(1)[0]
 
     # new bootstrap method for generating bootstrap replicates over functional classes
-    def bootstrap_sample(self, num_boot, seq_dict):
-        random.seed(int.from_bytes(os.urandom(4), byteorder='little'))
+    def bootstrap_sample(self, num_boot, seq_dict, rng):
         bootStructList = []
         for b in range(num_boot):
             bootStruct = FunctionLogo(self.basepairs, exact_init=self.exact, inverse_init=self.inverse_exact)
             for function in seq_dict:
-                bootsample = random.choices(seq_dict[function], k=len(seq_dict[function]))
+                bootsample = rng.resampled(seq_dict[function])
                 for sample in bootsample:
                     bootStruct.add_sequence(sample.function, sample.seq)
             bootStructList.append(bootStruct)
         return bootStructList
 
     def bootstrap(self, bootstrap_num, proc):
-        with Pool(processes=proc) as pool:
-            # build seq dict for bootstrapping
-            boot_sampling_dict = defaultdict(list)
-            for seq in self.sequences:
-                boot_sampling_dict[seq.function].append(seq)
-            boot_jobs = []
-            for x in range(proc):
-                if (x == 0):
-                    boot_jobs.append((bootstrap_num // proc + bootstrap_num % proc, boot_sampling_dict))
-                else:
-                    boot_jobs.append((bootstrap_num // proc, boot_sampling_dict))
+        # build seq dict for bootstrapping
+        boot_sampling_dict = defaultdict(list)
+        for seq in self.sequences:
+            boot_sampling_dict[seq.function].append(seq)
+        boot_jobs = []
+        for x, rng in enumerate(permutation.spawn(proc)):
+            if (x == 0):
+                boot_jobs.append((bootstrap_num // proc + bootstrap_num % proc, boot_sampling_dict, rng))
+            else:
+                boot_jobs.append((bootstrap_num // proc, boot_sampling_dict, rng))
 
-            boot_results = pool.starmap(self.bootstrap_sample, boot_jobs)
-            self.bootstrapList = []
-            for x in boot_results:
-                self.bootstrapList += x
+        boot_results = scheduler.run(self.bootstrap_sample, boot_jobs, proc)
+        self.bootstrapList = []
+        for x in boot_results:
+            self.bootstrapList += x
 
-    def permInfo(self, method, proc, inverse=False):
+    def permInfo(self, method, proc, inverse=False, decimals=None):
         """
         Calculate functional information statistics of permuted datasets.
+        Blocks of permutations are evaluated by the workers and merged into the
+        distribution as histograms as soon as they finish.
         Args:
-            method (:obj:`str`): Entropy estimation method. Either NSB or Miller-Maddow.
+            method (:obj:`str`): Entropy estimation method, e.g. NSB or MM, see :func:`tsfm.entropy.estimator`.
             proc (:obj:`int`): Number of concurrent processes to run.
+            decimals (:obj:`int`): Round information values to this many decimal
+                places, which bounds the number of distinct values held for large
+                numbers of permutations. Default is to keep exact values.
         Return:
         perm_dist (:class:`FunctionLogoDist`): Discrete distribution of
             functional information estimated from permuted datasets.
         """
-        bp_info = []
-        bp_height = []
-        single_info = []
-        single_height = []
-        with Pool(processes=proc) as pool:
-            if (len(self.permutationList) < proc):
-                chunk = 1
-            else:
-                chunk = len(self.permutationList) // proc
-
-            if (not inverse):
-                if (method == "NSB"):
-                    perm_info_results = pool.map(self.perm_info_calc_NSB, self.permutationList, chunk)
-                else:
-                    perm_info_results = pool.map(self.perm_info_calc_MM, self.permutationList, chunk)
-            else:
-                if (method == "NSB"):
-                    perm_info_results = pool.map(self.perm_info_calc_inverse_NSB, self.permutationList, chunk)
-                else:
-                    perm_info_results = pool.map(self.perm_info_calc_inverse_MM, self.permutationList, chunk)
-
-        for perm in perm_info_results:
-            bp_info.extend(perm[0])
-            single_info.extend(perm[1])
-            bp_height.extend(perm[2])
-            single_height.extend(perm[3])
+        perm_jobs = []
+        for start in range(0, self.permutationNum, self.perm_chunk):
+            size = min(self.perm_chunk, self.permutationNum - start)
+            perm_jobs.append((start // self.perm_chunk, size, method, inverse, decimals))
 
         perm_dist = FunctionLogoDist()
-        perm_dist.weighted_dist((bp_info, bp_height), (single_info, single_height))
+        for index, pid, elapsed, (bp_hists, ss_hists) in scheduler.imap(self.perm_info_hist, perm_jobs, proc):
+            perm_dist.add_counts(bp_hists, ss_hists)
+        perm_dist.permutations = self.permutationNum
+        perm_dist.cumulate()
         return perm_dist
 
-    def perm_info_calc_MM(self, x):
-        total_info_bp = []
-        height_info_bp = []
-        total_info_ss = []
-        height_info_ss = []
-        info, height_dict = x.calculate_entropy_MM()
-        for coord in sorted(self.basepairs, key=itemgetter(0)):
-            if (coord in info):
-                for pairtype in sorted(info[coord]):
-                    total_info_bp.append(info[coord][pairtype])
-                    for aainfo in sorted(height_dict[coord][pairtype].items(), key=itemgetter(1), reverse=True):
-                        height_info_bp.append(aainfo[1] * info[coord][pairtype])
-
-        for coord in range(self.pos):
-            if (coord in info):
-                for base in sorted(info[coord]):
-                    total_info_ss.append(info[coord][base])
-                    for aainfo in sorted(height_dict[coord][base].items(), key=itemgetter(1), reverse=True):
-                        height_info_ss.append(aainfo[1] * info[coord][base])
-
-        return (total_info_bp, total_info_ss, height_info_bp, height_info_ss)
-
-    def perm_info_calc_inverse_MM(self, x):
-        total_info_bp = []
-        height_info_bp = []
-        total_info_ss = []
-        height_info_ss = []
-        info, height_dict = x.calculate_entropy_inverse_MM()
-
-        for coord in sorted(self.basepairs, key=itemgetter(0)):
-            if (coord in info):
-                for pairtype in sorted(info[coord]):
-                    total_info_bp.append(info[coord][pairtype])
-                    for aainfo in sorted(height_dict[coord][pairtype].items(), key=itemgetter(1), reverse=True):
-                        height_info_bp.append(aainfo[1] * info[coord][pairtype])
-
-        for coord in range(self.pos):
-            if (coord in info):
-                for base in sorted(info[coord]):
-                    total_info_ss.append(info[coord][base])
-                    for aainfo in sorted(height_dict[coord][base].items(), key=itemgetter(1), reverse=True):
-                        height_info_ss.append(aainfo[1] * info[coord][base])
-
-        return (total_info_bp, total_info_ss, height_info_bp, height_info_ss)
-
-    def perm_info_calc_inverse_NSB(self, x):
-        total_info_bp = []
-        height_info_bp = []
-        total_info_ss = []
-        height_info_ss = []
-        info, height_dict = x.calculate_entropy_inverse_NSB()
-
-        for coord in sorted(self.basepairs, key=itemgetter(0)):
-            if (coord in info):
-                for pairtype in sorted(info[coord]):
-                    total_info_bp.append(info[coord][pairtype])
-                    for aainfo in sorted(height_dict[coord][pairtype].items(), key=itemgetter(1), reverse=True):
-                        height_info_bp.append(aainfo[1] * info[coord][pairtype])
-
-        for coord in range(self.pos):
-            if (coord in info):
-                for base in sorted(info[coord]):
-                    total_info_ss.append(info[coord][base])
-                    for aainfo in sorted(height_dict[coord][base].items(), key=itemgetter(1), reverse=True):
-                        height_info_ss.append(aainfo[1] * info[coord][base])
-
-        return (total_info_bp, total_info_ss, height_info_bp, height_info_ss)
-
-    def perm_info_calc_NSB(self, x):
+    def perm_info_hist(self, index, size, method, inverse=False, decimals=None):
+        """
+        Histograms of functional information for one block of permutations.
+        Args:
+            index (:obj:`int`): Index of the block; selects the child stream of
+                :attr:`permutationGenerator` the block is drawn from.
+            size (:obj:`int`): Number of permutations in the block.
+            method (:obj:`str`): Entropy estimation method, e.g. NSB or MM, see :func:`tsfm.entropy.estimator`.
+            inverse (:obj:`bool`): If true calculate information of anti-determinates.
+            decimals (:obj:`int`): Round information values to this many decimal places.
+        Return:
+            (:obj:`tuple`, :obj:`tuple`): (info, height) histograms of basepair
+            and single-site features, each a pair of distinct values and counts.
+        """
+        labels = self.permutations(size, self.permutationGenerator.child(index))
+        values = self.perm_info_calc(labels, method, inverse)
+        if (decimals is not None):
+            values = [np.round(x, decimals) for x in values]
+        hists = [np.unique(x, return_counts=True) for x in values]
+        return (hists[0], hists[2]), (hists[1], hists[3])
+
+    def perm_info_calc(self, labels, method, inverse=False):
+        """
+        Functional information of permuted datasets.
+        Class counts of each permutation are tabulated from the shared encoded
+        alignment with :meth:`tsfm.counts.AlignmentCounts.tensors`.
+        Args:
+            labels (:class:`numpy.ndarray`): permuted class label vectors, one per row.
+            method (:obj:`str`): Entropy estimation method, e.g. NSB or MM, see :func:`tsfm.entropy.estimator`.
+            inverse (:obj:`bool`): If true calculate information of anti-determinates.
+        Return:
+            (:obj:`tuple` of :class:`numpy.ndarray`): basepair information,
+            single-site information, basepair class heights and single-site
+            class heights of all permutations, with heights weighted by information.
+        """
         total_info_bp = []
         height_info_bp = []
         total_info_ss = []
         height_info_ss = []
-        info, height_dict = x.calculate_entropy_NSB()
-
-        for coord in sorted(self.basepairs, key=itemgetter(0)):
-            if (coord in info):
-                for pairtype in sorted(info[coord]):
-                    total_info_bp.append(info[coord][pairtype])
-                    for aainfo in sorted(height_dict[coord][pairtype].items(), key=itemgetter(1), reverse=True):
-                        height_info_bp.append(aainfo[1] * info[coord][pairtype])
-
-        for coord in range(self.pos):
-            if (coord in info):
-                for base in sorted(info[coord]):
-                    total_info_ss.append(info[coord][base])
-                    for aainfo in sorted(height_dict[coord][base].items(), key=itemgetter(1), reverse=True):
-                        height_info_ss.append(aainfo[1] * info[coord][base])
-
-        return (total_info_bp, total_info_ss, height_info_bp, height_info_ss)
-
-    def calculate_exact(self, n, proc, inverse=False):
+        for row in labels:
+            bp_tables, ss_tables = self.information_tables(method, inverse, self.counts.tensors(row))
+            for tables, total_info, height_info in ((bp_tables, total_info_bp, height_info_bp),
+                                                    (ss_tables, total_info_ss, height_info_ss)):
+                feature_info, feature_height, present = tables
+                total_info.append(feature_info[present])
+                height_info.append((feature_info[..., None] * feature_height)[feature_height > 0])
+
+        return tuple(np.concatenate(values) if values else np.zeros(0)
+                     for values in (total_info_bp, total_info_ss, height_info_bp, height_info_ss))
+
+    def calculate_exact(self, n, inverse=False):
         """
         Exact method of small sample size correction.
         Calculate the exact method of sample size correction for up to N samples.
         Computational intensive portion of the calculation is implemented as a C
         extension. This method is fully described in Schneider et al 1986.
-        This calculation is polynomial in sample size. It becomes prohibitively
-        expensive to calculate beyond a sample size of 16. The correction
-        factor of each sample size will be calculated in parallel up to
-        :obj:`proc` at a time.
+        The expected entropy is summed over per class binomial terms, so the
+        cost grows with the product of sample size and number of classes,
+        rather than with the number of compositions of the sample. The
+        corrections of all sample sizes are calculated in one pass, unless
+        they are found in :data:`tsfm.entropy.exact_cache`, and stored as an
+        array in :attr:`exact` or :attr:`inverse_exact`.
         Args:
             n (:obj:`int`): Calculate correction up to this sample size.
-            proc (:obj:`int`): Number of concurrent processes to run
             inverse (:obj:`bool`): If true calculate sample size correction
                 for anti-determinates.
+        Return:
+            (:class:`numpy.ndarray`): corrections of sample sizes 1 to :obj:`n`.
         """
-        exact_list = []
-        exact_results = []
         if (inverse):
             inverse_functions = Counter()
             for aa_class in self.functions:
                 inverse_functions[aa_class] = sum(self.functions.values()) / self.functions[aa_class]
 
             p = [x / sum(list(inverse_functions.values())) for x in inverse_functions.values()]
-            for i in range(1, n + 1):
-                exact_list.append((i, p, len(self.functions.values())))
-
-            with Pool(processes=proc) as pool:
-                exact_results = pool.starmap(self.exact_run, exact_list)
-
-            for x in exact_results:
-                self.inverse_exact.append(x[1])
         else:
             p = [x / sum(list(self.functions.values())) for x in self.functions.values()]
-            for i in range(1, n + 1):
-                exact_list.append((i, p, len(self.functions.values())))
-
-            with Pool(processes=proc) as pool:
-                exact_results = pool.starmap(self.exact_run, exact_list)
+        corrections = exact_cache.table(n, [p])[0]
+        if (inverse):
+            self.inverse_exact = corrections
+        else:
+            self.exact = corrections
+        return corrections
 
-            for x in exact_results:
-                self.exact.append(x[1])
+    def calculate_entropy(self, method, inverse=False):
+        """
+        Calculate functional information using the entropy estimator
+        :obj:`method`, the name of an estimator registered in
+        :mod:`tsfm.entropy`, e.g. NSB or MM.
+        Args:
+            method (:obj:`str`): Entropy estimation method.
+            inverse (:obj:`bool`): If true calculate information of anti-determinates.
+        """
+        return self.information_dicts(method, inverse)
 
     def calculate_entropy_MM(self):
         """
         Calculate functional information using Miller-Maddow estimator.
         """
-        info = defaultdict(lambda: defaultdict(float))
-        height_dict = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
-
-        functions_array = np.array(list(self.functions.values()))
-        bg_entropy = -np.sum(
-            (functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()) * np.log2(
-                functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()))
-        for pairs in self.basepairs:
-            for state in self.pairs:
-                state_counts = self.get(pairs, state)
-                if (sum(state_counts.values()) == 0):
-                    continue
-
-                nsb_array = np.array(list(state_counts.values()) + [0] * (len(self.functions) - len(state_counts)))
-                fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                    nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-                if (sum(state_counts.values()) <= len(self.exact)):
-                    expected_bg_entropy = self.exact[sum(state_counts.values()) - 1]
-                else:
-                    expected_bg_entropy = self.approx_expect(bg_entropy, len(self.functions),
-                                                             sum(state_counts.values()))
-
-                if (expected_bg_entropy - fg_entropy < 0):
-                    info[pairs][state] = 0
-                else:
-                    info[pairs][state] = expected_bg_entropy - fg_entropy
-
-                height_class = {}
-                for aa_class in state_counts:
-                    height_class[aa_class] = (state_counts[aa_class] / sum(state_counts.values())) / (
-                            self.functions[aa_class] / len(self))
-                for aa_class in height_class:
-                    height_dict[pairs][state][aa_class] = height_class[aa_class] / sum(height_class.values())
-
-        for singles in range(self.pos):
-            for state in self.singles:
-                state_counts = self.get([singles], state)
-                if (sum(state_counts.values()) == 0):
-                    continue
-
-                nsb_array = np.array(list(state_counts.values()) + [0] * (len(self.functions) - len(state_counts)))
-                fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                    nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-                if (sum(state_counts.values()) <= len(self.exact)):
-                    expected_bg_entropy = self.exact[sum(state_counts.values()) - 1]
-                else:
-                    expected_bg_entropy = self.approx_expect(bg_entropy, len(self.functions),
-                                                             sum(state_counts.values()))
-
-                if (expected_bg_entropy - fg_entropy < 0):
-                    info[singles][state] = 0
-                else:
-                    info[singles][state] = expected_bg_entropy - fg_entropy
-
-                height_class = {}
-                for aa_class in state_counts:
-                    height_class[aa_class] = (state_counts[aa_class] / sum(state_counts.values())) / (
-                            self.functions[aa_class] / len(self))
-                for aa_class in height_class:
-                    height_dict[singles][state][aa_class] = height_class[aa_class] / sum(height_class.values())
-
-        return (info, height_dict)
+        return self.calculate_entropy("MM")
 
     def calculate_entropy_inverse_MM(self):
         """
         Calculate functional information for anit-determinates using Miller-Maddow estimator.
         """
-        info_inverse = defaultdict(lambda: defaultdict(float))
-        height_dict_inverse = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
-        inverse_functions = Counter()
-        for aa_class in self.functions:
-            inverse_functions[aa_class] = sum(self.functions.values()) / self.functions[aa_class]
-
-        np_inverse_functions = np.array(list(inverse_functions.values()))
-        bg_entropy = -np.sum((np_inverse_functions[np_inverse_functions != 0] / np_inverse_functions[
-            np_inverse_functions != 0].sum()) * np.log2(
-            np_inverse_functions[np_inverse_functions != 0] / np_inverse_functions[np_inverse_functions != 0].sum()))
-        for pairs in self.basepairs:
-            for state in self.pairs:
-                state_counts = self.get(pairs, state)
-                if (sum(state_counts.values()) == 0):
-                    continue
-                if (not len(state_counts) == len(self.functions)):
-                    for function in self.functions:
-                        state_counts[function] += 1
-
-                inverse_state_counts = Counter()
-                for aa_class in state_counts:
-                    inverse_state_counts[aa_class] = sum(state_counts.values()) / state_counts[aa_class]
-
-                nsb_array = np.array(list(inverse_state_counts.values()))
-                fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                    nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-                if (sum(state_counts.values()) <= len(self.inverse_exact)):
-                    expected_bg_entropy = self.inverse_exact[sum(state_counts.values()) - 1]
-                else:
-                    expected_bg_entropy = self.approx_expect(bg_entropy, len(self.functions),
-                                                             sum(state_counts.values()))
-
-                if (expected_bg_entropy - fg_entropy < 0):
-                    info_inverse[pairs][state] = 0
-                else:
-                    info_inverse[pairs][state] = expected_bg_entropy - fg_entropy
-
-                height_class = {}
-                for aa_class in inverse_state_counts:
-                    height_class[aa_class] = (inverse_state_counts[aa_class] / sum(inverse_state_counts.values())) / (
-                            inverse_functions[aa_class] / sum(inverse_functions.values()))
-                for aa_class in height_class:
-                    height_dict_inverse[pairs][state][aa_class] = height_class[aa_class] / sum(height_class.values())
-
-        for singles in range(self.pos):
-            for state in self.singles:
-                state_counts = self.get([singles], state)
-                if (sum(state_counts.values()) == 0):
-                    continue
-                if (not len(state_counts) == len(self.functions)):
-                    for function in self.functions:
-                        state_counts[function] += 1
-
-                inverse_state_counts = Counter()
-                for aa_class in state_counts:
-                    inverse_state_counts[aa_class] = sum(state_counts.values()) / state_counts[aa_class]
-
-                nsb_array = np.array(list(inverse_state_counts.values()))
-                fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                    nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-                if (sum(state_counts.values()) <= len(self.inverse_exact)):
-                    expected_bg_entropy = self.inverse_exact[sum(state_counts.values()) - 1]
-                else:
-                    expected_bg_entropy = self.approx_expect(bg_entropy, len(self.functions),
-                                                             sum(state_counts.values()))
-
-                if (expected_bg_entropy - fg_entropy < 0):
-                    info_inverse[singles][state] = 0
-                else:
-                    info_inverse[singles][state] = expected_bg_entropy - fg_entropy
-
-                height_class = {}
-                for aa_class in inverse_state_counts:
-                    height_class[aa_class] = (inverse_state_counts[aa_class] / sum(inverse_state_counts.values())) / (
-                            inverse_functions[aa_class] / sum(inverse_functions.values()))
-                for aa_class in height_class:
-                    height_dict_inverse[singles][state][aa_class] = height_class[aa_class] / sum(height_class.values())
-
-        return (info_inverse, height_dict_inverse)
+        return self.calculate_entropy("MM", inverse=True)
 
     def calculate_entropy_inverse_NSB(self):
         """
         Calculate functional information for anit-determinates using NSB estimator.
         """
-        info_inverse = defaultdict(lambda: defaultdict(float))
-        height_dict_inverse = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
-        inverse_functions = Counter()
-        for aa_class in self.functions:
-            inverse_functions[aa_class] = sum(self.functions.values()) / self.functions[aa_class]
-
-        np_inverse_functions = np.array(list(inverse_functions.values()))
-        bg_entropy = -np.sum((np_inverse_functions[np_inverse_functions != 0] / np_inverse_functions[
-            np_inverse_functions != 0].sum()) * np.log2(
-            np_inverse_functions[np_inverse_functions != 0] / np_inverse_functions[np_inverse_functions != 0].sum()))
-        for pairs in self.basepairs:
-            for state in self.pairs:
-                state_counts = self.get(pairs, state)
-                if (sum(state_counts.values()) == 0):
-                    continue
-                if (not len(state_counts) == len(self.functions)):
-                    for function in self.functions:
-                        state_counts[function] += 1
-
-                inverse_state_counts = Counter()
-                for aa_class in state_counts:
-                    inverse_state_counts[aa_class] = sum(state_counts.values()) / state_counts[aa_class]
-
-                nsb_array = np.array(list(inverse_state_counts.values()))
-                if (sum(state_counts.values()) <= len(self.inverse_exact)):
-                    expected_bg_entropy = self.inverse_exact[sum(state_counts.values()) - 1]
-                    fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                        nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-                else:
-                    expected_bg_entropy = bg_entropy
-                    fg_entropy = nb.S(nb.make_nxkx(nsb_array, nsb_array.size), nsb_array.sum(), nsb_array.size)
-
-                if (expected_bg_entropy - fg_entropy < 0):
-                    info_inverse[pairs][state] = 0
-                else:
-                    info_inverse[pairs][state] = expected_bg_entropy - fg_entropy
-
-                height_class = {}
-                for aa_class in inverse_state_counts:
-                    height_class[aa_class] = (inverse_state_counts[aa_class] / sum(inverse_state_counts.values())) / (
-                            inverse_functions[aa_class] / sum(inverse_functions.values()))
-                for aa_class in height_class:
-                    height_dict_inverse[pairs][state][aa_class] = height_class[aa_class] / sum(height_class.values())
-
-        for singles in range(self.pos):
-            for state in self.singles:
-                state_counts = self.get([singles], state)
-                if (sum(state_counts.values()) == 0):
-                    continue
-                if (not len(state_counts) == len(self.functions)):
-                    for function in self.functions:
-                        state_counts[function] += 1
-
-                inverse_state_counts = Counter()
-                for aa_class in state_counts:
-                    inverse_state_counts[aa_class] = sum(state_counts.values()) / state_counts[aa_class]
-
-                nsb_array = np.array(list(inverse_state_counts.values()))
-                if (sum(state_counts.values()) <= len(self.inverse_exact)):
-                    expected_bg_entropy = self.inverse_exact[sum(state_counts.values()) - 1]
-                    fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                        nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-                else:
-                    expected_bg_entropy = bg_entropy
-                    fg_entropy = nb.S(nb.make_nxkx(nsb_array, nsb_array.size), nsb_array.sum(), nsb_array.size)
-
-                if (expected_bg_entropy - fg_entropy < 0):
-                    info_inverse[singles][state] = 0
-                else:
-                    info_inverse[singles][state] = expected_bg_entropy - fg_entropy
-
-                height_class = {}
-                for aa_class in inverse_state_counts:
-                    height_class[aa_class] = (inverse_state_counts[aa_class] / sum(inverse_state_counts.values())) / (
-                            inverse_functions[aa_class] / sum(inverse_functions.values()))
-                for aa_class in height_class:
-                    height_dict_inverse[singles][state][aa_class] = height_class[aa_class] / sum(height_class.values())
-
-        return (info_inverse, height_dict_inverse)
+        return self.calculate_entropy("NSB", inverse=True)
 
     def calculate_entropy_NSB(self):
         """
         Calculate functional information using NSB estimator.
         """
+        return self.calculate_entropy("NSB")
+
+    def information_tables(self, method, inverse=False, tensors=None):
+        """
+        Functional information of all basepair and single-site features as arrays.
+        Args:
+            method (:obj:`str`): Entropy estimation method, e.g. NSB or MM, see :func:`tsfm.entropy.estimator`.
+            inverse (:obj:`bool`): If true calculate information of anti-determinates.
+            tensors (:obj:`tuple` of :class:`numpy.ndarray`): single-site and
+                basepair count tensors to use instead of those of the alignment,
+                as returned by :meth:`tsfm.counts.AlignmentCounts.tensors`.
+        Return:
+            (:obj:`tuple`, :obj:`tuple`): (info, height, present) arrays from
+            :func:`tsfm.entropy.information` for basepair and single-site features.
+        """
+        counts = self.counts
+        if (tensors is None):
+            tensors = (counts.single_counts, counts.pair_counts)
+        background = np.array([self.functions[aa_class] for aa_class in counts.classes])
+        exact_list = self.inverse_exact if inverse else self.exact
+        bp_tables = entropy.information(tensors[1], background, exact_list, method, inverse)
+        ss_tables = entropy.information(tensors[0], background, exact_list, method, inverse)
+        return bp_tables, ss_tables
+
+    def information_dicts(self, method, inverse=False):
+        """
+        Adapts :meth:`information_tables` to the nested :obj:`dict` structures
+        used by :class:`FunctionLogoResults`.
+        """
         info = defaultdict(lambda: defaultdict(float))
         height_dict = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
-
-        functions_array = np.array(list(self.functions.values()))
-        bg_entropy = -np.sum(
-            (functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()) * np.log2(
-                functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()))
-        for pairs in self.basepairs:
-            for state in self.pairs:
-                state_counts = self.get(pairs, state)
-                if (sum(state_counts.values()) == 0):
-                    continue
-                nsb_array = np.array(list(state_counts.values()) + [0] * (len(self.functions) - len(state_counts)))
-                if (sum(state_counts.values()) <= len(self.exact)):
-                    expected_bg_entropy = self.exact[sum(state_counts.values()) - 1]
-                    fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                        nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-                else:
-                    expected_bg_entropy = bg_entropy
-                    fg_entropy = nb.S(nb.make_nxkx(nsb_array, nsb_array.size), nsb_array.sum(), nsb_array.size)
-
-                if (expected_bg_entropy - fg_entropy < 0):
-                    info[pairs][state] = 0
-                else:
-                    info[pairs][state] = expected_bg_entropy - fg_entropy
-
-                height_class = {}
-                for aa_class in state_counts:
-                    height_class[aa_class] = (state_counts[aa_class] / sum(state_counts.values())) / (
-                            self.functions[aa_class] / len(self))
-                for aa_class in height_class:
-                    height_dict[pairs][state][aa_class] = height_class[aa_class] / sum(height_class.values())
-
-        for singles in range(self.pos):
-            for state in self.singles:
-                state_counts = self.get([singles], state)
-                if (sum(state_counts.values()) == 0):
-                    continue
-                nsb_array = np.array(list(state_counts.values()) + [0] * (len(self.functions) - len(state_counts)))
-                if (sum(state_counts.values()) <= len(self.exact)):
-                    expected_bg_entropy = self.exact[sum(state_counts.values()) - 1]
-                    fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                        nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-                else:
-                    expected_bg_entropy = bg_entropy
-                    fg_entropy = nb.S(nb.make_nxkx(nsb_array, nsb_array.size), nsb_array.sum(), nsb_array.size)
-
-                if (expected_bg_entropy - fg_entropy < 0):
-                    info[singles][state] = 0
-                else:
-                    info[singles][state] = expected_bg_entropy - fg_entropy
-
-                height_class = {}
-                for aa_class in state_counts:
-                    height_class[aa_class] = (state_counts[aa_class] / sum(state_counts.values())) / (
-                            self.functions[aa_class] / len(self))
-                for aa_class in height_class:
-                    height_dict[singles][state][aa_class] = height_class[aa_class] / sum(height_class.values())
+        counts = self.counts
+        bp_tables, ss_tables = self.information_tables(method, inverse)
+        for coords, states, tables in ((counts.basepairs, counts.pair_states, bp_tables),
+                                       (range(counts.pos), counts.alphabet, ss_tables)):
+            feature_info, feature_height, present = tables
+            for feature, state in zip(*np.nonzero(present)):
+                coord = coords[feature]
+                info[coord][states[state]] = float(feature_info[feature, state])
+                for aa_class in np.nonzero(feature_height[feature, state])[0]:
+                    height_dict[coord][states[state]][counts.classes[aa_class]] = float(
+                        feature_height[feature, state, aa_class])
 
         return (info, height_dict)
 
@@ -1660,19 +1356,44 @@ class FunctionLogo:
         self.singles.update(seq)
         for x in self.basepairs:
             self.pairs.add(seq[x[0]] + seq[x[1]])
+        self._counts = None
+
+    @property
+    def counts(self):
+        """
+        :class:`tsfm.counts.AlignmentCounts` of the parsed alignment. The
+        count tensors are built on first use and rebuilt after sequences are added.
+        """
+        if (getattr(self, "_counts", None) is None):
+            self._counts = AlignmentCounts(self.sequences, self.basepairs, list(self.functions))
+        return self._counts
+
+    def share(self):
+        """
+        Place the count tensors in shared memory with
+        :meth:`tsfm.counts.AlignmentCounts.share`. Copies of the logo pickled
+        for pool workers then leave out :attr:`sequences` and map the shared
+        tensors instead, so tasks stay small whatever the size of the alignment.
+        """
+        self.counts.share()
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if (state.get("_counts") is not None and state["_counts"]._shared is not None):
+            state["sequences"] = None
+        return state
 
     def get(self, position, state):
-        ret_counter = Counter()
-        if (len(position) == 1):
-            for x in self.sequences:
-                if (x.seq[position[0]] == state[0]):
-                    ret_counter[x.function] += 1
-        if (len(position) == 2):
-            for x in self.sequences:
-                if (x.seq[position[0]] == state[0] and x.seq[position[1]] == state[1]):
-                    ret_counter[x.function] += 1
-
-        return ret_counter
+        """
+        Returns a :class:`collections.Counter` of functional classes of
+        sequences having :obj:`state` at :obj:`position`.
+        Args:
+            position (:obj:`list` of :obj:`int` or :obj:`tuple` of (:obj:`int`, :obj:`int`)):
+                single-site coordinate wrapped in a list, or basepair coordinates.
+            state (:obj:`str`): single-site or basepair state.
+        """
+        return self.counts.get(position, state)
 
     def get_functions(self):
         function_list = []
@@ -1681,6 +1402,8 @@ class FunctionLogo:
         return function_list
 
     def __len__(self):
+        if (self.sequences is None):
+            return len(self.counts)
         return len(self.sequences)
 
 
@@ -1691,12 +1414,16 @@ class FunctionLogoDifference:
         bubble plot visualization.
     """
 
+    #: initial number of permutations drawn per batch by :meth:`adaptive_pvalue`
+    perm_batch = 64
+
     def __init__(self, pos, functions, pairs, basepairs, singles):
         self.pos = pos
         self.pairs = pairs
         self.singles = singles
         self.functions = functions
         self.basepairs = basepairs
+        self.rng = None
 
         #  _______________________ ID logo Calculations ___________________________________________________
 
@@ -2030,7 +1757,15 @@ class FunctionLogoDifference:
 
     def calculate_kld_significance(self, logo_dict, kld_infos, permute_num, proc, pmethod, exceedances, targetperms,
                                    peaks, alpha, features):
-
+        """
+        Test the significance of every KLD between the clades of :obj:`logo_dict`.
+        Tests are grouped by the signature of their permutation null (see
+        :func:`tsfm.permutation.kld_signature`), so that each null is drawn
+        once and shared by all tests of a group and by later clade pairs
+        through :data:`tsfm.permutation.kld_nulls`. Groups are handed to the
+        pool workers as they become free by :func:`tsfm.scheduler.run`, in
+        order of the permutations estimated by :meth:`kld_cost`.
+        """
         pvalue = {}
         CI_lower = {}
         CI_upper = {}
@@ -2042,25 +1777,15 @@ class FunctionLogoDifference:
         gpd_ADtest = {}
         b_freq_table = {}
         f_freq_table = {}
+        gpd_fits = {}
+        results = (pvalue, CI_lower, CI_upper, permnum, ptype, b_freq_table, f_freq_table, gpd_shape, gpd_scale,
+                   gpd_exceedances_size, gpd_ADtest, gpd_fits)
 
-        start_single = 0
-        start_pair = 0
-        end_single = 0
         kld = {}
-
         for key in kld_infos.keys():
             kld[key] = defaultdict(defaultdict)
-            pvalue[key] = defaultdict(lambda: defaultdict(float))
-            CI_lower[key] = defaultdict(lambda: defaultdict(float))
-            CI_upper[key] = defaultdict(lambda: defaultdict(float))
-            permnum[key] = defaultdict(lambda: defaultdict(float))
-            ptype[key] = defaultdict(lambda: defaultdict(float))
-            b_freq_table[key] = defaultdict(lambda: defaultdict(float))
-            f_freq_table[key] = defaultdict(lambda: defaultdict(float))
-            gpd_shape[key] = defaultdict(lambda: defaultdict(float))
-            gpd_scale[key] = defaultdict(lambda: defaultdict(float))
-            gpd_exceedances_size[key] = defaultdict(lambda: defaultdict(float))
-            gpd_ADtest[key] = defaultdict(lambda: defaultdict(float))
+            for result in results:
+                result[key] = defaultdict(lambda: defaultdict(float))
 
             for single in range(self.pos):
                 for state in kld_infos[key][single]:
@@ -2069,133 +1794,88 @@ class FunctionLogoDifference:
                 for basepair in kld_infos[key][pair]:
                     kld[key][pair][basepair] = kld_infos[key][pair][basepair]
 
-        with Pool(processes=proc) as pool:
-            perm_jobs = []
-
-            for x in range(proc):
-                if x == 0:
-                    end_pair = len(self.basepairs) // proc + len(self.basepairs) % proc
-                    end_single = self.pos // proc + self.pos % proc
-                    perm_jobs.append((list(range(start_single, end_single)), permute_num, logo_dict, kld, start_pair,
-                                      end_pair, pmethod, exceedances, targetperms, peaks, alpha,features))
-                else:
-                    start_pair = end_pair
-                    end_pair = start_pair + len(self.basepairs) // proc
-                    start_single = end_single
-                    end_single = end_single + self.pos // proc
-                    perm_jobs.append((list(range(start_single, end_single)), permute_num, logo_dict, kld, start_pair,
-                                      end_pair, pmethod, exceedances, targetperms, peaks, alpha,features))
-
-            significant_calc_outputs = pool.starmap(self.perm_kld_calc_pvalue, perm_jobs, 1)
-
-        for x in significant_calc_outputs:
-            for key in logo_dict.keys():
-                for single in x["pvalue"][key]:
-                    for state in x["pvalue"][key][single]:
-                        pvalue[key][single][state] = x["pvalue"][key][single][state]
-                        CI_lower[key][single][state] = x["CI_lower"][key][single][state]
-                        CI_upper[key][single][state] = x["CI_upper"][key][single][state]
-                        permnum[key][single][state] = x["permnum"][key][single][state]
-                        ptype[key][single][state] = x["ptype"][key][single][state]
-                        b_freq_table[key][single][state] = x["bt"][key][single][state]
-                        f_freq_table[key][single][state] = x["ft"][key][single][state]
-                        gpd_shape[key][single][state] = x["shape"][key][single][state]
-                        gpd_scale[key][single][state] = x["scale"][key][single][state]
-                        gpd_exceedances_size[key][single][state] = x["excnum"][key][single][state]
-                        gpd_ADtest[key][single][state] = x["ADtest"][key][single][state]
-
-        return pvalue, CI_lower, CI_upper, permnum, ptype, b_freq_table, f_freq_table, gpd_shape, gpd_scale, gpd_exceedances_size, gpd_ADtest
-
-    def perm_kld_calc_pvalue(self, positions, permute_num, logo_dic, kld_infos, start_pair, end_pair, pmethod,
-                             exceedances, targetperms, peaks, alpha,features):
-
-        significant_calc_outputs = {}
-        pvalue = {}
-        CI_lower = {}
-        CI_upper = {}
-        permnum = {}
-        ptype = {}
-        gpd_shape = {}
-        gpd_scale = {}
-        gpd_exceedances_size = {}
-        gpd_ADtest = {}
-        b_freq_table = {}
-        f_freq_table = {}
-
-        pairwise_combinations = itertools.permutations(logo_dic.keys(), 2)
-        for pair in pairwise_combinations:
-            pvalue[pair[0]] = defaultdict(defaultdict)
-            CI_lower[pair[0]] = defaultdict(defaultdict)
-            CI_upper[pair[0]] = defaultdict(defaultdict)
-            permnum[pair[0]] = defaultdict(defaultdict)
-            ptype[pair[0]] = defaultdict(defaultdict)
-            b_freq_table[pair[0]] = defaultdict(defaultdict)
-            f_freq_table[pair[0]] = defaultdict(defaultdict)
-            gpd_shape[pair[0]] = defaultdict(defaultdict)
-            gpd_scale[pair[0]] = defaultdict(defaultdict)
-            gpd_exceedances_size[pair[0]] = defaultdict(defaultdict)
-            gpd_ADtest[pair[0]] = defaultdict(defaultdict)
-
+        tests = defaultdict(list)
+        index = 0
+        for pair in itertools.permutations(logo_dict.keys(), 2):
+            coords = []
             if features == "singles" or features == "both":
-                for single in positions:
-                    for state in self.singles:
-                        state_counts_back = logo_dic[pair[0]].get([single], state)
-                        state_counts_fore = logo_dic[pair[1]].get([single], state)
-                        if sum(state_counts_back.values()) == 0 or sum(state_counts_fore.values()) == 0:
-                            continue
-
-                        (
-                            pvalue[pair[0]][single][state],
-                            CI_lower[pair[0]][single][state],
-                            CI_upper[pair[0]][single][state],
-                            permnum[pair[0]][single][state],
-                            ptype[pair[0]][single][state],
-                            b_freq_table[pair[0]][single][state],
-                            f_freq_table[pair[0]][single][state],
-                            gpd_shape[pair[0]][single][state],
-                            gpd_scale[pair[0]][single][state],
-                            gpd_exceedances_size[pair[0]][single][state],
-                            gpd_ADtest[pair[0]][single][state],
-                        ) = self.calc_KLD_pvalue(permute_num, state_counts_back, state_counts_fore,
-                                                 sum(state_counts_back.values()), kld_infos[pair[0]][single][state],
-                                                 pmethod, exceedances, targetperms, peaks, alpha)
-
+                coords.extend(([single], single, sorted(self.singles)) for single in range(self.pos))
             if features == "pairs" or features == "both":
-                for basepair in self.basepairs[start_pair:end_pair]:
-                    for state in kld_infos[pair[0]][basepair]:
-                        state_counts_back = logo_dic[pair[0]].get(basepair, state)
-                        state_counts_fore = logo_dic[pair[1]].get(basepair, state)
-                        if sum(state_counts_back.values()) == 0 or sum(state_counts_fore.values()) == 0:
-                            continue
+                coords.extend((basepair, basepair, sorted(kld_infos[pair[0]][basepair])) for basepair in self.basepairs)
+            for coord, feature, states in coords:
+                for state in states:
+                    state_counts_back = logo_dict[pair[0]].get(coord, state)
+                    state_counts_fore = logo_dict[pair[1]].get(coord, state)
+                    if sum(state_counts_back.values()) == 0 or sum(state_counts_fore.values()) == 0:
+                        continue
+                    signature = permutation.kld_signature(state_counts_back, state_counts_fore, len(self.functions))
+                    tests[signature].append((index, pair[0], feature, state, state_counts_back, state_counts_fore,
+                                             kld[pair[0]][feature][state]))
+                    index += 1
+
+        costs = [sum(self.kld_cost(test[4], test[5], test[6], permute_num, exceedances) for test in group)
+                 for group in tests.values()]
+        perm_jobs = [(group, permute_num, pmethod, exceedances, targetperms, peaks, alpha,
+                      permutation.kld_nulls.null(signature)) for signature, group in tests.items()]
+        significant_calc_outputs = scheduler.run(self.perm_kld_calc_pvalue, perm_jobs, proc, costs,
+                                                 "KLD significance")
+
+        outputs = []
+        for group_outputs, nulls in significant_calc_outputs:
+            permutation.kld_nulls.update(nulls)
+            outputs.extend(group_outputs)
+        outputs.sort(key=lambda output: output[0])
+        intervals = self.gpd_intervals([output[4] for output in outputs], alpha)
+        for (index, key, feature, state, _), values in zip(outputs, intervals):
+            for result, value in zip(results, values):
+                result[key][feature][state] = value
+
+        return results
+
+    def perm_kld_calc_pvalue(self, tests, permute_num, pmethod, exceedances, targetperms, peaks, alpha, null=None):
+        """
+        Calculate the p-values of a group of KLD tests in a pool worker.
+        :obj:`null` is the null of the group held by the parent process,
+        which is merged into the cache of the worker first.
+        Return:
+            (:obj:`list`, :obj:`list`): the (index, clade, feature, state,
+            results) of every test and the :class:`tsfm.permutation.KLDNull` sequences
+            used, to be merged into the cache of the parent process.
+        """
+        if (null is not None):
+            permutation.kld_nulls.update([null])
+        outputs = []
+        nulls = {}
+        for index, key, feature, state, state_counts_back, state_counts_fore, orig_kld in tests:
+            null = self.kld_null(state_counts_back, state_counts_fore)
+            nulls[null.signature] = null
+            outputs.append((index, key, feature, state,
+                            self.calc_KLD_pvalue(permute_num, state_counts_back, state_counts_fore,
+                                                 sum(state_counts_back.values()), orig_kld, pmethod, exceedances,
+                                                 targetperms, peaks, alpha)))
+        return outputs, list(nulls.values())
+
+    def kld_null(self, class_counts_b, class_counts_f):
+        """
+        Return the cached permutation null of a KLD test.
+        """
+        signature = permutation.kld_signature(class_counts_b, class_counts_f, len(self.functions))
+        return permutation.kld_nulls.null(signature)
 
-                        (
-                            pvalue[pair[0]][basepair][state],
-                            CI_lower[pair[0]][basepair][state],
-                            CI_upper[pair[0]][basepair][state],
-                            permnum[pair[0]][basepair][state],
-                            ptype[pair[0]][basepair][state],
-                            b_freq_table[pair[0]][basepair][state],
-                            f_freq_table[pair[0]][basepair][state],
-                            gpd_shape[pair[0]][basepair][state],
-                            gpd_scale[pair[0]][basepair][state],
-                            gpd_exceedances_size[pair[0]][basepair][state],
-                            gpd_ADtest[pair[0]][basepair][state],
-                        ) = self.calc_KLD_pvalue(permute_num, state_counts_back, state_counts_fore,
-                                                 sum(state_counts_back.values()), kld_infos[pair[0]][basepair][state],
-                                                 pmethod, exceedances, targetperms, peaks, alpha)
-
-        significant_calc_outputs["pvalue"] = pvalue
-        significant_calc_outputs["CI_lower"] = CI_lower
-        significant_calc_outputs["CI_upper"] = CI_upper
-        significant_calc_outputs["permnum"] = permnum
-        significant_calc_outputs["ptype"] = ptype
-        significant_calc_outputs["bt"] = b_freq_table
-        significant_calc_outputs["ft"] = f_freq_table
-        significant_calc_outputs["shape"] = gpd_shape
-        significant_calc_outputs["scale"] = gpd_scale
-        significant_calc_outputs["excnum"] = gpd_exceedances_size
-        significant_calc_outputs["ADtest"] = gpd_ADtest
-        return significant_calc_outputs
+    def kld_cost(self, class_counts_b, class_counts_f, orig_kld, maxPerm, exceedances, pilot=256):
+        """
+        Estimate the number of permutations a KLD test will draw from the
+        first :obj:`pilot` values of its cached null, for scheduling. The
+        pilot values are drawn in the parent process and sent to the pool
+        workers with the null, so they are not drawn twice.
+        """
+        null = self.kld_null(class_counts_b, class_counts_f)
+        pilot = min(pilot, maxPerm)
+        null.extend(pilot, maxPerm)
+        count = np.count_nonzero(null.values[:pilot] >= orig_kld)
+        if (count < exceedances):
+            return maxPerm
+        return exceedances * pilot / count
 
     def calc_KLD_pvalue(self, maxPerm, class_counts_b, class_counts_f, back_size, orig_kld, pmethod, exceedances,
                         targetperms, peaks, alpha):
@@ -2211,319 +1891,193 @@ class FunctionLogoDifference:
 
     def calc_permvalues_kld(self, maxPerm, class_counts_b, class_counts_f, back_size):
 
-        aaclasslist = []
-
-        for aaclass in class_counts_b.keys():
-            aaclasslist.extend(aaclass * class_counts_b[aaclass])
-        for aaclass in class_counts_f.keys():
-            aaclasslist.extend(aaclass * class_counts_f[aaclass])
-
-        indices = []
-        permKLDs = []
-        for p in range(maxPerm):
-            indices.append(self.shuffled(aaclasslist))
-        for index in indices:
-            permKLD = 0
-            p_state_counts_back = Counter()
-            p_state_counts_fore = Counter()
-            for i, aaclass in enumerate(index):
-                if i < back_size:
-                    p_state_counts_back[aaclass] += 1
-                else:
-                    p_state_counts_fore[aaclass] += 1
-
-            if len(p_state_counts_back.keys()) < 21 or len(
-                    p_state_counts_fore.keys()) < 21:
-                for t in self.functions:
-                    if t not in p_state_counts_back:
-                        p_state_counts_back[t] = 1
-                    else:
-                        p_state_counts_back[t] += 1
-
-                    if t not in p_state_counts_fore:
-                        p_state_counts_fore[t] = 1
-                    else:
-                        p_state_counts_fore[t] += 1
-
-            for p in self.functions:
-                kld_post_dist_back = p_state_counts_back[p] / (sum(p_state_counts_back.values()))
-                kld_post_dist_fore = p_state_counts_fore[p] / (sum(p_state_counts_fore.values()))
-                permKLD += kld_post_dist_fore * np.log2(
-                    kld_post_dist_fore / kld_post_dist_back)
-
-            permKLDs.append(permKLD)
-        return permKLDs
+        null = self.kld_null(class_counts_b, class_counts_f)
+        null.extend(maxPerm, maxPerm)
+        return null.values[:maxPerm].tolist()
 
     def calc_pecdf_with_pseudo(self, perm_infos, point, class_counts_b, class_counts_f):
         count = sum(i >= point for i in perm_infos)
         P = (count + 1) / (len(perm_infos) + 1)
-
-        b_aaclasstable = ""
-        f_aaclasstable = ""
-        for letter, count in sorted(class_counts_b.items()):
-            b_aaclasstable += letter + str(count)
-        for letter, count in sorted(class_counts_f.items()):
-            f_aaclasstable += letter + str(count)
+        b_aaclasstable, f_aaclasstable = self.class_tables(class_counts_b, class_counts_f)
 
         return P, None, None, len(
-            perm_infos), "p_ecdf_with_pseudo", b_aaclasstable, f_aaclasstable, None, None, None, None
+            perm_infos), "p_ecdf_with_pseudo", b_aaclasstable, f_aaclasstable, None, None, None, None, 0, None
 
     def calc_pecdf_kld(self, maxPerm, class_counts_b, class_counts_f, back_size, orig_kld, exceedances, alpha):
-        b_aaclasstable = ""
-        f_aaclasstable = ""
-        aaclasslist = []
+        return self.adaptive_pvalue(self.kld_draw(class_counts_b, class_counts_f, maxPerm), orig_kld, maxPerm,
+                                    exceedances, alpha, self.class_tables(class_counts_b, class_counts_f))
 
-        for letter, count in sorted(class_counts_b.items()):
-            b_aaclasstable += letter + str(count)
-            aaclasslist.extend(letter * count)
-        for letter, count in sorted(class_counts_f.items()):
-            f_aaclasstable += letter + str(count)
-            aaclasslist.extend(letter * count)
+    def calc_pgpd_ecdf_kld(self, maxPerm, class_counts_b, class_counts_f, back_size, orig_kld, exceedances, targetperms,
+                           peaks, alpha):
+        return self.adaptive_pvalue(self.kld_draw(class_counts_b, class_counts_f, maxPerm), orig_kld, maxPerm,
+                                    exceedances, alpha, self.class_tables(class_counts_b, class_counts_f),
+                                    targetperms, peaks)
 
-        permKLDs = []
-        permcount = 0
+    def kld_draw(self, class_counts_b, class_counts_f, maxPerm):
+        """
+        Return a :meth:`adaptive_pvalue` draw function reading permutation
+        KLDs from the cached null of a test.
+        """
+        null = self.kld_null(class_counts_b, class_counts_f)
 
-        exceedances_count = 0
-        while permcount < maxPerm:
-            permcount = permcount + 1
-            shuffled_aa = self.shuffled(aaclasslist)
-            p_state_counts_back = Counter()
-            p_state_counts_fore = Counter()
-
-            for (i, aaclass) in enumerate(shuffled_aa):
-                if i < back_size:
-                    p_state_counts_back[aaclass] += 1
-                else:
-                    p_state_counts_fore[aaclass] += 1
+        def draw(start, stop):
+            null.extend(stop, maxPerm)
+            return null.values[start:stop]
 
-            if len(p_state_counts_back.keys()) < 21 \
-                    or len(p_state_counts_fore.keys()) < 21:
-                for t in self.functions:
-                    if t not in p_state_counts_back:
-                        p_state_counts_back[t] = 1
-                    else:
-                        p_state_counts_back[t] += 1
+        return draw
 
-                    if t not in p_state_counts_fore:
-                        p_state_counts_fore[t] = 1
-                    else:
-                        p_state_counts_fore[t] += 1
-
-            permKLD = 0
-            for p in self.functions:
-                kld_post_dist_back = p_state_counts_back[p] \
-                                     / sum(p_state_counts_back.values())
-                kld_post_dist_fore = p_state_counts_fore[p] \
-                                     / sum(p_state_counts_fore.values())
-                permKLD += kld_post_dist_fore * np.log2(kld_post_dist_fore
-                                                        / kld_post_dist_back)
-            permKLDs.append(permKLD)
-
-            if permKLD >= orig_kld:
-                exceedances_count = exceedances_count + 1
-
-            if exceedances_count >= exceedances:
-                P = exceedances_count / len(permKLDs)
-                P_CI = [norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(P * (1 - P) / permcount),
-                        norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(P * (1 - P) / permcount)]
-                return P, P_CI[0], P_CI[
-                    1], permcount, "p_ecdf", b_aaclasstable, f_aaclasstable, None, None, None, None
-
-        P = (exceedances_count + 1) / (len(permKLDs) + 1)
-        return P, None, None, permcount, "p_ecdf_with_pseudo", b_aaclasstable, f_aaclasstable, None, None, None, None
-
-    def calc_pgpd_ecdf_kld(self, maxPerm, class_counts_b, class_counts_f, back_size, orig_kld, exceedances, targetperms,
-                           peaks, alpha):
+    def class_tables(self, class_counts_b, class_counts_f):
+        """
+        Return the background and foreground class frequency tables of a
+        test as strings, e.g. ``"A3K2"``.
+        """
         b_aaclasstable = ""
         f_aaclasstable = ""
-        aaclasslist = []
-
         for letter, count in sorted(class_counts_b.items()):
             b_aaclasstable += letter + str(count)
-            aaclasslist.extend(letter * count)
         for letter, count in sorted(class_counts_f.items()):
             f_aaclasstable += letter + str(count)
-            aaclasslist.extend(letter * count)
-
-        permKLDs = []
-        permcount = 0
-
-        exceedances_count = 0
-        while permcount < maxPerm:
-            permcount = permcount + 1
-            shuffled_aa = self.shuffled(aaclasslist)
-            p_state_counts_back = Counter()
-            p_state_counts_fore = Counter()
-
-            for (i, aaclass) in enumerate(shuffled_aa):
-                if i < back_size:
-                    p_state_counts_back[aaclass] += 1
-                else:
-                    p_state_counts_fore[aaclass] += 1
-
-            if len(p_state_counts_back.keys()) < 21 \
-                    or len(p_state_counts_fore.keys()) < 21:
-                for t in self.functions:
-                    if t not in p_state_counts_back:
-                        p_state_counts_back[t] = 1
-                    else:
-                        p_state_counts_back[t] += 1
-
-                    if t not in p_state_counts_fore:
-                        p_state_counts_fore[t] = 1
-                    else:
-                        p_state_counts_fore[t] += 1
-
-            permKLD = 0
-            for p in self.functions:
-                kld_post_dist_back = p_state_counts_back[p] \
-                                     / sum(p_state_counts_back.values())
-                kld_post_dist_fore = p_state_counts_fore[p] \
-                                     / sum(p_state_counts_fore.values())
-                permKLD += kld_post_dist_fore * np.log2(kld_post_dist_fore
-                                                        / kld_post_dist_back)
-            permKLDs.append(permKLD)
-
-            if permKLD >= orig_kld:
-                exceedances_count = exceedances_count + 1
-
-            if exceedances_count == exceedances:
-                P = exceedances_count / permcount
-                P_CI = [norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(P * (1 - P) / permcount),
-                        norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(P * (1 - P) / permcount)]
-                return P, P_CI[0], P_CI[
-                    1], permcount, "p_ecdf", b_aaclasstable, f_aaclasstable, None, None, None, None
-            else:
-
-                if permcount >= targetperms:
-                    E = min(peaks, permcount // 3)
-                    permKLDs_5p = list(map(lambda x: x ** 5, permKLDs))
-                    threshold = (sorted(np.partition(permKLDs_5p, -(E + 1))[-(E + 1):])[0] +
-                                 sorted(np.partition(permKLDs_5p, -(E + 1))[-(E + 1):])[1]) / 2
-                    permKLDs_5p_t = list(map(lambda x: x - threshold, permKLDs_5p))
-                    warnings.filterwarnings("ignore")
-                    fit_gpd = self.check_fit_gpd(np.partition(permKLDs_5p_t, -E)[-E:])
-                    while fit_gpd is not True:
-                        E = E - 10
-                        if E < 10:
-                            break
-                        threshold = (sorted(np.partition(permKLDs_5p, -(E + 1))[-(E + 1):])[0] +
-                                     sorted(np.partition(permKLDs_5p, -(E + 1))[-(E + 1):])[1]) / 2
-                        permKLDs_5p_t = list(map(lambda x: x - threshold, permKLDs_5p))
-                        fit_gpd = self.check_fit_gpd(np.partition(permKLDs_5p_t, -E)[-E:])
-
-                    if fit_gpd is True:
-                        shape, loc, scale = genpareto.fit(np.partition(permKLDs_5p_t, -E)[-E:], floc=0)
-                        gpd_pvalue = (1 - genpareto.cdf((orig_kld ** 5) - threshold, shape, loc, scale)) * E / permcount
-
-                        if gpd_pvalue == 0:
-                            targetperms = min(targetperms * 2, maxPerm)
-                            if permcount == maxPerm:
-                                P = (exceedances_count + 1) / (len(permKLDs) + 1)
-
-                                return P, None, None, permcount, "p_ecdf_with_pseudo (p_gpd=0)", b_aaclasstable, f_aaclasstable, shape, scale, E, ad_test(
-                                    np.partition(permKLDs_5p_t, -E)[-E:],
-                                    genpareto(c=shape, scale=scale, loc=loc)).pvalue
-                            continue
-
-                        P_CI = self.calculate_gpd_CI(alpha, np.partition(permKLDs_5p_t, -E)[-E:], permcount, shape,
-                                                     scale, (orig_kld ** 5) - threshold)
-                        return gpd_pvalue, P_CI[0], P_CI[
-                            1], permcount, "p_gpd", b_aaclasstable, f_aaclasstable, shape, scale, E, ad_test(
-                            np.partition(permKLDs_5p_t, -E)[-E:], genpareto(c=shape, scale=scale, loc=loc)).pvalue
-
-                    else:
-                        targetperms = min(targetperms * 2, maxPerm)
-
-        P = (exceedances_count + 1) / (len(permKLDs) + 1)
-
-        return P, None, None, permcount, "p_ecdf_with_pseudo", b_aaclasstable, f_aaclasstable, None, None, None, None
+        return b_aaclasstable, f_aaclasstable
 
     def calculate_gpd_CI(self, alpha, Zi, permcount, shape, scale, orig_stat):
 
-        MIF = self.calculate_FIM(Zi, shape, scale)
-        INV_MIF = np.linalg.pinv(MIF)
-        u, d, v = np.linalg.svd(INV_MIF, full_matrices=True)
-
-        d1 = d[0]
-        Xi01 = shape - norm.ppf(1 - np.sqrt(alpha) / 2, loc=0, scale=1) * np.sqrt(d1)
-        Xi02 = shape + norm.ppf(1 - np.sqrt(alpha) / 2, loc=0, scale=1) * np.sqrt(d1)
-
-        d2 = d[1]
-        sigma01 = scale - norm.ppf(1 - np.sqrt(alpha) / 2, loc=0, scale=1) * np.sqrt(d2)
-        sigma02 = scale + norm.ppf(1 - np.sqrt(alpha) / 2, loc=0, scale=1) * np.sqrt(d2)
-
-        xi1_sigma1 = np.matmul(v, [Xi01 - shape, sigma01 - scale]) + [shape, scale]
-        xi1 = xi1_sigma1[0]
-        sigma1 = xi1_sigma1[1]
-
-        xi2_sigma2 = np.matmul(v, [Xi02 - shape, sigma02 - scale]) + [shape, scale]
-        xi2 = xi2_sigma2[0]
-        sigma2 = xi2_sigma2[1]
-
-        Pr_CI = [
-            min((1 - genpareto.cdf(orig_stat, xi1, 0, sigma1)),
-                (1 - genpareto.cdf(orig_stat, xi2, 0, sigma1)),
-                (1 - genpareto.cdf(orig_stat, xi2, 0, sigma2)),
-                (1 - genpareto.cdf(orig_stat, xi1, 0, sigma2)))
-            ,
-            max((1 - genpareto.cdf(orig_stat, xi1, 0, sigma1)),
-                (1 - genpareto.cdf(orig_stat, xi2, 0, sigma1)),
-                (1 - genpareto.cdf(orig_stat, xi2, 0, sigma2)),
-                (1 - genpareto.cdf(orig_stat, xi1, 0, sigma2)))
-        ]
-
-        Pnr_CI = [
-            norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(
-                (len(Zi) / permcount) * (1 - len(Zi) / permcount) / permcount),
-            norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(
-                (len(Zi) / permcount) * (1 - len(Zi) / permcount) / permcount)
-        ]
-        CI = [Pr_CI[0] * Pnr_CI[0], Pr_CI[1] * Pnr_CI[1]]
-
-        return CI
+        return gpd.confidence_intervals(alpha, [Zi], [permcount], [shape], [scale], [orig_stat])[0].tolist()
 
     def calculate_FIM(self, Zi, shape, scale):
 
-        MIF11 = (2 / (shape ** 3)) * sum(np.log(1 + shape * (Zi[i] / scale)) for i in range(len(Zi))) - (
-                2 / (shape ** 2)) * sum(Zi[i] / (scale + shape * Zi[i]) for i in range(len(Zi))) - (
-                        1 + (1 / shape)) * sum((Zi[i] / (scale + shape * Zi[i])) ** 2 for i in range(len(Zi)))
+        return gpd.fisher_information([Zi], [shape], [scale])[0]
 
-        MIF22 = (len(Zi) / (shape * (scale ** 2))) - (1 + (1 / shape)) * sum(
-            (1 / (scale + shape * Zi[i])) ** 2 for i in range(len(Zi)))
+    def gpd_intervals(self, outputs, alpha):
+        """
+        Fill in the confidence bounds of all GPD p-values of :obj:`outputs`,
+        result tuples of :meth:`adaptive_pvalue`, with a single call to
+        :func:`tsfm.gpd.confidence_intervals`.
+        Return:
+            (:obj:`list` of :obj:`tuple`): the result tuples without the tail fit.
+        """
+        outputs = [list(output) for output in outputs]
+        fitted = [output for output in outputs if output[12] is not None]
+        if (fitted):
+            samples, permcounts, shapes, scales, stats = zip(*(output[12] for output in fitted))
+            bounds = gpd.confidence_intervals(alpha, samples, permcounts, shapes, scales, stats)
+            for output, (lower, upper) in zip(fitted, bounds.tolist()):
+                output[1], output[2] = lower, upper
+        return [tuple(output[:12]) for output in outputs]
 
-        MIF21_MIF12 = (len(Zi) / ((shape ** 2) * scale)) - (1 / (shape ** 2)) * sum(
-            1 / (scale + shape * Zi[i]) for i in range(len(Zi))) - (1 + (1 / shape)) * sum(
-            Zi[i] / ((scale + shape * Zi[i]) ** 2) for i in range(len(Zi)))
+    def check_fit_gpd(self, sample):
 
-        MIF = np.array([[-MIF11, -MIF21_MIF12], [-MIF21_MIF12, -MIF22]])
-        return MIF
+        return gpd.fit(sample).accepted
 
-    def check_fit_gpd(self, sample):
+    def adaptive_pvalue(self, draw, orig_stat, maxPerm, exceedances, alpha, tables, targetperms=None, peaks=None):
+        """
+        Estimate a permutation p-value with adaptive stopping.
+        Permutation statistics are drawn in batches of doubling size and the
+        exceedance count is checked after every batch, returning the ECDF
+        p-value at the permutation where :obj:`exceedances` is reached. With
+        :obj:`targetperms`, batches also end at the checkpoints where
+        :obj:`targetperms` permutations have been drawn. A GPD is fit to the
+        :obj:`peaks` largest statistics only there, and :obj:`targetperms`
+        doubles if no fit is accepted. Only the largest statistics are kept,
+        in a :class:`tsfm.gpd.TailTracker`. The result does not depend on
+        the batch size.
+        Args:
+            draw (callable): ``draw(start, stop)`` returns the statistics of
+                permutations ``start`` to ``stop - 1``.
+            tables (:obj:`tuple` of :obj:`str`): background and foreground
+                class frequency tables, see :meth:`class_tables`.
+        Return:
+            (:obj:`tuple`): p-value, lower and upper confidence bounds,
+            permutations used, p-value method, frequency tables, GPD shape,
+            scale, number of peaks, Anderson-Darling p-value, number of GPD
+            fits attempted and the tail fit (exceedances, permutations,
+            shape, scale and statistic) of GPD p-values. The confidence
+            bounds of GPD p-values are left to :meth:`gpd_intervals`.
+        """
+        b_aaclasstable, f_aaclasstable = tables
+        permcount = 0
+        exceedances_count = 0
+        fits = 0
+        if (targetperms is not None):
+            tail = gpd.TailTracker(peaks + 1)
+        while permcount < maxPerm:
+            stop = min(permcount + max(self.perm_batch, permcount), maxPerm)
+            if (targetperms is not None and permcount < targetperms):
+                stop = min(stop, targetperms)
+            batch = np.asarray(draw(permcount, stop), dtype=float)
+            cumulative = exceedances_count + np.cumsum(batch >= orig_stat)
+            hit = np.flatnonzero(cumulative >= exceedances)
+            if (hit.size):
+                permcount = permcount + int(hit[0]) + 1
+                P = int(cumulative[hit[0]]) / permcount
+                P_CI = norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(P * (1 - P) / permcount)
+                return P, P_CI, P_CI, permcount, "p_ecdf", b_aaclasstable, f_aaclasstable, None, None, None, None, \
+                       fits, None
+
+            exceedances_count = int(cumulative[-1])
+            permcount = stop
+            if (targetperms is None):
+                continue
+            tail.update(batch)
+            if (permcount < targetperms):
+                continue
+
+            E = min(peaks, permcount // 3)
+            warnings.filterwarnings("ignore")
+            threshold, sample = tail.exceedances(E, power=5)
+            fits += 1
+            fit = gpd.fit(sample)
+            while not fit.accepted:
+                E = E - 10
+                if E < 10:
+                    break
+                threshold, sample = tail.exceedances(E, power=5)
+                fits += 1
+                fit = gpd.fit(sample, start=fit)
+
+            if (not fit.accepted):
+                targetperms = min(targetperms * 2, maxPerm)
+                continue
+
+            shape, scale = fit.shape, fit.scale
+            gpd_pvalue = (1 - genpareto.cdf((orig_stat ** 5) - threshold, shape, 0, scale)) * E / permcount
+            if gpd_pvalue == 0:
+                targetperms = min(targetperms * 2, maxPerm)
+                if permcount == maxPerm:
+                    P = (exceedances_count + 1) / (permcount + 1)
+                    return P, None, None, permcount, "p_ecdf_with_pseudo (p_gpd=0)", b_aaclasstable, f_aaclasstable, \
+                           shape, scale, E, fit.adpvalue, fits, None
+                continue
+
+            return gpd_pvalue, None, None, permcount, "p_gpd", b_aaclasstable, f_aaclasstable, shape, scale, E, \
+                   fit.adpvalue, fits, \
+                   (sample, permcount, shape, scale, (orig_stat ** 5) - threshold)
+
+        P = (exceedances_count + 1) / (permcount + 1)
+        return P, None, None, permcount, "p_ecdf_with_pseudo", b_aaclasstable, f_aaclasstable, None, None, None, \
+               None, fits, None
+
+    def generator(self):
+        """
+        Return the :class:`tsfm.permutation.PermutationGenerator` of this
+        process, spawning one from the root seed if none was assigned.
+        """
+        if (self.rng is None):
+            self.rng = permutation.spawn(1)[0]
+        return self.rng
 
-        shape, loc, scale = genpareto.fit(sample, floc=0)
-        fit = False
-        if ad_test(sample, genpareto(c=shape, scale=scale, loc=loc)).pvalue > 0.05:
-            fit = True
-
-        return fit
-
-    def shuffled(self, items, pieces=2):
-        random.seed(int.from_bytes(os.urandom(4), byteorder='little'))
-        sublists = [[] for i in range(pieces)]
-        for x in items:
-            sublists[random.randint(0, pieces - 1)].append(x)
-        permutedList = []
-        for i in range(pieces):
-            time.sleep(0.01)
-            random.seed()
-            random.shuffle(sublists[i])
-            permutedList.extend(sublists[i])
-        return permutedList
+    def shuffled(self, items):
+        return self.generator().shuffled(items)
 
     def calculate_id_significance(self, logo_dict, id_infos, permute_num, proc, max, entropy, pmethod, exceedances,
                                   targetperms, peaks, alpha,features):
-
+        """
+        Test the significance of every ID between the clades of :obj:`logo_dict`.
+        Each test draws its permutations from its own child stream of a
+        generator spawned from the root seed, so results do not depend on
+        the number of processes. Tests are handed to the pool workers as they
+        become free by :func:`tsfm.scheduler.run`, largest ID times sample
+        size first.
+        """
         pvalue = {}
         CI_lower = {}
         CI_upper = {}
@@ -2535,24 +2089,15 @@ class FunctionLogoDifference:
         gpd_ADtest = {}
         b_freq_table = {}
         f_freq_table = {}
+        gpd_fits = {}
+        results = (pvalue, CI_lower, CI_upper, permnum, ptype, b_freq_table, f_freq_table, gpd_shape, gpd_scale,
+                   gpd_exceedances_size, gpd_ADtest, gpd_fits)
 
-        start_single = 0
-        start_pair = 0
-        end_single = 0
         id = {}
         for key in id_infos.keys():
             id[key] = defaultdict(defaultdict)
-            pvalue[key] = defaultdict(lambda: defaultdict(float))
-            CI_lower[key] = defaultdict(lambda: defaultdict(float))
-            CI_upper[key] = defaultdict(lambda: defaultdict(float))
-            permnum[key] = defaultdict(lambda: defaultdict(float))
-            ptype[key] = defaultdict(lambda: defaultdict(float))
-            b_freq_table[key] = defaultdict(lambda: defaultdict(float))
-            f_freq_table[key] = defaultdict(lambda: defaultdict(float))
-            gpd_shape[key] = defaultdict(lambda: defaultdict(float))
-            gpd_scale[key] = defaultdict(lambda: defaultdict(float))
-            gpd_exceedances_size[key] = defaultdict(lambda: defaultdict(float))
-            gpd_ADtest[key] = defaultdict(lambda: defaultdict(float))
+            for result in results:
+                result[key] = defaultdict(lambda: defaultdict(float))
 
             for single in range(self.pos):
                 for state in id_infos[key][single]:
@@ -2560,895 +2105,177 @@ class FunctionLogoDifference:
             for pair in self.basepairs:
                 for basepair in id_infos[key][pair]:
                     id[key][pair][basepair] = id_infos[key][pair][basepair]
-        with Pool(processes=proc) as pool:
-            perm_jobs = []
-
-            for x in range(proc):
-                if x == 0:
-                    end_pair = len(self.basepairs) // proc + len(self.basepairs) % proc
-                    end_single = self.pos // proc + self.pos % proc
-                    perm_jobs.append(
-                        (list(range(start_single, end_single)), permute_num, logo_dict, id, start_pair, end_pair, max,
-                         entropy, pmethod, exceedances, targetperms, peaks, alpha,features))
-                else:
-                    start_pair = end_pair
-                    end_pair = start_pair + len(self.basepairs) // proc
-                    start_single = end_single
-                    end_single = end_single + self.pos // proc
-                    perm_jobs.append(
-                        (list(range(start_single, end_single)), permute_num, logo_dict, id, start_pair, end_pair, max,
-                         entropy, pmethod, exceedances, targetperms, peaks, alpha,features))
-            significant_calc_outputs = pool.starmap(self.cal_perm_id_pvalue, perm_jobs, 1)
-
-        for x in significant_calc_outputs:
-            for key in logo_dict.keys():
-                for single in x["pvalue"][key]:
-                    for state in x["pvalue"][key][single]:
-                        pvalue[key][single][state] = x["pvalue"][key][single][state]
-                        CI_lower[key][single][state] = x["CI_lower"][key][single][state]
-                        CI_upper[key][single][state] = x["CI_upper"][key][single][state]
-                        permnum[key][single][state] = x["permnum"][key][single][state]
-                        ptype[key][single][state] = x["ptype"][key][single][state]
-                        b_freq_table[key][single][state] = x["bt"][key][single][state]
-                        f_freq_table[key][single][state] = x["ft"][key][single][state]
-                        gpd_shape[key][single][state] = x["shape"][key][single][state]
-                        gpd_scale[key][single][state] = x["scale"][key][single][state]
-                        gpd_exceedances_size[key][single][state] = x["excnum"][key][single][state]
-                        gpd_ADtest[key][single][state] = x["ADtest"][key][single][state]
-
-        return pvalue, CI_lower, CI_upper, permnum, ptype, b_freq_table, f_freq_table, gpd_shape, gpd_scale, gpd_exceedances_size, gpd_ADtest
-
-    def cal_perm_id_pvalue(self, positions, permute_num, logo_dic, id_infos, start_pair, end_pair, max, entropy,
-                           pmethod, exceedances, targetperms, peaks, alpha,features):
-
-        significant_calc_outputs = {}
-        pvalue = {}
-        CI_lower = {}
-        CI_upper = {}
-        permnum = {}
-        ptype = {}
-        gpd_shape = {}
-        gpd_scale = {}
-        gpd_exceedances_size = {}
-        gpd_ADtest = {}
-        b_freq_table = {}
-        f_freq_table = {}
-        pairwise_combinations = itertools.permutations(logo_dic.keys(), 2)
-        for pair in pairwise_combinations:
-            pvalue[pair[0]] = defaultdict(defaultdict)
-            CI_lower[pair[0]] = defaultdict(defaultdict)
-            CI_upper[pair[0]] = defaultdict(defaultdict)
-            permnum[pair[0]] = defaultdict(defaultdict)
-            ptype[pair[0]] = defaultdict(defaultdict)
-            b_freq_table[pair[0]] = defaultdict(defaultdict)
-            f_freq_table[pair[0]] = defaultdict(defaultdict)
-            gpd_shape[pair[0]] = defaultdict(defaultdict)
-            gpd_scale[pair[0]] = defaultdict(defaultdict)
-            gpd_exceedances_size[pair[0]] = defaultdict(defaultdict)
-            gpd_ADtest[pair[0]] = defaultdict(defaultdict)
 
+        generator = permutation.spawn(1)[0]
+        tests = []
+        perm_jobs = []
+        for pair in itertools.permutations(logo_dict.keys(), 2):
+            coords = []
             if features == "singles" or features == "both":
-                for single in positions:
-                    for state in self.singles:
-                        state_counts_back = logo_dic[pair[0]].get([single], state)
-                        state_counts_fore = logo_dic[pair[1]].get([single], state)
-                        if (sum(state_counts_back.values()) == 0) or (sum(state_counts_fore.values()) == 0):
-                            continue
-
-                        if entropy == "NSB":
-                            (
-                                pvalue[pair[0]][single][state],
-                                CI_lower[pair[0]][single][state],
-                                CI_upper[pair[0]][single][state],
-                                permnum[pair[0]][single][state],
-                                ptype[pair[0]][single][state],
-                                b_freq_table[pair[0]][single][state],
-                                f_freq_table[pair[0]][single][state],
-                                gpd_shape[pair[0]][single][state],
-                                gpd_scale[pair[0]][single][state],
-                                gpd_exceedances_size[pair[0]][single][state],
-                                gpd_ADtest[pair[0]][single][state],
-                            ) = self.calc_ID_pvalue_NSB(permute_num, state_counts_back,
-                                                        state_counts_fore,
-                                                        sum(state_counts_back.values()),
-                                                        logo_dic[pair[0]].functions,
-                                                        logo_dic[pair[1]].functions, max,
-                                                        id_infos[pair[0]][single][state], pmethod, exceedances, targetperms,
-                                                        peaks, alpha)
-
-                        if entropy == "MM":
-                            (
-                                pvalue[pair[0]][single][state],
-                                CI_lower[pair[0]][single][state],
-                                CI_upper[pair[0]][single][state],
-                                permnum[pair[0]][single][state],
-                                ptype[pair[0]][single][state],
-                                b_freq_table[pair[0]][single][state],
-                                f_freq_table[pair[0]][single][state],
-                                gpd_shape[pair[0]][single][state],
-                                gpd_scale[pair[0]][single][state],
-                                gpd_exceedances_size[pair[0]][single][state],
-                                gpd_ADtest[pair[0]][single][state],
-                            ) = self.calc_ID_pvalue_MM(permute_num, state_counts_back,
-                                                       state_counts_fore,
-                                                       sum(state_counts_back.values()),
-                                                       logo_dic[pair[0]].functions,
-                                                       logo_dic[pair[1]].functions, max,
-                                                       id_infos[pair[0]][single][state], pmethod, exceedances, targetperms,
-                                                       peaks, alpha)
-
+                coords.extend(([single], single, sorted(self.singles)) for single in range(self.pos))
             if features == "pairs" or features == "both":
-                for basepair in self.basepairs[start_pair:end_pair]:
-                    for state in id_infos[pair[0]][basepair]:
-                        state_counts_back = logo_dic[pair[0]].get(basepair, state)
-                        state_counts_fore = logo_dic[pair[1]].get(basepair, state)
-                        if (sum(state_counts_back.values()) == 0) or (sum(state_counts_fore.values()) == 0):
-                            continue
-
-                        if entropy == "NSB":
-                            (
-                                pvalue[pair[0]][basepair][state],
-                                CI_lower[pair[0]][basepair][state],
-                                CI_upper[pair[0]][basepair][state],
-                                permnum[pair[0]][basepair][state],
-                                ptype[pair[0]][basepair][state],
-                                b_freq_table[pair[0]][basepair][state],
-                                f_freq_table[pair[0]][basepair][state],
-                                gpd_shape[pair[0]][basepair][state],
-                                gpd_scale[pair[0]][basepair][state],
-                                gpd_exceedances_size[pair[0]][basepair][state],
-                                gpd_ADtest[pair[0]][basepair][state],
-                            ) = self.calc_ID_pvalue_NSB(permute_num, state_counts_back,
-                                                        state_counts_fore,
-                                                        sum(state_counts_back.values()),
-                                                        logo_dic[pair[0]].functions,
-                                                        logo_dic[pair[1]].functions, max,
-                                                        id_infos[pair[0]][basepair][state], pmethod, exceedances,
-                                                        targetperms, peaks, alpha)
-
-                        if entropy == "MM":
-                            (
-                                pvalue[pair[0]][basepair][state],
-                                CI_lower[pair[0]][basepair][state],
-                                CI_upper[pair[0]][basepair][state],
-                                permnum[pair[0]][basepair][state],
-                                ptype[pair[0]][basepair][state],
-                                b_freq_table[pair[0]][basepair][state],
-                                f_freq_table[pair[0]][basepair][state],
-                                gpd_shape[pair[0]][basepair][state],
-                                gpd_scale[pair[0]][basepair][state],
-                                gpd_exceedances_size[pair[0]][basepair][state],
-                                gpd_ADtest[pair[0]][basepair][state],
-                            ) = self.calc_ID_pvalue_MM(permute_num, state_counts_back,
-                                                       state_counts_fore,
-                                                       sum(state_counts_back.values()),
-                                                       logo_dic[pair[0]].functions,
-                                                       logo_dic[pair[1]].functions, max,
-                                                       id_infos[pair[0]][basepair][state], pmethod, exceedances,
-                                                       targetperms, peaks, alpha)
-
-        significant_calc_outputs["pvalue"] = pvalue
-        significant_calc_outputs["CI_lower"] = CI_lower
-        significant_calc_outputs["CI_upper"] = CI_upper
-        significant_calc_outputs["permnum"] = permnum
-        significant_calc_outputs["ptype"] = ptype
-        significant_calc_outputs["bt"] = b_freq_table
-        significant_calc_outputs["ft"] = f_freq_table
-        significant_calc_outputs["shape"] = gpd_shape
-        significant_calc_outputs["scale"] = gpd_scale
-        significant_calc_outputs["excnum"] = gpd_exceedances_size
-        significant_calc_outputs["ADtest"] = gpd_ADtest
-        return significant_calc_outputs
-
-    def calc_ID_pvalue_NSB(self, maxPerm, class_counts_b, class_counts_f, back_size, b_functions, f_functions,
-                           max, orig_id, pmethod, exceedances, targetperms, peaks, alpha):
-
-        if orig_id == 0:
-            return 1, None, None, None, None, None, None, None, None, None, None
-        if pmethod == "ECDF_pseudo":
-            perm_id_nsb_values = self.calc_permvalues_id_nsb(maxPerm, class_counts_b, class_counts_f, back_size,
-                                                             b_functions, f_functions, max)
-            return self.calc_pecdf_with_pseudo(perm_id_nsb_values, orig_id, class_counts_b, class_counts_f)
-        if pmethod == "ECDF":
-            return self.calc_pecdf_id_nsb(maxPerm, class_counts_b, class_counts_f, back_size, b_functions, f_functions,
-                                          max, orig_id, exceedances, alpha)
-        if pmethod == "GPD":
-            return self.calc_pgpd_ecdf_id_nsb(maxPerm, class_counts_b, class_counts_f, back_size, b_functions,
-                                              f_functions,
-                                              max, orig_id, exceedances, targetperms, peaks, alpha)
-
-    def calc_permvalues_id_nsb(self, numPerm, class_counts_b, class_counts_f, back_size, b_functions, f_functions,
-                               max):
-
-        class_list = []
-        for aaclass in class_counts_b.keys():
-            class_list.extend(aaclass * class_counts_b[aaclass])
-        for aaclass in class_counts_f.keys():
-            class_list.extend(aaclass * class_counts_f[aaclass])
-
-        indices = []
-        permIDs = []
-
-        for p in range(numPerm):
-            indices.append(self.shuffled(class_list))
-        for index in indices:
-            p_state_counts_back = Counter()
-            p_state_counts_fore = Counter()
-            for i, aaclass in enumerate(index):
-                if i < back_size:
-                    p_state_counts_back[aaclass] += 1
-                else:
-                    p_state_counts_fore[aaclass] += 1
-
-            exact = self.calculate_perm_exact(max, f_functions - Counter(class_counts_f) + Counter(p_state_counts_fore))
-            # calculate info for the Foreground _______________________________________________________________________
-            functions_array = np.array(
-                list((f_functions - Counter(class_counts_f) + Counter(p_state_counts_fore)).values()))
-
-            bg_entropy = -np.sum(
-                (functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()) * np.log2(
-                    functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()))
-
-            nsb_array = np.array(
-                list(p_state_counts_fore.values()) + [0] * (len(f_functions) - len(p_state_counts_fore)))
-
-            if sum(p_state_counts_fore.values()) <= len(exact):
-                expected_bg_entropy = exact[sum(p_state_counts_fore.values()) - 1]
-                fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                    nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-            else:
-                expected_bg_entropy = bg_entropy
-                fg_entropy = nb.S(nb.make_nxkx(nsb_array, nsb_array.size), nsb_array.sum(), nsb_array.size)
-
-            if (expected_bg_entropy - fg_entropy) < 0:
-                info_fore = 0
-            else:
-                info_fore = expected_bg_entropy - fg_entropy
-
-            # calculate info for the Background _______________________________________________________________________
-            exact = self.calculate_perm_exact(max, b_functions - Counter(class_counts_b) + Counter(p_state_counts_back))
-            functions_array = np.array(
-                list((b_functions - Counter(class_counts_b) + Counter(p_state_counts_back)).values()))
-            bg_entropy = -np.sum(
-                (functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()) * np.log2(
-                    functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()))
-
-            nsb_array = np.array(
-                list(p_state_counts_back.values()) + [0] * (len(b_functions) - len(p_state_counts_back)))
-            if sum(p_state_counts_back.values()) <= len(exact):
-                expected_bg_entropy = exact[sum(p_state_counts_back.values()) - 1]
-                fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                    nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-            else:
-                expected_bg_entropy = bg_entropy
-                fg_entropy = nb.S(nb.make_nxkx(nsb_array, nsb_array.size), nsb_array.sum(), nsb_array.size)
-
-            if (expected_bg_entropy - fg_entropy) < 0:
-                info_back = 0
-            else:
-                info_back = expected_bg_entropy - fg_entropy
-
-            id_info = info_fore - info_back
-            if id_info < 0:
-                id_info = 0
-            permIDs.append(id_info)
-
-        return permIDs
-
-    def calc_pecdf_id_nsb(self, maxPerm, class_counts_b, class_counts_f, back_size, b_functions, f_functions,
-                          max, orig_id, exceedances, alpha):
-        b_aaclasstable = ""
-        f_aaclasstable = ""
-        aaclasslist = []
-        for letter, count in sorted(class_counts_b.items()):
-            b_aaclasstable += letter + str(count)
-            aaclasslist.extend(letter * count)
-        for letter, count in sorted(class_counts_f.items()):
-            f_aaclasstable += letter + str(count)
-            aaclasslist.extend(letter * count)
-
-        permIDs = []
-        permcount = 0
-
-        exceedances_count = 0
-        while permcount < maxPerm:
-            permcount = permcount + 1
-
-            shuffled_aa = self.shuffled(aaclasslist)
-            p_state_counts_back = Counter()
-            p_state_counts_fore = Counter()
-            for (i, aaclass) in enumerate(shuffled_aa):
-                if i < back_size:
-                    p_state_counts_back[aaclass] += 1
-                else:
-                    p_state_counts_fore[aaclass] += 1
-
-            exact = self.calculate_perm_exact(max, f_functions - Counter(class_counts_f) + Counter(p_state_counts_fore))
-            # calculate info for the Foreground _______________________________________________________________________
-            functions_array = np.array(
-                list((f_functions - Counter(class_counts_f) + Counter(p_state_counts_fore)).values()))
-
-            bg_entropy = -np.sum(
-                (functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()) * np.log2(
-                    functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()))
-
-            nsb_array = np.array(
-                list(p_state_counts_fore.values()) + [0] * (len(f_functions) - len(p_state_counts_fore)))
-
-            if sum(p_state_counts_fore.values()) <= len(exact):
-                expected_bg_entropy = exact[sum(p_state_counts_fore.values()) - 1]
-                fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                    nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-            else:
-                expected_bg_entropy = bg_entropy
-                fg_entropy = nb.S(nb.make_nxkx(nsb_array, nsb_array.size), nsb_array.sum(), nsb_array.size)
-
-            if (expected_bg_entropy - fg_entropy) < 0:
-                info_fore = 0
-            else:
-                info_fore = expected_bg_entropy - fg_entropy
-
-            # calculate info for the Background _______________________________________________________________________
-            exact = self.calculate_perm_exact(max, b_functions - Counter(class_counts_b) + Counter(p_state_counts_back))
-            functions_array = np.array(
-                list((b_functions - Counter(class_counts_b) + Counter(p_state_counts_back)).values()))
-            bg_entropy = -np.sum(
-                (functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()) * np.log2(
-                    functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()))
-
-            nsb_array = np.array(
-                list(p_state_counts_back.values()) + [0] * (len(b_functions) - len(p_state_counts_back)))
-            if sum(p_state_counts_back.values()) <= len(exact):
-                expected_bg_entropy = exact[sum(p_state_counts_back.values()) - 1]
-                fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                    nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-            else:
-                expected_bg_entropy = bg_entropy
-                fg_entropy = nb.S(nb.make_nxkx(nsb_array, nsb_array.size), nsb_array.sum(), nsb_array.size)
-
-            if (expected_bg_entropy - fg_entropy) < 0:
-                info_back = 0
-            else:
-                info_back = expected_bg_entropy - fg_entropy
-
-            id_info = info_fore - info_back
-            if id_info < 0:
-                id_info = 0
-            permIDs.append(id_info)
-
-            if id_info >= orig_id:
-                exceedances_count = exceedances_count + 1
-
-            if exceedances_count >= exceedances:
-                P = exceedances_count / len(permIDs)
-                P_CI = [norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(P * (1 - P) / permcount),
-                        norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(P * (1 - P) / permcount)]
-                return P, P_CI[0], P_CI[
-                    1], permcount, "p_ecdf", b_aaclasstable, f_aaclasstable, None, None, None, None
-
-        P = (exceedances_count + 1) / (len(permIDs) + 1)
-
-        return P, None, None, permcount, "p_ecdf_with_pseudo", b_aaclasstable, f_aaclasstable, None, None, None, None
-
-    def calc_pgpd_ecdf_id_nsb(self, maxPerm, class_counts_b, class_counts_f, back_size, b_functions, f_functions,
-                              max, orig_id, exceedances, targetperms, peaks, alpha):
-        b_aaclasstable = ""
-        f_aaclasstable = ""
-        aaclasslist = []
-        for letter, count in sorted(class_counts_b.items()):
-            b_aaclasstable += letter + str(count)
-            aaclasslist.extend(letter * count)
-        for letter, count in sorted(class_counts_f.items()):
-            f_aaclasstable += letter + str(count)
-            aaclasslist.extend(letter * count)
-
-        permIDs = []
-        permcount = 0
-
-        exceedances_count = 0
-        while permcount < maxPerm:
-            permcount = permcount + 1
-
-            shuffled_aa = self.shuffled(aaclasslist)
-            p_state_counts_back = Counter()
-            p_state_counts_fore = Counter()
-            for (i, aaclass) in enumerate(shuffled_aa):
-                if i < back_size:
-                    p_state_counts_back[aaclass] += 1
-                else:
-                    p_state_counts_fore[aaclass] += 1
-
-            exact = self.calculate_perm_exact(max, f_functions - Counter(class_counts_f) + Counter(p_state_counts_fore))
-            # calculate info for the Foreground _______________________________________________________________________
-            functions_array = np.array(
-                list((f_functions - Counter(class_counts_f) + Counter(p_state_counts_fore)).values()))
-
-            bg_entropy = -np.sum(
-                (functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()) * np.log2(
-                    functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()))
-
-            nsb_array = np.array(
-                list(p_state_counts_fore.values()) + [0] * (len(f_functions) - len(p_state_counts_fore)))
-
-            if sum(p_state_counts_fore.values()) <= len(exact):
-                expected_bg_entropy = exact[sum(p_state_counts_fore.values()) - 1]
-                fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                    nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-            else:
-                expected_bg_entropy = bg_entropy
-                fg_entropy = nb.S(nb.make_nxkx(nsb_array, nsb_array.size), nsb_array.sum(), nsb_array.size)
-
-            if (expected_bg_entropy - fg_entropy) < 0:
-                info_fore = 0
-            else:
-                info_fore = expected_bg_entropy - fg_entropy
-
-            # calculate info for the Background _______________________________________________________________________
-            exact = self.calculate_perm_exact(max, b_functions - Counter(class_counts_b) + Counter(p_state_counts_back))
-            functions_array = np.array(
-                list((b_functions - Counter(class_counts_b) + Counter(p_state_counts_back)).values()))
-            bg_entropy = -np.sum(
-                (functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()) * np.log2(
-                    functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()))
-
-            nsb_array = np.array(
-                list(p_state_counts_back.values()) + [0] * (len(b_functions) - len(p_state_counts_back)))
-            if sum(p_state_counts_back.values()) <= len(exact):
-                expected_bg_entropy = exact[sum(p_state_counts_back.values()) - 1]
-                fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                    nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-            else:
-                expected_bg_entropy = bg_entropy
-                fg_entropy = nb.S(nb.make_nxkx(nsb_array, nsb_array.size), nsb_array.sum(), nsb_array.size)
+                coords.extend((basepair, basepair, sorted(id_infos[pair[0]][basepair])) for basepair in self.basepairs)
+            for coord, feature, states in coords:
+                for state in states:
+                    state_counts_back = logo_dict[pair[0]].get(coord, state)
+                    state_counts_fore = logo_dict[pair[1]].get(coord, state)
+                    if (sum(state_counts_back.values()) == 0) or (sum(state_counts_fore.values()) == 0):
+                        continue
+                    tests.append((pair[0], feature, state))
+                    perm_jobs.append((state_counts_back, state_counts_fore, logo_dict[pair[0]].functions,
+                                      logo_dict[pair[1]].functions, id[pair[0]][feature][state],
+                                      generator.child(len(perm_jobs)), permute_num, max, entropy, pmethod,
+                                      exceedances, targetperms, peaks, alpha))
 
-            if (expected_bg_entropy - fg_entropy) < 0:
-                info_back = 0
-            else:
-                info_back = expected_bg_entropy - fg_entropy
-
-            id_info = info_fore - info_back
-            if id_info < 0:
-                id_info = 0
-            permIDs.append(id_info)
-
-            if id_info >= orig_id:
-                exceedances_count = exceedances_count + 1
-
-            if exceedances_count == exceedances:
-                P = exceedances_count / len(permIDs)
-                P_CI = [norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(P * (1 - P) / permcount),
-                        norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(P * (1 - P) / permcount)]
-                return P, P_CI[0], P_CI[
-                    1], permcount, "p_ecdf", b_aaclasstable, f_aaclasstable, None, None, None, None
-            else:
-                if permcount >= targetperms:
-                    E = min(peaks, permcount // 3)
-                    permIDs_5p = list(map(lambda x: x ** 5, permIDs))
-                    threshold = (sorted(np.partition(permIDs_5p, -(E + 1))[-(E + 1):])[0] +
-                                 sorted(np.partition(permIDs_5p, -(E + 1))[-(E + 1):])[1]) / 2
-                    permIDs_5p_t = list(map(lambda x: x - threshold, permIDs_5p))
-                    warnings.filterwarnings("ignore")
-                    fit_gpd = self.check_fit_gpd(np.partition(permIDs_5p_t, -E)[-E:])
-                    while fit_gpd is not True:
-                        E = E - 10
-                        if E < 10:
-                            break
-                        threshold = (sorted(np.partition(permIDs_5p, -(E + 1))[-(E + 1):])[0] +
-                                     sorted(np.partition(permIDs_5p, -(E + 1))[-(E + 1):])[1]) / 2
-                        permIDs_5p_t = list(map(lambda x: x - threshold, permIDs_5p))
-                        fit_gpd = self.check_fit_gpd(np.partition(permIDs_5p_t, -E)[-E:])
-
-                    if fit_gpd:
-                        shape, loc, scale = genpareto.fit(np.partition(permIDs_5p_t, -E)[-E:], floc=0)
-                        gpd_pvalue = (1 - genpareto.cdf((orig_id ** 5) - threshold, shape, loc, scale)) * E / permcount
-
-                        if gpd_pvalue == 0:
-                            targetperms = min(targetperms * 2, maxPerm)
-                            if permcount == maxPerm:
-                                P = (exceedances_count + 1) / (len(permIDs) + 1)
-
-                                return P, None, None, permcount, "p_ecdf_with_pseudo (p_gpd=0)", b_aaclasstable, f_aaclasstable, shape, scale, E, ad_test(
-                                    np.partition(permIDs_5p_t, -E)[-E:],
-                                    genpareto(c=shape, scale=scale, loc=loc)).pvalue
-                            continue
+        costs = [job[4] * (sum(job[0].values()) + sum(job[1].values())) for job in perm_jobs]
+        significant_calc_outputs = scheduler.run(self.cal_perm_id_pvalue, perm_jobs, proc, costs, "ID significance")
 
-                        P_CI = self.calculate_gpd_CI(alpha, np.partition(permIDs_5p_t, -E)[-E:], permcount, shape,
-                                                     scale, (orig_id ** 5) - threshold)
-                        return gpd_pvalue, P_CI[0], P_CI[
-                            1], permcount, "p_gpd", b_aaclasstable, f_aaclasstable, shape, scale, E, ad_test(
-                            np.partition(permIDs_5p_t, -E)[-E:], genpareto(c=shape, scale=scale, loc=loc)).pvalue
+        for (key, feature, state), values in zip(tests, self.gpd_intervals(significant_calc_outputs, alpha)):
+            for result, value in zip(results, values):
+                result[key][feature][state] = value
 
-                    else:
-                        targetperms = min(targetperms * 2, maxPerm)
+        return results
 
-        P = (exceedances_count + 1) / (len(permIDs) + 1)
+    def cal_perm_id_pvalue(self, state_counts_back, state_counts_fore, b_functions, f_functions, orig_id, rng,
+                           permute_num, max, entropy, pmethod, exceedances, targetperms, peaks, alpha):
 
-        return P, None, None, permcount, "p_ecdf_with_pseudo", b_aaclasstable, f_aaclasstable, None, None, None, None
+        self.rng = rng
+        return self.calc_ID_pvalue(permute_num, state_counts_back, state_counts_fore,
+                                   sum(state_counts_back.values()), b_functions, f_functions, max, orig_id,
+                                   entropy, pmethod, exceedances, targetperms, peaks, alpha)
 
-    def calc_ID_pvalue_MM(self, maxPerm, class_counts_b, class_counts_f, back_size, b_functions, f_functions,
-                          max, orig_id, pmethod, exceedances, targetperms, peaks, alpha):
+    def calc_ID_pvalue(self, maxPerm, class_counts_b, class_counts_f, back_size, b_functions, f_functions,
+                       max, orig_id, entropy, pmethod, exceedances, targetperms, peaks, alpha):
 
         if orig_id == 0:
-            return 1, None, None, None, None, None, None, None, None, None, None
+            return 1, None, None, None, None, None, None, None, None, None, None, None, None
         if pmethod == "ECDF_pseudo":
-            perm_id_mm_values = self.calc_permvalues_id_mm(maxPerm, class_counts_b, class_counts_f, back_size,
-                                                           b_functions, f_functions, max)
-            return self.calc_pecdf_with_pseudo(perm_id_mm_values, orig_id, class_counts_b, class_counts_f)
+            perm_id_values, observed = self.calc_permvalues_id(maxPerm, class_counts_b, class_counts_f, back_size,
+                                                               b_functions, f_functions, max, entropy)
+            return self.calc_pecdf_with_pseudo(perm_id_values, observed, class_counts_b, class_counts_f)
         if pmethod == "ECDF":
-            return self.calc_pecdf_id_mm(maxPerm, class_counts_b, class_counts_f, back_size, b_functions, f_functions,
-                                         max, orig_id, exceedances, alpha)
+            return self.calc_pecdf_id(maxPerm, class_counts_b, class_counts_f, back_size, b_functions, f_functions,
+                                      max, orig_id, entropy, exceedances, alpha)
         if pmethod == "GPD":
-            return self.calc_pgpd_ecdf_id_mm(maxPerm, class_counts_b, class_counts_f, back_size, b_functions,
-                                             f_functions,
-                                             max, orig_id, exceedances, targetperms, peaks, alpha)
+            return self.calc_pgpd_ecdf_id(maxPerm, class_counts_b, class_counts_f, back_size, b_functions,
+                                          f_functions, max, orig_id, entropy, exceedances, targetperms, peaks, alpha)
 
-    def calc_permvalues_id_mm(self, numPerm, class_counts_b, class_counts_f, back_size, b_functions, f_functions,
-                              max):
+    def calc_permvalues_id(self, numPerm, class_counts_b, class_counts_f, back_size, b_functions, f_functions,
+                           max, entropy):
 
+        code, values, observed = self.id_statistic(class_counts_b, class_counts_f, back_size, b_functions,
+                                                   f_functions, max, entropy)
         class_list = []
         for aaclass in class_counts_b.keys():
-            class_list.extend(aaclass * class_counts_b[aaclass])
+            class_list.extend([code[aaclass]] * class_counts_b[aaclass])
         for aaclass in class_counts_f.keys():
-            class_list.extend(aaclass * class_counts_f[aaclass])
-
-        indices = []
-        permIDs = []
-
-        for p in range(numPerm):
-            indices.append(self.shuffled(class_list))
-        for index in indices:
-            p_state_counts_back = Counter()
-            p_state_counts_fore = Counter()
-            for i, aaclass in enumerate(index):
-                if i < back_size:
-                    p_state_counts_back[aaclass] += 1
-                else:
-                    p_state_counts_fore[aaclass] += 1
-
-            exact = self.calculate_perm_exact(max, f_functions - Counter(class_counts_f) + Counter(p_state_counts_fore))
-
-            # calculate the info for the fore ________________________________________________________________________
-            functions_array = np.array(
-                list((f_functions - Counter(class_counts_f) + Counter(p_state_counts_fore)).values()))
-            bg_entropy = -np.sum(
-                (functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()) * np.log2(
-                    functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()))
-
-            nsb_array = np.array(
-                list(p_state_counts_fore.values()) + [0] * (len(f_functions) - len(p_state_counts_fore)))
-            fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-            if sum(p_state_counts_fore.values()) <= len(exact):
-                expected_bg_entropy = exact[sum(p_state_counts_fore.values()) - 1]
-            else:
-                expected_bg_entropy = self.approx_expect(bg_entropy, len(f_functions),
-                                                         sum(p_state_counts_fore.values()))
-
-            if (expected_bg_entropy - fg_entropy) < 0:
-                info_fore = 0
-            else:
-                info_fore = expected_bg_entropy - fg_entropy
-
-            # calculate the info for the back ________________________________________________________________________
-            exact = self.calculate_perm_exact(max, b_functions - Counter(class_counts_b) + Counter(p_state_counts_back))
-            functions_array = np.array(
-                list((b_functions - Counter(class_counts_b) + Counter(p_state_counts_back)).values()))
-            bg_entropy = -np.sum(
-                (functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()) * np.log2(
-                    functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()))
-
-            nsb_array = np.array(
-                list(p_state_counts_back.values()) + [0] * (len(b_functions) - len(p_state_counts_back)))
-            fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-            if sum(p_state_counts_back.values()) <= len(exact):
-                expected_bg_entropy = exact[sum(p_state_counts_back.values()) - 1]
-            else:
-                expected_bg_entropy = self.approx_expect(bg_entropy, len(b_functions),
-                                                         sum(p_state_counts_back.values()))
-
-            if (expected_bg_entropy - fg_entropy) < 0:
-                info_back = 0
-            else:
-                info_back = expected_bg_entropy - fg_entropy
+            class_list.extend([code[aaclass]] * class_counts_f[aaclass])
 
-            id_info = info_fore - info_back
-            if id_info < 0:
-                id_info = 0
-            permIDs.append(id_info)
+        return values(self.generator().permutations(class_list, numPerm)), observed
 
-        return permIDs
-
-    def calc_pecdf_id_mm(self, maxPerm, class_counts_b, class_counts_f, back_size, b_functions, f_functions,
-                         max, orig_id, exceedances, alpha):
-        b_aaclasstable = ""
-        f_aaclasstable = ""
-        aaclasslist = []
-        for letter, count in sorted(class_counts_b.items()):
-            b_aaclasstable += letter + str(count)
-            aaclasslist.extend(letter * count)
-        for letter, count in sorted(class_counts_f.items()):
-            f_aaclasstable += letter + str(count)
-            aaclasslist.extend(letter * count)
+    def calc_pecdf_id(self, maxPerm, class_counts_b, class_counts_f, back_size, b_functions, f_functions,
+                      max, orig_id, entropy, exceedances, alpha):
+        draw, observed = self.id_draw(class_counts_b, class_counts_f, back_size, b_functions, f_functions, max,
+                                      entropy)
+        return self.adaptive_pvalue(draw, observed, maxPerm, exceedances, alpha,
+                                    self.class_tables(class_counts_b, class_counts_f))
 
-        permIDs = []
-        permcount = 0
+    def calc_pgpd_ecdf_id(self, maxPerm, class_counts_b, class_counts_f, back_size, b_functions, f_functions,
+                          max, orig_id, entropy, exceedances, targetperms, peaks, alpha):
+        draw, observed = self.id_draw(class_counts_b, class_counts_f, back_size, b_functions, f_functions, max,
+                                      entropy)
+        return self.adaptive_pvalue(draw, observed, maxPerm, exceedances, alpha,
+                                    self.class_tables(class_counts_b, class_counts_f), targetperms, peaks)
 
-        exceedances_count = 0
-        while permcount < maxPerm:
-            permcount = permcount + 1
-
-            shuffled_aa = self.shuffled(aaclasslist)
-            p_state_counts_back = Counter()
-            p_state_counts_fore = Counter()
-            for (i, aaclass) in enumerate(shuffled_aa):
-                if i < back_size:
-                    p_state_counts_back[aaclass] += 1
-                else:
-                    p_state_counts_fore[aaclass] += 1
-
-            exact = self.calculate_perm_exact(max, f_functions - Counter(class_counts_f) + Counter(p_state_counts_fore))
-
-            # calculate the info for the fore ________________________________________________________________________
-            functions_array = np.array(
-                list((f_functions - Counter(class_counts_f) + Counter(p_state_counts_fore)).values()))
-            bg_entropy = -np.sum(
-                (functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()) * np.log2(
-                    functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()))
-
-            nsb_array = np.array(
-                list(p_state_counts_fore.values()) + [0] * (len(f_functions) - len(p_state_counts_fore)))
-            fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-            if sum(p_state_counts_fore.values()) <= len(exact):
-                expected_bg_entropy = exact[sum(p_state_counts_fore.values()) - 1]
-            else:
-                expected_bg_entropy = self.approx_expect(bg_entropy, len(f_functions),
-                                                         sum(p_state_counts_fore.values()))
-
-            if (expected_bg_entropy - fg_entropy) < 0:
-                info_fore = 0
-            else:
-                info_fore = expected_bg_entropy - fg_entropy
-
-            # calculate the info for the back ________________________________________________________________________
-            exact = self.calculate_perm_exact(max, b_functions - Counter(class_counts_b) + Counter(p_state_counts_back))
-            functions_array = np.array(
-                list((b_functions - Counter(class_counts_b) + Counter(p_state_counts_back)).values()))
-            bg_entropy = -np.sum(
-                (functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()) * np.log2(
-                    functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()))
-
-            nsb_array = np.array(
-                list(p_state_counts_back.values()) + [0] * (len(b_functions) - len(p_state_counts_back)))
-            fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-            if sum(p_state_counts_back.values()) <= len(exact):
-                expected_bg_entropy = exact[sum(p_state_counts_back.values()) - 1]
-            else:
-                expected_bg_entropy = self.approx_expect(bg_entropy, len(b_functions),
-                                                         sum(p_state_counts_back.values()))
-
-            if (expected_bg_entropy - fg_entropy) < 0:
-                info_back = 0
-            else:
-                info_back = expected_bg_entropy - fg_entropy
-
-            id_info = info_fore - info_back
-            if id_info < 0:
-                id_info = 0
-            permIDs.append(id_info)
-
-            if id_info >= orig_id:
-                exceedances_count = exceedances_count + 1
-
-            if exceedances_count >= exceedances:
-                P = exceedances_count / len(permIDs)
-                P_CI = [norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(P * (1 - P) / permcount),
-                        norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(P * (1 - P) / permcount)]
-                return P, P_CI[0], P_CI[
-                    1], permcount, "p_ecdf", b_aaclasstable, f_aaclasstable, None, None, None, None
-
-        P = (exceedances_count + 1) / (len(permIDs) + 1)
-        return P, None, None, permcount, "p_ecdf_with_pseudo", b_aaclasstable, f_aaclasstable, None, None, None, None
-
-    def calc_pgpd_ecdf_id_mm(self, maxPerm, class_counts_b, class_counts_f, back_size, b_functions, f_functions,
-                             max, orig_id, exceedances, targetperms, peaks, alpha):
-        b_aaclasstable = ""
-        f_aaclasstable = ""
+    def id_draw(self, class_counts_b, class_counts_f, back_size, b_functions, f_functions, max, entropy):
+        """
+        Return a :meth:`adaptive_pvalue` draw function computing the
+        information differences of successive permutations of a test from
+        the generator of the test, and the observed information difference.
+        """
+        rng = self.generator()
+        code, values, observed = self.id_statistic(class_counts_b, class_counts_f, back_size, b_functions,
+                                                   f_functions, max, entropy)
         aaclasslist = []
         for letter, count in sorted(class_counts_b.items()):
-            b_aaclasstable += letter + str(count)
-            aaclasslist.extend(letter * count)
+            aaclasslist.extend([code[letter]] * count)
         for letter, count in sorted(class_counts_f.items()):
-            f_aaclasstable += letter + str(count)
-            aaclasslist.extend(letter * count)
-
-        permIDs = []
-        permcount = 0
-
-        exceedances_count = 0
-        while permcount < maxPerm:
-            permcount = permcount + 1
-
-            shuffled_aa = self.shuffled(aaclasslist)
-            p_state_counts_back = Counter()
-            p_state_counts_fore = Counter()
-            for (i, aaclass) in enumerate(shuffled_aa):
-                if i < back_size:
-                    p_state_counts_back[aaclass] += 1
-                else:
-                    p_state_counts_fore[aaclass] += 1
-
-            exact = self.calculate_perm_exact(max, f_functions - Counter(class_counts_f) + Counter(p_state_counts_fore))
-
-            # calculate the info for the fore ________________________________________________________________________
-            functions_array = np.array(
-                list((f_functions - Counter(class_counts_f) + Counter(p_state_counts_fore)).values()))
-            bg_entropy = -np.sum(
-                (functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()) * np.log2(
-                    functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()))
-
-            nsb_array = np.array(
-                list(p_state_counts_fore.values()) + [0] * (len(f_functions) - len(p_state_counts_fore)))
-            fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-            if sum(p_state_counts_fore.values()) <= len(exact):
-                expected_bg_entropy = exact[sum(p_state_counts_fore.values()) - 1]
-            else:
-                expected_bg_entropy = self.approx_expect(bg_entropy, len(f_functions),
-                                                         sum(p_state_counts_fore.values()))
-
-            if (expected_bg_entropy - fg_entropy) < 0:
-                info_fore = 0
-            else:
-                info_fore = expected_bg_entropy - fg_entropy
-
-            # calculate the info for the back ________________________________________________________________________
-            exact = self.calculate_perm_exact(max, b_functions - Counter(class_counts_b) + Counter(p_state_counts_back))
-            functions_array = np.array(
-                list((b_functions - Counter(class_counts_b) + Counter(p_state_counts_back)).values()))
-            bg_entropy = -np.sum(
-                (functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()) * np.log2(
-                    functions_array[functions_array != 0] / functions_array[functions_array != 0].sum()))
-
-            nsb_array = np.array(
-                list(p_state_counts_back.values()) + [0] * (len(b_functions) - len(p_state_counts_back)))
-            fg_entropy = -np.sum((nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()) * np.log2(
-                nsb_array[nsb_array != 0] / nsb_array[nsb_array != 0].sum()))
-            if sum(p_state_counts_back.values()) <= len(exact):
-                expected_bg_entropy = exact[sum(p_state_counts_back.values()) - 1]
-            else:
-                expected_bg_entropy = self.approx_expect(bg_entropy, len(b_functions),
-                                                         sum(p_state_counts_back.values()))
-
-            if (expected_bg_entropy - fg_entropy) < 0:
-                info_back = 0
-            else:
-                info_back = expected_bg_entropy - fg_entropy
-
-            id_info = info_fore - info_back
-            if id_info < 0:
-                id_info = 0
-            permIDs.append(id_info)
-
-            if id_info >= orig_id:
-                exceedances_count = exceedances_count + 1
-
-            if exceedances_count == exceedances:
-                P = exceedances_count / len(permIDs)
-                P_CI = [norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(P * (1 - P) / permcount),
-                        norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(P * (1 - P) / permcount)]
-                return P, P_CI[0], P_CI[
-                    1], permcount, "p_ecdf", b_aaclasstable, f_aaclasstable, None, None, None, None
-            else:
-                if permcount >= targetperms:
-                    E = min(peaks, permcount // 3)
-                    permIDs_5p = list(map(lambda x: x ** 5, permIDs))
-                    threshold = (sorted(np.partition(permIDs_5p, -(E + 1))[-(E + 1):])[0] +
-                                 sorted(np.partition(permIDs_5p, -(E + 1))[-(E + 1):])[1]) / 2
-                    permIDs_5p_t = list(map(lambda x: x - threshold, permIDs_5p))
-                    warnings.filterwarnings("ignore")
-                    fit_gpd = self.check_fit_gpd(np.partition(permIDs_5p_t, -E)[-E:])
-                    while fit_gpd is not True:
-                        E = E - 10
-                        if E < 10:
-                            break
-                        threshold = (sorted(np.partition(permIDs_5p, -(E + 1))[-(E + 1):])[0] +
-                                     sorted(np.partition(permIDs_5p, -(E + 1))[-(E + 1):])[1]) / 2
-                        permIDs_5p_t = list(map(lambda x: x - threshold, permIDs_5p))
-                        fit_gpd = self.check_fit_gpd(np.partition(permIDs_5p_t, -E)[-E:])
-
-                    if fit_gpd:
-                        shape, loc, scale = genpareto.fit(np.partition(permIDs_5p_t, -E)[-E:], floc=0)
-                        gpd_pvalue = (1 - genpareto.cdf((orig_id ** 5) - threshold, shape, loc, scale)) * E / permcount
-
-                        if gpd_pvalue == 0:
-                            targetperms = min(targetperms * 2, maxPerm)
-                            if permcount == maxPerm:
-                                P = (exceedances_count + 1) / (len(permIDs) + 1)
-
-                                return P, None, None, permcount, "p_ecdf_with_pseudo (p_gpd=0)", b_aaclasstable, f_aaclasstable, shape, scale, E, ad_test(
-                                    np.partition(permIDs_5p_t, -E)[-E:],
-                                    genpareto(c=shape, scale=scale, loc=loc)).pvalue
-                            continue
-
-                        P_CI = self.calculate_gpd_CI(alpha, np.partition(permIDs_5p_t, -E)[-E:], permcount, shape,
-                                                     scale, (orig_id ** 5) - threshold)
-                        return gpd_pvalue, P_CI[0], P_CI[
-                            1], permcount, "p_gpd", b_aaclasstable, f_aaclasstable, shape, scale, E, ad_test(
-                            np.partition(permIDs_5p_t, -E)[-E:], genpareto(c=shape, scale=scale, loc=loc)).pvalue
-
-                    else:
-                        targetperms = min(targetperms * 2, maxPerm)
-
-        P = (exceedances_count + 1) / (len(permIDs) + 1)
+            aaclasslist.extend([code[letter]] * count)
 
-        return P, None, None, permcount, "p_ecdf_with_pseudo", b_aaclasstable, f_aaclasstable, None, None, None, None
+        def draw(start, stop):
+            return values(rng.permutations(aaclasslist, stop - start))
 
-    def calculate_perm_exact(self, n, functions):
-        exact_list = []
+        return draw, observed
 
-        p = [x / sum(list(functions.values())) for x in functions.values()]
-        for i in range(1, n + 1):
-            j = exact.calc_exact(i, p, len(functions.values()))
-            exact_list.append(j[1])
-        return exact_list
+    def id_statistic(self, class_counts_b, class_counts_f, back_size, b_functions, f_functions, max, entropy):
+        """
+        Return the code of every functional class of an ID test, a function
+        computing the information differences of the permuted samples in the
+        rows of an array of class codes, the first :obj:`back_size` codes of
+        each row forming the background, and the information difference of
+        the samples themselves. The information of each clade is updated from
+        its fixed class totals by :class:`tsfm.entropy.PermutedInformation`.
+        The observed difference is computed the same way, so that permutations
+        that reproduce the samples tie with it exactly.
+        """
+        classes = sorted(set(b_functions) | set(f_functions) | set(class_counts_b) | set(class_counts_f))
+        code = {aa_class: index for index, aa_class in enumerate(classes)}
+        numclasses = len(classes)
+        pooled = np.zeros(numclasses, dtype=np.intp)
+        for aa_class, count in (Counter(class_counts_b) + Counter(class_counts_f)).items():
+            pooled[code[aa_class]] = count
+
+        sides = []
+        for functions, class_counts, size in ((b_functions, class_counts_b, back_size),
+                                              (f_functions, class_counts_f, sum(class_counts_f.values()))):
+            base = np.zeros(numclasses, dtype=np.intp)
+            for aa_class, count in (functions - Counter(class_counts)).items():
+                base[code[aa_class]] = count
+            sides.append(PermutedInformation(base, pooled, size, max, len(functions), entropy))
+        back, fore = sides
+
+        def differences(counts_back, counts_fore):
+            return np.maximum(fore.info(counts_fore) - back.info(counts_back), 0)
+
+        def values(perms):
+            offsets = np.arange(len(perms))[:, None] * numclasses
+            counts_back = np.bincount((perms[:, :back_size] + offsets).ravel(), minlength=len(perms) * numclasses)
+            counts_fore = np.bincount((perms[:, back_size:] + offsets).ravel(), minlength=len(perms) * numclasses)
+            return differences(counts_back.reshape(-1, numclasses), counts_fore.reshape(-1, numclasses))
+
+        observed = differences(np.array([[class_counts_b.get(aa_class, 0) for aa_class in classes]]),
+                               np.array([[class_counts_f.get(aa_class, 0) for aa_class in classes]]))[0]
+        return code, values, observed
 
     def approx_expect(self, H, k, N):
-        return H - ((k - 1) / ((mt.log(4)) * N))
+        return entropy.approx_expect(H, k, N)
 
     def addstats(self, pvalues, correction, features):
-
+        """
+        Correct KLD or ID p-values for multiple testing. Single-site and
+        basepair features of each clade are corrected as separate families.
+        """
         P_corrected = {}
         for key in pvalues.keys():
-            P_corrected[key] = defaultdict(lambda: defaultdict(float))
-
-            if features == "singles" or features == "both":
-                ss_coords = []
-                for coord in pvalues[key]:
-                    if ("," not in str(coord)):
-                        ss_coords.append(coord)
-
-                test_ss = []
-                ss_coords.sort()
-                for coord in ss_coords:
-                    for state in sorted(pvalues[key][coord]):
-                        test_ss.append(pvalues[key][coord][state])
-
-                test_ss_results = smm.multipletests(test_ss, method=correction)[1].tolist()
-
-                for coord in ss_coords:
-                    for state in sorted(pvalues[key][coord]):
-                        P_corrected[key][coord][state] = test_ss_results.pop(0)
-
-            if features == "pairs" or features == "both":
-                bp_coords = []
-                for coord in pvalues[key]:
-                    if ("," in str(coord)):
-                        bp_coords.append(coord)
-
-                test_bp = []
-                bp_coords.sort()
-
-                for coord in bp_coords:
-                    for state in sorted(pvalues[key][coord]):
-                        test_bp.append(pvalues[key][coord][state])
-
-                test_bp_results = smm.multipletests(test_bp, method=correction)[1].tolist()
-
-                for coord in bp_coords:
-                    for state in sorted(pvalues[key][coord]):
-                        P_corrected[key][coord][state] = test_bp_results.pop(0)
+            table = PValueTable()
+            for coord in pvalues[key]:
+                if ("," in str(coord)):
+                    if (features == "pairs" or features == "both"):
+                        for state in pvalues[key][coord]:
+                            table.add(coord, state, pvalues[key][coord][state], family=1)
+                elif (features == "singles" or features == "both"):
+                    for state in pvalues[key][coord]:
+                        table.add(coord, state, pvalues[key][coord][state], family=0)
+            P_corrected[key] = table.nested(table.correct(correction))
 
         return P_corrected
 
     def write_pvalues(self, P, CI_lower, CI_upper, corrected_P, height, logo_dic, prefix, permnum, ptype, bt, ft, shape,
-                      scale, excnum, ADtest):
+                      scale, excnum, ADtest, fits):
         tableDict = {}
         nameSet = ["Coord", "State", "Statistic", "Sample-Sz-Back", "Sample-Sz-Fore", "P-value", "CI.Lower", "CI.Upper",
                    "Adjusted-P", "Permutations", "P-Val-Method", "GPD-shape", "GPD-scale", "Peaks", "ADtest-P-val",
-                   "Freqs-Back", "Freqs-Fore"]
+                   "Freqs-Back", "Freqs-Fore", "GPD-Fits"]
         for name in nameSet:
             tableDict[name] = np.zeros(self.pos * len(self.singles) + len(self.basepairs) * len(self.pairs), )
 
@@ -3471,7 +2298,7 @@ class FunctionLogoDifference:
             tableDict['Sample-Sz-Fore'] = [sum((logo_dic[key[1]].get([pos], state)).values()) for pos in range(self.pos)
                                            for state in self.singles] + \
                                           [sum((logo_dic[key[1]].get(basepair, state)).values()) for basepair in
-                                           self.basepairs for state in P[key[1]][basepair]]
+                                           self.basepairs for state in P[key[0]][basepair]]
 
             tableDict['P-value'] = [P[key[0]][pos][state] for pos in range(self.pos) for state in self.singles] + \
                                    [P[key[0]][basepair][state] for basepair in self.basepairs for state in
@@ -3526,6 +2353,11 @@ class FunctionLogoDifference:
                                       [ft[key[0]][basepair][state] for basepair in self.basepairs for state in
                                        ft[key[0]][basepair]]
 
+            tableDict['GPD-Fits'] = [fits[key[0]][pos][state] for pos in range(self.pos) for state in
+                                     self.singles] + \
+                                    [fits[key[0]][basepair][state] for basepair in self.basepairs for state in
+                                     fits[key[0]][basepair]]
+
             pandasTable = pd.DataFrame(tableDict)
             filename = prefix + '_' + key[1] + '_' + key[0] + "_stats.txt"
             pandasTable.to_csv(filename, index=None, sep='\t')
@@ -5,7 +5,7 @@ After doi:18637/jss.v009.i02.
 """
 from __future__ import division
 
-from numpy import exp, log, sqrt
+from numpy import asarray, broadcast_arrays, errstate, exp, inf, log, sqrt, where
 from scipy.stats import rv_continuous
 
 from .vect import vectorize
@@ -27,13 +27,31 @@ class ad_unif_gen(rv_continuous):
             if statistic <= log(4) - 1:
                 return 0.
             else:
-                return sqrt(1 - 4 * exp(-1 - statistic))
+                return _single(statistic)
         pinf = ad_unif_inf(statistic)
         return pinf + ad_unif_fix(samples, pinf)
 
 
 ad_unif = ad_unif_gen(a=0, name='ad-unif', shapes='samples')
 
+# The pieces of the approximations below take scalars or arrays, so that the
+# scalar distribution and the array survival function share their constants.
+
+
+def _single(z):
+    return sqrt(1 - 4 * exp(-1 - z))
+
+
+def _inf_low(z):
+    return (exp(-1.2337141 / z) / sqrt(z) *
+            (2.00012 + (.247105 - (.0649821 - (.0347962 -
+             (.011672 - .00168691 * z) * z) * z) * z) * z))
+
+
+def _inf_high(z):
+    return exp(-exp(1.0776 - (2.30695 - (.43424 - (.082433 -
+                   (.008056 - .0003146 * z) * z) * z) * z) * z))
+
 
 def ad_unif_inf(statistic):
     """
@@ -41,12 +59,9 @@ def ad_unif_inf(statistic):
     """
     z = statistic
     if z < 2:
-        return (exp(-1.2337141 / z) / sqrt(z) *
-                                (2.00012 + (.247105 - (.0649821 - (.0347962 -
-                                (.011672 - .00168691 * z) * z) * z) * z) * z))
+        return _inf_low(z)
     else:
-        return exp(-exp(1.0776 - (2.30695 - (.43424 - (.082433 -
-                                (.008056 - .0003146 * z) * z) * z) * z) * z))
+        return _inf_high(z)
 
 
 g1 = lambda x: sqrt(x) * (1 - x) * (49 * x - 102)
@@ -56,15 +71,49 @@ g3 = lambda x: (-130.2137 + (745.2337 - (1705.091 - (1950.646 -
                                 (1116.36 - 255.7844 * x) * x) * x) * x) * x)
 
 
+def _cutoff(n):
+    return .01265 + .1757 / n
+
+
+def _fix_low(n, pinf, c):
+    return (((.0037 / n + .00078) / n + .00006) / n) * g1(pinf / c)
+
+
+def _fix_mid(n, pinf, c):
+    return ((.01365 / n + .04213) / n) * g2((pinf - c) / (.8 - c))
+
+
+def _fix_high(n, pinf):
+    return g3(pinf) / n
+
+
 def ad_unif_fix(samples, pinf):
     """
     Corrects the limiting distribution for a finite sample size.
     """
     n = samples
-    c = .01265 + .1757 / n
+    c = _cutoff(n)
     if pinf < c:
-        return (((.0037 / n + .00078) / n + .00006) / n) * g1(pinf / c)
+        return _fix_low(n, pinf, c)
     elif pinf < .8:
-        return ((.01365 / n + .04213) / n) * g2((pinf - c) / (.8 - c))
+        return _fix_mid(n, pinf, c)
     else:
-        return g3(pinf) / n
+        return _fix_high(n, pinf)
+
+
+def ad_unif_sf(statistic, samples):
+    """
+    Survival function of `ad_unif` evaluated with array operations, for
+    any broadcastable arrays of statistics and sample counts. Equals
+    `ad_unif(samples).sf(statistic)` up to rounding, without the overhead of
+    freezing the distribution and vectorizing `_cdf` per call.
+    """
+    z, n = broadcast_arrays(asarray(statistic, dtype=float), asarray(samples, dtype=float))
+    with errstate(divide='ignore', invalid='ignore', over='ignore'):
+        pinf = where(z < 2, _inf_low(z), _inf_high(z))
+        c = _cutoff(n)
+        fix = where(pinf < c, _fix_low(n, pinf, c),
+                    where(pinf < .8, _fix_mid(n, pinf, c), _fix_high(n, pinf)))
+        single = where(z <= log(4) - 1, 0., _single(z))
+        cdf = where(n == 1, single, pinf + fix)
+    return where(z <= 0, 1., where(z == inf, 0., 1 - cdf))[()]
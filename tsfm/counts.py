@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar count tensors for functionally annotated alignments.
+
+An alignment is encoded once as a :obj:`numpy.uint8` matrix of state indices
+(sequences x columns) together with a vector of functional class indices.
+Class counts of every single-site and basepair feature are then tabulated
+with a single :func:`numpy.bincount` call each, so that looking up the class
+counts of a (feature, state) combination is a constant time operation.
+
+Example::
+
+    counts = AlignmentCounts(logo.sequences, logo.basepairs, list(logo.functions))
+    counts.get([10], "A")       # Counter({'K': 3, 'H': 1})
+    counts.get((1, 71), "GC")   # Counter({'H': 14})
+
+The arrays can be placed in a memory mapped file with
+:meth:`AlignmentCounts.share`, after which pickled copies sent to pool
+workers carry only the path and layout of the file and map it read-only
+when unpickled, so their size does not depend on the size of the alignment.
+"""
+from collections import Counter
+import hashlib
+import os
+import tempfile
+import weakref
+
+import numpy as np
+
+#: arrays of :class:`AlignmentCounts` that are placed in the shared file
+_SHARED = ("matrix", "labels", "_left", "_right", "_single_offsets", "_pair_offsets", "single_counts",
+           "pair_counts")
+
+#: arrays mapped by this process, by path of the shared file
+_mapped = {}
+
+
+def _shared_dir():
+    return "/dev/shm" if (os.path.isdir("/dev/shm")) else tempfile.gettempdir()
+
+
+def _remove(path, owner):
+    if (os.getpid() == owner and os.path.exists(path)):
+        os.remove(path)
+
+
+class AlignmentCounts:
+    """
+    Encoded alignment and class count tensors of its structural features.
+    Args:
+        sequences (:obj:`list` of :class:`tsfm.MolecularInformation.Seq`):
+            aligned sequences labeled with a functional class.
+        basepairs (:obj:`list` of :obj:`tuple` of (:obj:`int`, :obj:`int`)):
+            basepair coordinates.
+        classes (:obj:`list` of :obj:`str`): functional classes defining the
+            order of the class axis. Defaults to the order in which classes
+            first appear in :obj:`sequences`.
+    Attributes:
+        classes (:obj:`list` of :obj:`str`): functional classes in class axis order.
+        alphabet (:obj:`list` of :obj:`str`): single-site states in state axis order.
+        pair_states (:obj:`list` of :obj:`str`): basepair states in pair state axis order.
+        matrix (:class:`numpy.ndarray`): state indices of shape (sequences, columns).
+        labels (:class:`numpy.ndarray`): class index of each sequence.
+        single_counts (:class:`numpy.ndarray`): class counts of shape
+            (columns, states, classes).
+        pair_counts (:class:`numpy.ndarray`): class counts of shape
+            (basepairs, pair states, classes).
+    """
+
+    def __init__(self, sequences, basepairs, classes=None):
+        if classes is None:
+            classes = list(dict.fromkeys(seq.function for seq in sequences))
+        self.classes = list(classes)
+        self.class_index = {aa_class: i for i, aa_class in enumerate(self.classes)}
+        self.basepairs = list(basepairs) if basepairs else []
+        self.basepair_index = {coord: i for i, coord in enumerate(self.basepairs)}
+
+        self.pos = len(sequences[-1]) if sequences else 0
+        raw = np.frombuffer("".join(seq.seq for seq in sequences).encode("ascii"),
+                            dtype=np.uint8).reshape(len(sequences), self.pos)
+        symbols = np.unique(raw)
+        lookup = np.zeros(256, dtype=np.uint8)
+        lookup[symbols] = np.arange(symbols.size, dtype=np.uint8)
+
+        self.alphabet = [chr(symbol) for symbol in symbols]
+        self.state_index = {state: i for i, state in enumerate(self.alphabet)}
+        self.pair_states = [a + b for a in self.alphabet for b in self.alphabet]
+        self.pair_state_index = {state: i for i, state in enumerate(self.pair_states)}
+
+        self.matrix = lookup[raw]
+        self.labels = np.array([self.class_index[seq.function] for seq in sequences], dtype=np.intp)
+        if self.basepairs:
+            self._left, self._right = (np.array(side, dtype=np.intp) for side in zip(*self.basepairs))
+        else:
+            self._left = self._right = np.zeros(0, dtype=np.intp)
+
+        # flat (feature, state) offsets of every sequence, scaled by the number
+        # of classes so that adding a class label vector gives bincount indices
+        ns = len(self.alphabet)
+        nc = len(self.classes)
+        self._single_offsets = (np.arange(self.pos, dtype=np.intp) * ns + self.matrix) * nc
+        pair_state = self.matrix[:, self._left].astype(np.intp) * ns + self.matrix[:, self._right]
+        self._pair_offsets = (np.arange(len(self.basepairs), dtype=np.intp) * ns * ns + pair_state) * nc
+
+        self.single_counts, self.pair_counts = self.tensors(self.labels)
+        self._shared = None
+
+    def digest(self):
+        """
+        Hex digest of the encoded alignment, class labels, classes and
+        basepairs, which identifies the counts in caches kept between runs.
+        """
+        sha = hashlib.sha256()
+        sha.update(repr((self.classes, self.basepairs, self.alphabet, self.matrix.shape)).encode())
+        sha.update(np.ascontiguousarray(self.matrix).tobytes())
+        sha.update(np.ascontiguousarray(self.labels, dtype=np.int64).tobytes())
+        return sha.hexdigest()
+
+    def __len__(self):
+        return self.labels.size
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_finalizer", None)
+        if (self._shared is not None):
+            for name in _SHARED:
+                del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if (self._shared is not None):
+            path, layout = self._shared
+            if (path not in _mapped):
+                _mapped[path] = {name: np.memmap(path, dtype=dtype, mode="r", shape=shape, offset=offset)
+                                 for name, dtype, shape, offset in layout}
+            self.__dict__.update(_mapped[path])
+
+    def share(self):
+        """
+        Write the arrays to a memory mapped file, in shared memory where
+        available, so that pickled copies carry only its path and layout.
+        The file is removed by :meth:`release`, or when this object is
+        garbage collected or the process exits.
+        Return:
+            (:class:`AlignmentCounts`): this object.
+        """
+        if (self._shared is not None):
+            return self
+        layout = []
+        size = 0
+        for name in _SHARED:
+            array = getattr(self, name)
+            size = -(-size // 64) * 64
+            layout.append((name, array.dtype.str, array.shape, size))
+            size += array.nbytes
+        handle, path = tempfile.mkstemp(prefix="tsfm-counts-", dir=_shared_dir())
+        with os.fdopen(handle, "wb") as shared_file:
+            shared_file.truncate(max(size, 1))
+        for name, dtype, shape, offset in layout:
+            if (getattr(self, name).size):
+                mapped = np.memmap(path, dtype=dtype, mode="r+", shape=shape, offset=offset)
+                mapped[...] = getattr(self, name)
+                mapped.flush()
+                del mapped
+        self._shared = (path, layout)
+        self._finalizer = weakref.finalize(self, _remove, path, os.getpid())
+        return self
+
+    def release(self):
+        """
+        Remove the shared file. Workers that have already mapped it keep
+        their mapping.
+        """
+        if (getattr(self, "_finalizer", None) is not None):
+            self._finalizer()
+            _mapped.pop(self._shared[0], None)
+            self._shared = None
+            self._finalizer = None
+
+    def tensors(self, labels):
+        """
+        Tabulate single-site and basepair class counts for a vector of class labels.
+        Args:
+            labels (:class:`numpy.ndarray`): class index of each sequence, in
+                the same order as :attr:`matrix`.
+        Return:
+            (:class:`numpy.ndarray`, :class:`numpy.ndarray`): count tensors of
+            shape (columns, states, classes) and (basepairs, pair states, classes).
+        """
+        labels = np.asarray(labels, dtype=np.intp)[:, None]
+        ns = len(self.alphabet)
+        nc = len(self.classes)
+
+        index = self._single_offsets + labels
+        single = np.bincount(index.ravel(), minlength=self.pos * ns * nc).reshape(self.pos, ns, nc)
+
+        nbp = len(self.basepairs)
+        index = self._pair_offsets + labels
+        pair = np.bincount(index.ravel(), minlength=nbp * ns * ns * nc).reshape(nbp, ns * ns, nc)
+
+        return single, pair
+
+    def counts(self, position, state):
+        """
+        Class counts of a structural feature in a given state.
+        Args:
+            position (:obj:`list` of :obj:`int` or :obj:`tuple` of (:obj:`int`, :obj:`int`)):
+                single-site coordinate wrapped in a list, or basepair coordinates.
+            state (:obj:`str`): single-site or basepair state.
+        Return:
+            (:class:`numpy.ndarray`): counts along the class axis.
+        """
+        if len(position) == 1:
+            if state[0] not in self.state_index or not 0 <= position[0] < self.pos:
+                return np.zeros(len(self.classes), dtype=np.intp)
+            return self.single_counts[position[0], self.state_index[state[0]]]
+
+        if state[0] not in self.state_index or state[1] not in self.state_index:
+            return np.zeros(len(self.classes), dtype=np.intp)
+        coord = tuple(position)
+        if coord in self.basepair_index:
+            return self.pair_counts[self.basepair_index[coord], self.pair_state_index[state]]
+        mask = ((self.matrix[:, coord[0]] == self.state_index[state[0]]) &
+                (self.matrix[:, coord[1]] == self.state_index[state[1]]))
+        return np.bincount(self.labels[mask], minlength=len(self.classes))
+
+    def get(self, position, state):
+        """
+        :class:`collections.Counter` of functional classes for a structural
+        feature in a given state. Classes with zero counts are omitted.
+        """
+        return Counter({self.classes[i]: int(count)
+                        for i, count in enumerate(self.counts(position, state)) if count})
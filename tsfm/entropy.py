@@ -0,0 +1,497 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized functional information kernels.
+
+The kernels operate on class count tensors of shape (features, states,
+classes), such as :attr:`tsfm.counts.AlignmentCounts.single_counts`, and
+compute the information and class heights of every feature state at once.
+Exact small sample corrections are memoized in :data:`exact_cache`.
+
+Sample sizes without an exact correction are handled by an entropy
+:class:`Estimator` looked up by name with :func:`estimator`. New backends are
+added with :func:`register`, and :func:`benchmark` times the backends on the
+same counts.
+"""
+from collections import OrderedDict
+import math as mt
+import sqlite3
+import time
+
+import numpy as np
+
+import tsfm.exact as exact
+import tsfm.nsb_entropy as nb
+import tsfm.scheduler as scheduler
+
+
+def plugin_entropy(counts):
+    """
+    Maximum likelihood entropy in bits along the last axis of :obj:`counts`.
+    Rows without any counts have an entropy of zero.
+    """
+    counts = np.asarray(counts, dtype=float)
+    total = counts.sum(axis=-1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        freqs = counts / total
+        terms = np.where(freqs > 0, -freqs * np.log2(np.where(freqs > 0, freqs, 1)), 0.0)
+    return terms.sum(axis=-1)
+
+
+def nsb_entropy(counts):
+    """
+    NSB entropy in bits of each row of a two dimensional :obj:`counts` array,
+    using the backend selected by :data:`tsfm.nsb_entropy.BACKEND`.
+    """
+    counts = np.asarray(counts)
+    if (nb.BACKEND == "scipy"):
+        return nb.batch_S(counts)
+    K = counts.shape[-1]
+    return np.array([nb.cached_S(nb.make_nxkx(row, K), row.sum(), K) for row in counts], dtype=float)
+
+
+def approx_expect(H, k, N):
+    """
+    Miller-Maddow approximation of the expected entropy of :obj:`N` samples
+    drawn from :obj:`k` classes with entropy :obj:`H`.
+    """
+    return H - ((k - 1) / ((mt.log(4)) * N))
+
+
+class Estimator:
+    """
+    Entropy estimator used for sample sizes without an exact correction.
+
+    The information of a sample is the difference between the entropy its
+    estimate is expected to have under the background, :meth:`expected`, and
+    the estimate from its class counts, :meth:`entropy`. Estimators are
+    registered under their :attr:`name` with :func:`register`, the name
+    selected by ``--entropy``.
+    """
+
+    #: Name of the estimator in the registry.
+    name = None
+    #: Name of the estimator in log messages.
+    description = None
+    #: Whether :meth:`entropy` returns plug-in estimates, which callers that
+    #: already hold them need not recompute.
+    plugin = False
+
+    def entropy(self, counts, numclasses=None):
+        """
+        Entropy in bits of every row of :obj:`counts`, with the class axis last.
+        Args:
+            counts (:class:`numpy.ndarray`): class counts of the samples.
+            numclasses (:obj:`int`): number of classes the samples are drawn
+                from. Default is the length of the class axis.
+        Return:
+            (:class:`numpy.ndarray`): estimates of shape ``counts.shape[:-1]``.
+        """
+        raise NotImplementedError
+
+    def expected(self, bg_entropy, numclasses, sizes):
+        """
+        Expected :meth:`entropy` of samples of :obj:`sizes` drawn from
+        :obj:`numclasses` classes of a background with entropy :obj:`bg_entropy`.
+        Default is the background entropy itself.
+        """
+        return bg_entropy + np.zeros(np.shape(sizes))
+
+
+class PluginEstimator(Estimator):
+    """
+    Maximum likelihood estimator, without correction of its bias.
+    """
+
+    name = "plugin"
+    description = "plug-in"
+    plugin = True
+
+    def entropy(self, counts, numclasses=None):
+        return plugin_entropy(counts)
+
+
+class MillerMadowEstimator(PluginEstimator):
+    """
+    Maximum likelihood estimator, compared against the Miller-Maddow
+    approximation of its expectation, see :func:`approx_expect`.
+    """
+
+    name = "MM"
+    description = "Miller-Maddow"
+
+    def expected(self, bg_entropy, numclasses, sizes):
+        return approx_expect(bg_entropy, numclasses, sizes)
+
+
+class NSBEstimator(Estimator):
+    """
+    Nemenman-Shafee-Bialek estimator, using the backend selected by
+    :data:`tsfm.nsb_entropy.BACKEND`. Estimates of samples drawn from more
+    classes than the class axis holds are taken row by row from
+    :func:`tsfm.nsb_entropy.cached_S`.
+    """
+
+    name = "NSB"
+    description = "NSB"
+
+    def entropy(self, counts, numclasses=None):
+        counts = np.asarray(counts)
+        if (numclasses is None or numclasses == counts.shape[-1]):
+            return nsb_entropy(counts)
+        values = []
+        for row in counts:
+            K = max(numclasses, np.count_nonzero(row))
+            values.append(nb.cached_S(nb.make_nxkx(row, K), row.sum(), K))
+        return np.array(values, dtype=float)
+
+
+class ChaoShenEstimator(Estimator):
+    """
+    Coverage adjusted estimator of Chao and Shen (2003), which scales the
+    class frequencies by the sample coverage estimated from the number of
+    singletons and weights each class by the inverse of its probability of
+    being observed.
+    """
+
+    name = "CS"
+    description = "Chao-Shen"
+
+    def entropy(self, counts, numclasses=None):
+        counts = np.asarray(counts, dtype=float)
+        sizes = counts.sum(axis=-1, keepdims=True)
+        singletons = (counts == 1).sum(axis=-1, keepdims=True)
+        singletons = np.where(singletons == sizes, sizes - 1, singletons)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            freqs = (1 - singletons / sizes) * counts / sizes
+            terms = np.where(counts > 0, -freqs * np.log2(np.where(counts > 0, freqs, 1)) /
+                             (1 - (1 - freqs) ** sizes), 0.0)
+        return terms.sum(axis=-1)
+
+
+#: Registered entropy estimators by name.
+estimators = {}
+#: Other names accepted by :func:`estimator` for registered estimators.
+aliases = {"Miller": "MM", "Miller-Maddow": "MM", "Miller-Madow": "MM"}
+
+
+def register(estimator):
+    """
+    Register the :class:`Estimator` instance :obj:`estimator` under its name,
+    replacing any estimator of that name, and return it.
+    """
+    estimators[estimator.name] = estimator
+    return estimator
+
+
+def estimator(method):
+    """
+    Return the estimator registered as :obj:`method` or one of its
+    :data:`aliases`, or :obj:`method` itself if it is an :class:`Estimator`.
+    """
+    if (isinstance(method, Estimator)):
+        return method
+    method = aliases.get(method, method)
+    if (method not in estimators):
+        raise ValueError("Unknown entropy estimator {}, expected one of {}".format(method, ", ".join(estimators)))
+    return estimators[method]
+
+
+register(PluginEstimator())
+register(MillerMadowEstimator())
+register(NSBEstimator())
+register(ChaoShenEstimator())
+
+
+def benchmark(counts, names=None, repeat=3):
+    """
+    Time :meth:`Estimator.entropy` of the estimators :obj:`names`, all
+    registered estimators by default, on the rows of :obj:`counts`, e.g. the
+    class counts of the feature states of an alignment. NSB estimates are
+    timed with an empty :data:`tsfm.nsb_entropy.cache`, which is restored
+    afterwards.
+    Return:
+        (:obj:`dict`): best seconds per row of each estimator over
+        :obj:`repeat` runs.
+    """
+    counts = np.atleast_2d(np.asarray(counts))
+    timings = {}
+    cache = nb.cache
+    try:
+        for name in (estimators if (names is None) else names):
+            best = np.inf
+            for _ in range(repeat):
+                nb.cache = nb.NSBCache()
+                start = time.perf_counter()
+                estimator(name).entropy(counts)
+                best = min(best, time.perf_counter() - start)
+            timings[name] = best / max(len(counts), 1)
+    finally:
+        nb.cache = cache
+    return timings
+
+
+def information(counts, background, exact, method="MM", inverse=False):
+    """
+    Functional information and class heights for every state of every feature.
+    Args:
+        counts (:class:`numpy.ndarray`): class counts with the class axis last,
+            e.g. of shape (features, states, classes).
+        background (:class:`numpy.ndarray`): class counts of the whole alignment.
+        exact (:obj:`list` of :obj:`float`): exact expected entropies for sample
+            sizes 1 to ``len(exact)``.
+        method (:obj:`str` or :class:`Estimator`): estimator used for sample
+            sizes exceeding ``len(exact)``, e.g. ``"NSB"`` or ``"MM"``, see
+            :func:`estimator`.
+        inverse (:obj:`bool`): calculate information of anti-determinants.
+    Return:
+        (:class:`numpy.ndarray`, :class:`numpy.ndarray`, :class:`numpy.ndarray`):
+        information of shape ``counts.shape[:-1]``, class heights of shape
+        ``counts.shape`` and a boolean mask of feature states that occur.
+    """
+    counts = np.asarray(counts)
+    background = np.asarray(background, dtype=float)
+    exact = np.asarray(exact, dtype=float)
+    numclasses = counts.shape[-1]
+    present = counts.sum(axis=-1) > 0
+
+    if (inverse):
+        missing = (counts > 0).sum(axis=-1, keepdims=True) != numclasses
+        counts = counts + missing
+        sizes = counts.sum(axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            stat_counts = sizes[..., None] / counts
+        prior = background.sum() / background
+    else:
+        sizes = counts.sum(axis=-1)
+        stat_counts = counts
+        prior = background
+
+    bg_entropy = plugin_entropy(prior)
+    fg_entropy = plugin_entropy(stat_counts)
+
+    small = present & (sizes <= exact.size)
+    expected = np.zeros(sizes.shape)
+    if (exact.size):
+        expected[small] = exact[np.asarray(sizes[small], dtype=np.intp) - 1]
+    large = present & ~small
+    method = estimator(method)
+    expected[large] = method.expected(bg_entropy, numclasses, sizes[large])
+    if (not method.plugin):
+        fg_entropy[large] = method.entropy(stat_counts[large])
+
+    info = np.where(present, np.maximum(expected - fg_entropy, 0), 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = (stat_counts / stat_counts.sum(axis=-1, keepdims=True)) / (prior / prior.sum())
+        height = np.where(present[..., None], ratios / ratios.sum(axis=-1, keepdims=True), 0)
+
+    return info, height, present
+
+
+class ExactCache:
+    """
+    Bounded least-recently-used caches of exact expected entropies.
+
+    The exact corrections of a class background depend only on its nonzero
+    class proportions, which are rounded to :obj:`decimals` and sorted in the
+    key returned by :meth:`key`, since the expected entropy does not depend
+    on the order of the classes. :meth:`table` keeps the corrections of up to
+    :obj:`maxsize` keys, calculated from the proportions of the key, so that
+    a cached value does not depend on which caller computed it first.
+    :meth:`class_terms` keeps up to :obj:`terms_maxsize` tables of per class
+    terms, from which :class:`PermutedInformation` sums the corrections of
+    permuted backgrounds. Both can be saved to and loaded from an SQLite
+    database to reuse them between runs.
+
+    >>> cache = ExactCache(decimals=3)
+    >>> cache.key([0.5, 0.25, 0.25], 3) == cache.key([0.25, 0.5, 0.0, 0.25], 4)
+    True
+    >>> cache.proportions(cache.key([0.5, 0.25, 0.25], 3))
+    [0.25, 0.25, 0.5]
+    """
+
+    def __init__(self, maxsize=2 ** 10, terms_maxsize=2 ** 10, decimals=12):
+        self.maxsize = maxsize
+        self.terms_maxsize = terms_maxsize
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._terms = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def key(self, p, numclasses):
+        p = np.round(np.asarray(p, dtype=float), self.decimals)
+        p = np.sort(p[p > 0])
+        return p.size, p.tobytes()
+
+    @staticmethod
+    def proportions(key):
+        return np.frombuffer(key[1]).tolist()
+
+    @staticmethod
+    def _touch(data, key, value, maxsize):
+        data[key] = value
+        data.move_to_end(key)
+        while len(data) > maxsize:
+            data.popitem(last=False)
+
+    def table(self, n, p):
+        """
+        Exact expected entropies of sample sizes 1 to :obj:`n` for every row of
+        the (rows, classes) proportion matrix :obj:`p`, as an array of shape
+        (rows, :obj:`n`). Rows missing from the cache are calculated together
+        in one call of :func:`tsfm.exact.batch_exact`.
+        """
+        p = np.asarray(p, dtype=float)
+        table = np.zeros((len(p), max(n, 0)))
+        if (n < 1):
+            return table
+        missing = {}
+        for index, row in enumerate(p):
+            key = self.key(row, row.size)
+            values = self._data.get(key)
+            if (values is not None and len(values) >= n):
+                self.hits += 1
+                self._data.move_to_end(key)
+                table[index] = values[:n]
+            else:
+                self.misses += 1
+                missing.setdefault(key, []).append(index)
+        if (missing):
+            width = max(key[0] for key in missing)
+            proportions = np.zeros((len(missing), width))
+            for row, key in enumerate(missing):
+                proportions[row, :key[0]] = self.proportions(key)
+            for key, values in zip(missing, exact.batch_exact(proportions, n)):
+                self._touch(self._data, key, values, self.maxsize)
+                table[missing[key]] = values
+        return table
+
+    def class_terms(self, total, size):
+        """
+        Terms of the exact expected entropy of :obj:`size` samples contributed
+        by a class with each count 0 to :obj:`total` in a background of
+        :obj:`total` items, see :func:`tsfm.exact.binomial_entropy`. The
+        corrections of all backgrounds of that size are sums of these terms.
+        """
+        key = (int(total), int(size))
+        terms = self._terms.get(key)
+        if (terms is None):
+            terms = exact.binomial_entropy(np.arange(total + 1) / total, size)
+        self._touch(self._terms, key, terms, self.terms_maxsize)
+        return terms
+
+    def clear(self):
+        self._data.clear()
+        self._terms.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def save(self, file_name):
+        with sqlite3.connect(file_name) as db:
+            db.execute("CREATE TABLE IF NOT EXISTS exact "
+                       "(numclasses INTEGER, p BLOB, corrections BLOB, PRIMARY KEY (numclasses, p))")
+            db.execute("CREATE TABLE IF NOT EXISTS terms "
+                       "(total INTEGER, size INTEGER, terms BLOB, PRIMARY KEY (total, size))")
+            db.executemany("INSERT OR REPLACE INTO exact VALUES (?, ?, ?)",
+                           ((numclasses, p, np.asarray(values, dtype=float).tobytes())
+                            for (numclasses, p), values in self._data.items()))
+            db.executemany("INSERT OR REPLACE INTO terms VALUES (?, ?, ?)",
+                           ((total, size, np.asarray(terms, dtype=float).tobytes())
+                            for (total, size), terms in self._terms.items()))
+        db.close()
+
+    def load(self, file_name):
+        with sqlite3.connect(file_name) as db:
+            rows = db.execute("SELECT numclasses, p, corrections FROM exact").fetchall()
+            terms = db.execute("SELECT total, size, terms FROM terms").fetchall()
+        db.close()
+        for numclasses, p, corrections in rows:
+            values = np.frombuffer(corrections)
+            current = self._data.get((numclasses, p))
+            if (current is None or len(current) < len(values)):
+                self._touch(self._data, (numclasses, p), values, self.maxsize)
+        for total, size, values in terms:
+            self._touch(self._terms, (total, size), np.frombuffer(values), self.terms_maxsize)
+
+
+exact_cache = ExactCache()
+
+
+def _state():
+    return exact_cache._data, exact_cache._terms
+
+
+def _restore(state):
+    exact_cache._data, exact_cache._terms = state
+
+
+scheduler.register_state(_state, _restore)
+
+
+def plogp(counts):
+    """
+    ``c log2 c`` of every count, zero for empty counts.
+    """
+    counts = np.asarray(counts, dtype=float)
+    return np.where(counts > 0, counts * np.log2(np.where(counts > 0, counts, 1)), 0.0)
+
+
+class PermutedInformation:
+    """
+    Information of permuted samples of a feature state within one clade.
+
+    Replacing the sample of the state by a permuted sample of the same size
+    leaves the size of the class background of the clade unchanged, and
+    changes only the counts of the classes that occur in the pooled samples
+    of the test. The background entropy and its exact correction are sums of
+    per class terms of the counts, so the terms of the other classes are
+    summed once and only the terms of the changing classes are looked up for
+    every permutation, from the tables of :meth:`ExactCache.class_terms`.
+
+    Args:
+        base (:class:`numpy.ndarray`): class totals of the clade without the
+            sample of the state.
+        pooled (:class:`numpy.ndarray`): class counts of the pooled samples,
+            the largest count of each class in a permuted sample.
+        size (:obj:`int`): size of the sample of the state in the clade.
+        exact_size (:obj:`int`): largest sample size with an exact correction.
+        numclasses (:obj:`int`): number of functional classes of the clade.
+        method (:obj:`str` or :class:`Estimator`): estimator used if
+            :obj:`size` exceeds :obj:`exact_size`, see :func:`estimator`.
+    """
+
+    def __init__(self, base, pooled, size, exact_size, numclasses, method="MM"):
+        base = np.asarray(base, dtype=np.intp)
+        changing = np.asarray(pooled) > 0
+        self.size = size
+        self.numclasses = numclasses
+        self.estimator = estimator(method)
+        self.total = int(base.sum()) + size
+        self.changing = np.flatnonzero(changing)
+        self.offsets = base[changing]
+        if (size <= exact_size):
+            self.terms = exact_cache.class_terms(self.total, size)
+            self.fixed = self.terms[base[~changing]].sum()
+        else:
+            self.terms = None
+            self.fixed = plogp(base[~changing]).sum()
+
+    def info(self, counts):
+        """
+        Information of the permuted samples with the class counts in the rows
+        of :obj:`counts`, over the classes of :obj:`base`.
+        """
+        counts = np.asarray(counts)
+        background = self.offsets + counts[:, self.changing]
+        if (self.terms is not None):
+            expected = self.fixed + self.terms[background].sum(axis=1)
+            fg_entropy = plugin_entropy(counts)
+        else:
+            bg_entropy = np.log2(self.total) - (self.fixed + plogp(background).sum(axis=1)) / self.total
+            expected = self.estimator.expected(bg_entropy, self.numclasses, self.size)
+            fg_entropy = self.estimator.entropy(counts, self.numclasses)
+        return np.maximum(expected - fg_entropy, 0)
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+"""
+Peaks-over-threshold tail estimation with the generalized Pareto distribution.
+
+Permutation statistics stream in batches, and only the largest of them enter
+the GPD fit, so :class:`TailTracker` keeps just the top values of the stream
+instead of its full history. :func:`fit` estimates the GPD of an exceedance
+set together with its Anderson-Darling goodness of fit, using the backend
+selected by :data:`BACKEND`.
+
+Example::
+
+    tail = TailTracker(251)
+    tail.update(batch)                    # once per batch of statistics
+    threshold, sample = tail.exceedances(250, power=5)
+    result = fit(sample)                  # shape, scale and AD test
+"""
+from collections import namedtuple
+import time
+
+import numpy as np
+from scipy.special import inv_boxcox1p
+from scipy.stats import genpareto, norm
+
+from tsfm.addist import ad_unif_sf
+from tsfm.ecdfgof import GofResult, ad_stat
+import tsfm.scheduler as scheduler
+
+#: GPD estimator used by :func:`fit`: ``"scipy"`` for the Nelder-Mead
+#: maximum likelihood fit of :func:`scipy.stats.genpareto.fit`, or ``"fast"``
+#: for Newton's method on the profile likelihood, warm started from the fit
+#: of a neighbouring exceedance set.
+BACKEND = "scipy"
+
+
+def _state():
+    return BACKEND
+
+
+def _restore(backend):
+    global BACKEND
+    BACKEND = backend
+
+
+scheduler.register_state(_state, _restore)
+
+
+class TailTracker:
+    """
+    The :obj:`k` largest values of a stream of statistics.
+    Args:
+        k (:obj:`int`): number of values retained; one more than the largest
+            number of exceedances to be requested.
+    Attributes:
+        count (:obj:`int`): number of values seen.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.count = 0
+        self._top = np.zeros(0)
+
+    def update(self, values):
+        """
+        Add a batch of :obj:`values` to the stream in O(k + ``len(values)``).
+        """
+        values = np.asarray(values, dtype=float)
+        self.count += values.size
+        top = np.concatenate([self._top, values])
+        if (top.size > self.k):
+            top = np.partition(top, -self.k)[-self.k:]
+        self._top = top
+
+    def largest(self, n):
+        """
+        Return the :obj:`n` largest values seen in ascending order.
+        """
+        if (n > self._top.size):
+            raise ValueError("{} values requested but only {} retained".format(n, self._top.size))
+        return np.sort(self._top)[self._top.size - n:]
+
+    def exceedances(self, E, power=1):
+        """
+        Peaks over threshold of the values raised to :obj:`power`, a monotone
+        transform. The threshold lies halfway between the :obj:`E` and
+        :obj:`E` + 1 largest transformed values.
+        Return:
+            (:obj:`float`, :class:`numpy.ndarray`): threshold and the
+            :obj:`E` largest transformed values less the threshold, ascending.
+        """
+        # scalar powers, as vectorized ones may differ in the last bit
+        top = np.array([x ** power for x in self.largest(E + 1).tolist()])
+        threshold = (top[0] + top[1]) / 2
+        return threshold, top[1:] - threshold
+
+
+def _ragged(samples):
+    """
+    Flatten a sequence of 1-d arrays, returning the values, the index of the
+    array each value came from and the size of each array.
+    """
+    sizes = np.array([len(sample) for sample in samples], dtype=np.intp)
+    values = np.concatenate([np.asarray(sample, dtype=float) for sample in samples]) if len(samples) else np.zeros(0)
+    owner = np.repeat(np.arange(len(samples)), sizes)
+    return values, owner, sizes
+
+
+def log_likelihood(samples, shapes, scales):
+    """
+    Log-likelihood of GPDs with location 0 for many exceedance sets at once.
+    Args:
+        samples (:obj:`list` of :class:`numpy.ndarray`): exceedances of each set.
+        shapes (array_like): shape parameter of each set.
+        scales (array_like): scale parameter of each set.
+    Return:
+        (:class:`numpy.ndarray`): log-likelihood of each set, ``-inf`` where
+        an exceedance lies outside the support.
+    """
+    z, owner, sizes = _ragged(samples)
+    shapes = np.asarray(shapes, dtype=float)
+    scales = np.asarray(scales, dtype=float)
+    xi = shapes[owner]
+    sigma = scales[owner]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        y = xi * z / sigma
+        terms = np.where(xi == 0, z / sigma, (1 + 1 / xi) * np.log1p(y))
+        terms = np.where(1 + y > 0, terms, np.inf)
+    return -sizes * np.log(scales) - np.bincount(owner, weights=terms, minlength=len(samples))
+
+
+def fisher_information(samples, shapes, scales):
+    """
+    Observed Fisher information matrices of GPD fits with location 0, with
+    respect to (shape, scale), for many exceedance sets at once.
+    Return:
+        (:class:`numpy.ndarray`): array of shape (``len(samples)``, 2, 2).
+    """
+    z, owner, sizes = _ragged(samples)
+    xi = np.asarray(shapes, dtype=float)
+    sigma = np.asarray(scales, dtype=float)
+    n = len(samples)
+
+    def total(terms):
+        return np.bincount(owner, weights=terms, minlength=n)
+
+    denominator = sigma[owner] + xi[owner] * z
+    log_sum = total(np.log(1 + xi[owner] * (z / sigma[owner])))
+    ratio_sum = total(z / denominator)
+    ratio2_sum = total((z / denominator) ** 2)
+    inverse_sum = total(1 / denominator)
+    inverse2_sum = total((1 / denominator) ** 2)
+    weighted_sum = total(z / denominator ** 2)
+
+    mif11 = (2 / (xi ** 3)) * log_sum - (2 / (xi ** 2)) * ratio_sum - (1 + (1 / xi)) * ratio2_sum
+    mif22 = (sizes / (xi * (sigma ** 2))) - (1 + (1 / xi)) * inverse2_sum
+    mif12 = (sizes / ((xi ** 2) * sigma)) - (1 / (xi ** 2)) * inverse_sum - (1 + (1 / xi)) * weighted_sum
+    return -np.stack([np.stack([mif11, mif12], axis=-1), np.stack([mif12, mif22], axis=-1)], axis=-2)
+
+
+def confidence_intervals(alpha, samples, permcounts, shapes, scales, stats):
+    """
+    Confidence intervals of GPD tail p-values for many features at once.
+    The shape and scale are moved along the principal axes of their
+    covariance to the corners of the :obj:`alpha` confidence box, the tail
+    probability of :obj:`stats` is bounded over the four corners, and the
+    bounds are scaled by the binomial interval of the exceedance rate.
+    Args:
+        alpha (:obj:`float`): significance level.
+        samples (:obj:`list` of :class:`numpy.ndarray`): exceedances of each fit.
+        permcounts (array_like): number of permutations of each fit.
+        shapes (array_like): fitted shape of each fit.
+        scales (array_like): fitted scale of each fit.
+        stats (array_like): transformed statistic less the threshold.
+    Return:
+        (:class:`numpy.ndarray`): lower and upper bound of each feature,
+        shape (``len(samples)``, 2).
+    """
+    shapes = np.asarray(shapes, dtype=float)
+    scales = np.asarray(scales, dtype=float)
+    stats = np.asarray(stats, dtype=float)
+    permcounts = np.asarray(permcounts, dtype=float)
+    if (shapes.size == 0):
+        return np.zeros((0, 2))
+    sizes = np.array([len(sample) for sample in samples], dtype=float)
+
+    inverse = np.linalg.pinv(fisher_information(samples, shapes, scales))
+    u, d, v = np.linalg.svd(inverse, full_matrices=True)
+    z = norm.ppf(1 - np.sqrt(alpha) / 2, loc=0, scale=1)
+    step = z * np.sqrt(d)
+    centre = np.stack([shapes, scales], axis=-1)
+    corner1 = np.einsum("nij,nj->ni", v, -step) + centre
+    corner2 = np.einsum("nij,nj->ni", v, step) + centre
+    xi = np.stack([corner1[:, 0], corner2[:, 0], corner2[:, 0], corner1[:, 0]], axis=-1)
+    sigma = np.stack([corner1[:, 1], corner1[:, 1], corner2[:, 1], corner2[:, 1]], axis=-1)
+    tail = 1 - genpareto.cdf(stats[:, None], xi, 0, sigma)
+
+    rate = sizes / permcounts
+    binomial = norm.ppf(1 - alpha / 2, loc=0, scale=1) * np.sqrt(rate * (1 - rate) / permcounts)
+    return np.stack([tail.min(axis=-1) * binomial, tail.max(axis=-1) * binomial], axis=-1)
+
+
+class TailFit(namedtuple("TailFit", ["shape", "scale", "adstat", "adpvalue"])):
+    """
+    Generalized Pareto fit with location 0 of an exceedance set and the
+    Anderson-Darling test of the fit.
+    """
+
+    @property
+    def accepted(self):
+        """
+        Whether the fit is not rejected by the Anderson-Darling test at 0.05.
+        """
+        return self.adpvalue > 0.05
+
+
+def fit(sample, start=None):
+    """
+    Fit a GPD with location 0 to :obj:`sample` and test the fit.
+    Args:
+        sample (array_like): exceedances over the threshold.
+        start (:class:`TailFit`): fit of a similar sample, used as the
+            starting point of the ``"fast"`` backend.
+    Return:
+        (:class:`TailFit`): shape, scale and Anderson-Darling statistic and p-value.
+    """
+    sample = np.asarray(sample, dtype=float)
+    if (BACKEND == "fast"):
+        shape, scale = profile_fit(sample, start)
+    else:
+        shape, loc, scale = genpareto.fit(sample, floc=0)
+    result = anderson_darling(sample, shape, scale)
+    return TailFit(shape, scale, result.statistic, result.pvalue)
+
+
+def anderson_darling(sample, shape, scale):
+    """
+    Anderson-Darling test of :obj:`sample` against the GPD with location 0,
+    :obj:`shape` and :obj:`scale`. Same as
+    ``ad_test(sample, genpareto(c=shape, scale=scale))`` to within 1e-12
+    relative, but computed on the uniformized sample with array operations
+    instead of frozen scipy distributions.
+    Return:
+        (:class:`tsfm.ecdfgof.GofResult`): statistic and p-value.
+    """
+    z = np.sort(np.asarray(sample, dtype=float)) / scale
+    with np.errstate(divide="ignore", invalid="ignore"):
+        uniform = -inv_boxcox1p(-z, -shape)
+        uniform = np.where(z < 0, 0., uniform)
+        if (shape < 0):
+            uniform = np.where(z >= -1 / shape, 1., uniform)
+        statistic = ad_stat(uniform)
+    return GofResult(statistic, ad_unif_sf(statistic, z.size))
+
+
+def _profile(theta, z):
+    """
+    Negative profile log-likelihood per exceedance of theta = shape / scale,
+    with its first and second derivatives.
+    """
+    if (theta == 0):
+        return np.log(z.mean()) + 1, z.mean() / 2, 0.0
+    u = theta * z
+    xi = np.mean(np.log1p(u))
+    d1 = np.mean(z / (1 + u))
+    d2 = -np.mean((z / (1 + u)) ** 2)
+    value = np.log(xi / theta) + 1 + xi
+    # (theta * xi' - xi) / (theta * xi), written to avoid cancellation near 0
+    gradient = np.mean(u / (1 + u) - np.log1p(u)) / (theta * xi) + d1
+    hessian = (d2 * xi - d1 ** 2) / xi ** 2 + 1 / theta ** 2 + d2
+    return value, gradient, hessian
+
+
+def profile_fit(sample, start=None, tol=1e-12, maxiter=100):
+    """
+    Maximum likelihood GPD fit with location 0 by Newton's method on the
+    profile likelihood of theta = shape / scale, for which the shape is
+    ``mean(log1p(theta * sample))`` (Grimshaw, 1993). Falls back to
+    :func:`scipy.stats.genpareto.fit` for constant samples and if Newton's
+    method does not converge. Samples with ties at the threshold or only two
+    distinct values may have no maximum; these return the degenerate fit
+    the iterations approach, which the goodness of fit test rejects.
+    Args:
+        sample (:class:`numpy.ndarray`): exceedances over the threshold.
+        start (:class:`TailFit`): starting point; defaults to the method of
+            moments estimate.
+    Return:
+        (:obj:`float`, :obj:`float`): shape and scale.
+    """
+    z = np.asarray(sample, dtype=float)
+    if (z.min() < 0 or z.max() <= 0 or z.var() == 0):
+        shape, loc, scale = genpareto.fit(z, floc=0)
+        return shape, scale
+    lower = -1 / z.max()
+    if (start is not None and start.scale > 0):
+        theta = start.shape / start.scale
+    else:
+        mean = z.mean()
+        shape = 0.5 * (1 - mean ** 2 / z.var()) if (z.var() > 0) else 0.0
+        theta = shape / (mean * (1 - shape))
+    if (not np.isfinite(theta) or theta <= lower):
+        theta = lower / 2
+    if (theta == 0):
+        theta = lower * 1e-3
+
+    value, gradient, hessian = _profile(theta, z)
+    for i in range(maxiter):
+        step = -gradient / hessian if (hessian > 0) else -np.sign(gradient) * abs(lower) * 0.1
+        while theta + step <= lower:
+            step /= 2
+        new_value, new_gradient, new_hessian = _profile(theta + step, z)
+        while new_value > value and abs(step) > tol * abs(lower):
+            step /= 2
+            new_value, new_gradient, new_hessian = _profile(theta + step, z)
+        theta += step
+        value, gradient, hessian = new_value, new_gradient, new_hessian
+        if (not np.isfinite(value) or np.mean(np.log1p(theta * z)) < -1 or theta * z.max() > 1e8):
+            # the likelihood is unbounded for shapes below -1 and, if the
+            # sample has ties at the threshold, for vanishing scales
+            break
+        if (abs(step) <= tol * max(abs(theta), abs(lower))):
+            if (theta == 0):
+                return 0.0, z.mean()
+            shape = np.mean(np.log1p(theta * z))
+            return shape, shape / theta
+    if (np.isfinite(value) and ((z == 0).any() or np.unique(z).size < 3)):
+        # no maximum exists, return the degenerate fit the iterations approach
+        shape = np.mean(np.log1p(theta * z))
+        return shape, shape / theta
+    shape, loc, scale = genpareto.fit(z, floc=0)
+    return shape, scale
+
+
+def benchmark(samples, warm=True):
+    """
+    Compare the ``"fast"`` estimator with the scipy fit on :obj:`samples`,
+    e.g. the shrinking exceedance sets of permutation tails. With
+    :obj:`warm`, each fast fit starts from the fit of the previous sample.
+    Return:
+        (:obj:`dict`): seconds spent by each estimator, the number of
+        samples on which the goodness of fit decisions differ, and the
+        largest log-likelihood loss per exceedance of the fast estimator on
+        samples whose scipy fit is accepted.
+    """
+    start = time.perf_counter()
+    reference = [genpareto.fit(sample, floc=0) for sample in samples]
+    scipy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast = []
+    previous = None
+    for sample in samples:
+        shape, scale = profile_fit(sample, previous if (warm) else None)
+        previous = TailFit(shape, scale, None, None)
+        fast.append(previous)
+    fast_time = time.perf_counter() - start
+
+    accepted = []
+    for sample, (shape, loc, scale), f in zip(samples, reference, fast):
+        accepted.append([anderson_darling(sample, shape, scale).pvalue > 0.05,
+                         anderson_darling(sample, f.shape, f.scale).pvalue > 0.05])
+    accepted = np.array(accepted, dtype=bool).reshape(-1, 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        loss = (log_likelihood(samples, [r[0] for r in reference], [r[2] for r in reference]) -
+                log_likelihood(samples, [f.shape for f in fast], [f.scale for f in fast]))
+    loss = loss[accepted[:, 0]] / np.array([len(s) for s in samples])[accepted[:, 0]]
+    return {"scipy": scipy_time, "fast": fast_time,
+            "disagree": int((accepted[:, 0] != accepted[:, 1]).sum()),
+            "loss": loss.max() if (loss.size) else 0.0}
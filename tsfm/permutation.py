@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Random permutations of functional class labels.
+
+Permutations are drawn from :class:`numpy.random.Generator` streams spawned
+from a single :class:`numpy.random.SeedSequence`, so that every worker process
+receives an independent stream and runs can be reproduced by fixing the root
+seed with :func:`seed`.
+
+Example::
+
+    permutation.seed(42)
+    rng = permutation.spawn(1)[0]
+    rng.permutations(["A", "A", "K", "H"], 3)    # array of shape (3, 4)
+"""
+from collections import Counter, OrderedDict
+import pickle
+
+import numpy as np
+
+import tsfm.scheduler as scheduler
+
+_root = np.random.SeedSequence()
+_KLD_KEY = 0x4b4c44  # leading spawn key of KLD null streams
+
+
+def seed(entropy=None):
+    """
+    Reset the root :class:`numpy.random.SeedSequence` from which generators are
+    spawned. If :obj:`entropy` is ``None``, fresh entropy is drawn from the OS.
+    """
+    global _root
+    _root = np.random.SeedSequence(entropy)
+
+
+def spawn(n):
+    """
+    Return :obj:`n` independent :class:`PermutationGenerator` objects spawned
+    from the root seed sequence.
+    """
+    return [PermutationGenerator(child) for child in _root.spawn(n)]
+
+
+class PermutationGenerator:
+    """
+    Stream of random permutations backed by :class:`numpy.random.Generator`.
+    Args:
+        seed (:class:`numpy.random.SeedSequence` or :obj:`int`): seed of the stream.
+            Defaults to fresh entropy from the OS.
+    """
+
+    def __init__(self, seed=None):
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.seed_sequence = seed
+        self.rng = np.random.default_rng(seed)
+
+    def spawn(self, n):
+        """
+        Return :obj:`n` independent child generators of this stream.
+        """
+        return [PermutationGenerator(child) for child in self.seed_sequence.spawn(n)]
+
+    def child(self, i):
+        """
+        Return the :obj:`i`-th child stream of this generator. Unlike
+        :meth:`spawn`, repeated calls return identical streams, so that a
+        block of permutations can be regenerated from its index alone.
+        Children share keys with :meth:`spawn`, so a generator should use one
+        of the two methods only.
+        """
+        seed = np.random.SeedSequence(self.seed_sequence.entropy,
+                                      spawn_key=self.seed_sequence.spawn_key + (i,),
+                                      pool_size=self.seed_sequence.pool_size)
+        return PermutationGenerator(seed)
+
+    def indices(self, n, n_perm):
+        """
+        Return a (:obj:`n_perm`, :obj:`n`) array whose rows are independent
+        permutations of ``range(n)``.
+        """
+        return self.rng.permuted(np.tile(np.arange(n, dtype=np.intp), (n_perm, 1)), axis=1)
+
+    def permutations(self, items, n_perm):
+        """
+        Return a (:obj:`n_perm`, ``len(items)``) array whose rows are
+        independent permutations of :obj:`items`.
+        """
+        items = np.asarray(items)
+        return items[self.indices(items.size, n_perm)]
+
+    def class_counts(self, totals, n, size):
+        """
+        Return a (:obj:`size`, ``len(totals)``) array of the number of items
+        of each class among the first :obj:`n` items of :obj:`size` random
+        permutations of a sample with class :obj:`totals`. Rows follow the
+        multivariate hypergeometric distribution, so they are drawn directly
+        instead of permuting the sample.
+        """
+        return self.rng.multivariate_hypergeometric(totals, n, size=size)
+
+    def shuffled(self, items):
+        """
+        Return a shuffled copy of the list :obj:`items`.
+        """
+        return [items[i] for i in self.rng.permutation(len(items))]
+
+    def resampled(self, items):
+        """
+        Return a bootstrap resample of the list :obj:`items`, drawn with
+        replacement and of the same length.
+        """
+        return [items[i] for i in self.rng.integers(len(items), size=len(items))]
+
+
+def kld(back, fore, numclasses):
+    """
+    Kullback-Leibler divergence in bits of foreground from background class
+    frequencies for every row of the count arrays :obj:`back` and :obj:`fore`.
+    As in :meth:`tsfm.MolecularInformation.FunctionLogoDifference.calculate_kld`,
+    a pseudocount is added to all :obj:`numclasses` classes of a row when
+    either partition lacks any of the 21 functional classes. Classes missing
+    from both arrays contribute only through their pseudocounts.
+    """
+    back = np.asarray(back)
+    fore = np.asarray(fore)
+    extra = numclasses - back.shape[1]
+    pseudo = ((back > 0).sum(axis=1) < 21) | ((fore > 0).sum(axis=1) < 21)
+    add = pseudo.astype(np.intp)
+    back = back + add[:, None]
+    fore = fore + add[:, None]
+    back_size = back.sum(axis=1) + extra * add
+    fore_size = fore.sum(axis=1) + extra * add
+    with np.errstate(divide="ignore", invalid="ignore"):
+        post_back = back / back_size[:, None]
+        post_fore = fore / fore_size[:, None]
+        divergence = (post_fore * np.log2(post_fore / post_back)).sum(axis=1)
+        divergence += np.where(pseudo, extra * np.log2(back_size / fore_size) / fore_size, 0)
+    return divergence
+
+
+def kld_signature(class_counts_b, class_counts_f, numclasses):
+    """
+    Canonical signature of a KLD permutation test. The permutation null only
+    depends on the pooled class totals, the background sample size and the
+    number of functional classes, so tests sharing a signature share a null.
+    """
+    totals = Counter(class_counts_b) + Counter(class_counts_f)
+    return (tuple(sorted(totals.values())), sum(class_counts_b.values()), numclasses)
+
+
+class KLDNull:
+    """
+    Lazily extended sequence of permutation KLDs of one signature.
+    The sequence is drawn from a stream seeded by the root seed and the
+    signature, so it does not depend on which test requests it first or on
+    the number of values requested at a time.
+    Args:
+        signature (:obj:`tuple`): as returned by :func:`kld_signature`.
+    Attributes:
+        root (:obj:`int`): entropy of the root seed the stream was drawn from.
+        values (:class:`numpy.ndarray`): permutation KLDs drawn so far.
+    """
+
+    def __init__(self, signature):
+        totals, back_size, numclasses = signature
+        self.signature = signature
+        self.totals = np.array(totals, dtype=np.intp)
+        self.back_size = back_size
+        self.numclasses = numclasses
+        self.root = _root.entropy
+        seed = np.random.SeedSequence(_root.entropy, spawn_key=(_KLD_KEY, back_size, numclasses) + tuple(totals))
+        self.rng = PermutationGenerator(seed)
+        self.values = np.zeros(0)
+
+    def __len__(self):
+        return self.values.size
+
+    def draw(self, size):
+        """
+        Return the KLDs of :obj:`size` new permutations.
+        """
+        back = self.rng.class_counts(self.totals, self.back_size, size)
+        return kld(back, self.totals - back, self.numclasses)
+
+    def extend(self, n, limit=None):
+        """
+        Draw permutations until at least :obj:`n` values are available. The
+        sequence at least doubles in length, but never beyond :obj:`limit`.
+        """
+        if n <= self.values.size:
+            return
+        size = max(n, 2 * self.values.size, 64)
+        if limit is not None:
+            size = max(n, min(size, limit))
+        self.values = np.concatenate([self.values, self.draw(size - self.values.size)])
+
+    def value(self, i, limit=None):
+        """
+        Return the :obj:`i`-th permutation KLD, drawing more if needed.
+        """
+        self.extend(i + 1, limit)
+        return self.values[i]
+
+
+def _current(null):
+    return getattr(null, "root", None) == _root.entropy
+
+
+class KLDNullCache:
+    """
+    Least-recently-used cache of :class:`KLDNull` sequences keyed by
+    signature, bounded by the total number of stored permutation values.
+    Only nulls drawn from the current root seed are used or merged, so that
+    nulls saved by runs with another seed do not change the p-values of a
+    seeded run.
+    Pool workers receive the cache of the parent process at startup, see
+    :func:`tsfm.scheduler.register_state`, and return the nulls they used,
+    which are merged back with :meth:`update`.
+    """
+
+    def __init__(self, maxsize=2 ** 24):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _evict(self):
+        size = sum(len(null) for null in self._data.values())
+        while size > self.maxsize and len(self._data) > 1:
+            size -= len(self._data.popitem(last=False)[1])
+
+    def null(self, signature):
+        """
+        Return the :class:`KLDNull` of :obj:`signature`, creating it if needed.
+        """
+        if signature in self._data and _current(self._data[signature]):
+            self._data.move_to_end(signature)
+        else:
+            self._data[signature] = KLDNull(signature)
+        return self._data[signature]
+
+    def update(self, nulls):
+        """
+        Merge :obj:`nulls` drawn from the current root seed, keeping the
+        longer sequence of each signature.
+        """
+        for null in nulls:
+            if (not _current(null)):
+                continue
+            current = self._data.get(null.signature)
+            if current is None or not _current(current) or len(current) < len(null):
+                self._data[null.signature] = null
+            self._data.move_to_end(null.signature)
+        self._evict()
+
+    def clear(self):
+        self._data.clear()
+
+    def save(self, file_name):
+        with open(file_name, "wb") as cache_file:
+            pickle.dump(list(self._data.values()), cache_file)
+
+    def load(self, file_name):
+        with open(file_name, "rb") as cache_file:
+            self.update(pickle.load(cache_file))
+
+
+kld_nulls = KLDNullCache()
+
+
+def _state():
+    return _root, kld_nulls
+
+
+def _restore(state):
+    global _root, kld_nulls
+    _root, kld_nulls = state
+
+
+scheduler.register_state(_state, _restore)
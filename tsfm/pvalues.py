@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Flat tables of p-values for multiple test correction.
+
+Every test is a row of (feature, state, functional class, raw p-value,
+family). Multiple test correction is applied to each family in a single
+pass over index arrays and the corrected values are scattered back into
+the nested dictionaries used for output.
+
+Example::
+
+    table = PValueTable()
+    table.add(10, "A", 0.01)                 # stack height test
+    table.add(10, "A", 0.04, aa_class="K")   # letter height test
+    corrected = table.correct("fdr_bh")
+    table.nested(corrected)                  # {10: {'A': 0.02}}
+"""
+from collections import defaultdict
+
+import numpy as np
+import statsmodels.stats.multitest as smm
+
+
+class PValueTable:
+    """
+    Raw p-values of structural feature tests held as parallel columns.
+    Attributes:
+        features (:obj:`list`): coordinate of the feature of each test.
+        states (:obj:`list` of :obj:`str`): feature state of each test.
+        classes (:obj:`list` of :obj:`str`): functional class of letter height
+            tests, ``None`` for stack height and divergence tests.
+        families (:obj:`list` of :obj:`int`): family of each test; tests are
+            corrected for multiple comparisons within their family.
+    """
+
+    def __init__(self):
+        self.features = []
+        self.states = []
+        self.classes = []
+        self.families = []
+        self._p = []
+
+    def __len__(self):
+        return len(self._p)
+
+    def add(self, feature, state, p, aa_class=None, family=0):
+        self.features.append(feature)
+        self.states.append(state)
+        self.classes.append(aa_class)
+        self.families.append(family)
+        self._p.append(p)
+
+    @property
+    def p(self):
+        """
+        Raw p-values as a :class:`numpy.ndarray`.
+        """
+        return np.asarray(self._p, dtype=float)
+
+    def correct(self, method):
+        """
+        Correct the p-values of each family for multiple testing.
+        Args:
+            method (:obj:`str`): any method of :func:`statsmodels.stats.multitest.multipletests`.
+        Return:
+            (:class:`numpy.ndarray`): corrected p-values in row order.
+        """
+        p = self.p
+        corrected = np.empty_like(p)
+        families = np.asarray(self.families)
+        for family in np.unique(families):
+            index = np.nonzero(families == family)[0]
+            corrected[index] = smm.multipletests(p[index], method=method)[1]
+        return corrected
+
+    def nested(self, values, letters=False):
+        """
+        Scatter per-test :obj:`values` back into nested dictionaries.
+        Args:
+            values (:class:`numpy.ndarray`): one value per row, e.g. :attr:`p`
+                or the result of :meth:`correct`.
+            letters (:obj:`bool`): return letter height tests keyed by
+                feature, state and class instead of stack height tests keyed
+                by feature and state.
+        """
+        if (letters):
+            table = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
+        else:
+            table = defaultdict(lambda: defaultdict(float))
+        for feature, state, aa_class, value in zip(self.features, self.states, self.classes, np.asarray(values).tolist()):
+            if (aa_class is None and not letters):
+                table[feature][state] = value
+            elif (aa_class is not None and letters):
+                table[feature][state][aa_class] = value
+        return table
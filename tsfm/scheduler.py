@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Dynamic scheduling of independent tasks over a process pool.
+
+The cost of a permutation test varies by orders of magnitude, from tests
+that reach their exceedances after a few batches to tests that run to the
+maximum number of permutations. Instead of slicing the tasks into fixed
+chunks ahead of time, :func:`run` hands them out one at a time as workers
+become free, costliest first, so that no worker is left with a tail of
+expensive tasks while the others sit idle.
+
+Between :func:`start` and :func:`stop`, every stage runs on one persistent
+pool instead of forking a pool of its own. Tasks then carry their function,
+so functions should be cheap to pickle, e.g. methods of logos whose counts
+were shared with :meth:`tsfm.counts.AlignmentCounts.share`.
+
+Module settings that tasks depend on, such as backends, seeds and caches,
+are registered with :func:`register_state`. A snapshot of them is taken
+when a pool starts and applied by every worker at startup, so that workers
+see the settings of the parent process whether they are forked or started
+by spawn or forkserver.
+
+Example::
+
+    scheduler.start(4)
+    perm_dist = logo.permInfo("NSB", 4)
+    results = scheduler.run(logo.perm_kld_calc_pvalue, jobs, proc=4,
+                            costs=[len(job[0]) for job in jobs], name="KLD")
+    scheduler.stop()
+"""
+from collections import defaultdict
+from multiprocessing import Pool
+import atexit
+import os
+import sys
+import time
+
+_function = None
+_pool = None
+_states = []
+
+
+def register_state(snapshot, restore):
+    """
+    Register module state applied to every worker at startup. :obj:`snapshot`
+    returns the state in the parent process when a pool starts and
+    :obj:`restore` applies it in a worker. :obj:`restore` is pickled for
+    workers that do not fork, so it should be a module level function.
+    """
+    _states.append((snapshot, restore))
+
+
+def _snapshot():
+    return [(restore, snapshot()) for snapshot, restore in _states]
+
+
+def _init_worker(function, states):
+    global _function
+    _function = function
+    for restore, state in states:
+        restore(state)
+
+
+def _timed(task):
+    index, function, args = task
+    if (function is None):
+        function = _function
+    start = time.process_time()
+    result = function(*args)
+    return index, os.getpid(), time.process_time() - start, result
+
+
+def start(proc):
+    """
+    Start the persistent pool of :obj:`proc` workers used by all stages
+    until :func:`stop`. Workers are started now and receive the state
+    registered with :func:`register_state`, so module state such as seeds,
+    backends and loaded caches should be set before.
+    """
+    global _pool
+    stop()
+    _pool = Pool(processes=proc, initializer=_init_worker, initargs=(None, _snapshot()))
+    atexit.register(stop)
+
+
+def stop():
+    """
+    Wait for the tasks of the persistent pool and shut it down.
+    """
+    global _pool
+    if (_pool is not None):
+        _pool.close()
+        _pool.join()
+        _pool = None
+
+
+def imap(function, jobs, proc, costs=None):
+    """
+    Apply :obj:`function` to every argument tuple of :obj:`jobs` and yield
+    (index, worker pid, CPU seconds, result) tuples as tasks finish. Uses
+    the persistent pool if started, otherwise a pool of :obj:`proc`
+    processes to which :obj:`function` is sent once, when it starts.
+    """
+    order = range(len(jobs))
+    if (costs is not None):
+        order = sorted(order, key=lambda index: -costs[index])
+    if (_pool is not None):
+        yield from _pool.imap_unordered(_timed, ((index, function, jobs[index]) for index in order))
+        return
+    with Pool(processes=proc, initializer=_init_worker, initargs=(function, _snapshot())) as pool:
+        yield from pool.imap_unordered(_timed, ((index, None, jobs[index]) for index in order))
+
+
+def run(function, jobs, proc, costs=None, name=None, file=None):
+    """
+    Apply :obj:`function` to every argument tuple of :obj:`jobs` in a pool of
+    :obj:`proc` processes, see :func:`imap`.
+    Args:
+        function (callable): task function, e.g. a bound method.
+        jobs (:obj:`list` of :obj:`tuple`): arguments of each task.
+        proc (:obj:`int`): number of worker processes.
+        costs (:obj:`list` of :obj:`float`): estimated relative cost of each
+            task; tasks are handed out in order of decreasing cost. Default
+            is to hand them out in job order.
+        name (:obj:`str`): label of the utilization summary written to
+            :obj:`file`, standard error by default; no summary is written
+            if ``None``.
+    Return:
+        (:obj:`list`): result of every task, in job order.
+    """
+    results = [None] * len(jobs)
+    busy = defaultdict(float)
+    tasks = defaultdict(int)
+    start_time = time.perf_counter()
+    for index, pid, elapsed, result in imap(function, jobs, proc, costs):
+        results[index] = result
+        busy[pid] += elapsed
+        tasks[pid] += 1
+    wall = time.perf_counter() - start_time
+    if (name is not None):
+        log_utilization(name, busy, tasks, wall, proc, file)
+    return results
+
+
+def log_utilization(name, busy, tasks, wall, proc, file=None):
+    """
+    Write the number of tasks, CPU time and utilization of every worker,
+    the fraction of the wall time :obj:`wall` it spent computing.
+    """
+    if (file is None):
+        file = sys.stderr
+    total = sum(busy.values()) / (wall * proc) if (wall > 0) else 0.0
+    print("{}: {} tasks on {} workers in {:.1f}s, {:.0%} utilization".format(name, sum(tasks.values()), proc, wall,
+                                                                            total), file=file)
+    for worker, pid in enumerate(sorted(busy, key=lambda pid: -busy[pid])):
+        utilization = busy[pid] / wall if (wall > 0) else 0.0
+        print("  worker {}: {} tasks, {:.1f}s CPU, {:.0%} utilization".format(worker, tasks[pid], busy[pid],
+                                                                            utilization), file=file)
@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
 import argparse
+import hashlib
 import sys
 import os
 import itertools
+import numpy as np
 import tsfm.MolecularInformation as MolecularInformation
+import tsfm.entropy as entropy
+import tsfm.nsb_entropy as nsb_entropy
+import tsfm.gpd as gpd
+import tsfm.permutation as permutation
+import tsfm.scheduler as scheduler
 from tsfm._version import __version__
 
 def main():
@@ -35,8 +42,8 @@ def main():
     parser.add_argument("-p", "--processes", type=int, default=os.cpu_count(),
                         help="Set the maximum number of concurrent processes. Default is the number of cores reported by the operating system.")
     parser.add_argument("-e", "--entropy", type=str, default="NSB",
-                        help="Use entropy estimator ENTROPY when conditional sample sizes exceed maximum for exact calculation. If value is \"NSB\", use Nemenman-Shafee-Bialek estimator. If value is \"MM\", use Miller-Madow estimator. Default is NSB",
-                        choices=['NSB', 'MM'])
+                        help="Use entropy estimator ENTROPY when conditional sample sizes exceed maximum for exact calculation. If value is \"NSB\", use Nemenman-Shafee-Bialek estimator. If value is \"MM\", use Miller-Madow estimator. If value is \"CS\", use Chao-Shen estimator. If value is \"plugin\", use the uncorrected maximum likelihood estimator. Default is NSB",
+                        choices=list(entropy.estimators))
     parser.add_argument("-x", "--exact",
                         help="Maximum conditional sample size to exactly calculate entropy correction. Default = 5",
                         type=int, default=5)
@@ -48,6 +55,8 @@ def main():
     parser.add_argument("-P", "--permutations",
                         help="Calculate the significance of CIFs by a permutation test, with a number of permutations equal to PERMUTATIONS (an integer). Default is to not calculate significance of CIFs.",
                         type=int, default=0)
+    parser.add_argument("--precision", type=int, default=None,
+                        help="Round permutation information values to PRECISION decimal places, bounding the memory of permutation distributions for large numbers of permutations. Default is to keep exact values.")
     parser.add_argument("-C", "--correction",
                         help="Specify a method for multiple test correction for significance calculations: bonferroni, sidak, holm, holm-sidak, simes-hochberg, hommel, BH (Benjamini-Hochberg FDR), BY (Benjamini-Yekutieli FDR) or GBS (Gavrilov-Benjamini-Sarkar FDR). Default is BH",
                         default="BH",
@@ -93,6 +102,15 @@ def main():
     parser.add_argument("--alpha",
                         help="Set the significance level to compute the confidence interval of pvalues. Default is 0.05",
                         type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed the random number generator used for permutations so that results can be reproduced. Default is to draw a fresh seed from the operating system")
+    parser.add_argument("--fastnsb", action="store_true",
+                        help="Use double precision NSB estimator based on scipy instead of arbitrary precision mpmath quadrature")
+    parser.add_argument("--fastgpd", action="store_true",
+                        help="Fit GPD tails by Newton's method on the profile likelihood, warm started from the previous fit, instead of scipy's Nelder-Mead fit")
+    parser.add_argument("--cachedir",
+                        help="Load and save NSB entropy estimates, exact sample size corrections, permutation distributions and KLD permutation nulls in directory CACHEDIR so that they are reused between runs. Default is to not persist estimates.",
+                        type=str, default=None)
 
     args = parser.parse_args()
 
@@ -106,6 +124,26 @@ def main():
     else:
         features = "both"
 
+    permutation.seed(args.seed)
+
+    if (args.fastnsb):
+        nsb_entropy.BACKEND = "scipy"
+
+    if (args.fastgpd):
+        gpd.BACKEND = "fast"
+
+    if (args.cachedir):
+        os.makedirs(args.cachedir, exist_ok=True)
+        nsb_cache_file = os.path.join(args.cachedir, "nsb_cache.pkl")
+        if (os.path.exists(nsb_cache_file)):
+            nsb_entropy.cache.load(nsb_cache_file)
+        kld_cache_file = os.path.join(args.cachedir, "kld_nulls.pkl")
+        if (os.path.exists(kld_cache_file)):
+            permutation.kld_nulls.load(kld_cache_file)
+        exact_cache_file = os.path.join(args.cachedir, "exact_cache.sqlite")
+        if (os.path.exists(exact_cache_file)):
+            entropy.exact_cache.load(exact_cache_file)
+
     # initialize dictionary that contains all datasets labeled by the file prefix
     logo_dict = {}
 
@@ -139,6 +177,7 @@ def main():
     for prefix in args.file_prefix:
         prefix_name = prefix.split("/")[-1]
         logo_dict[prefix_name].parse_sequences(prefix)
+        logo_dict[prefix_name].share()
 
     if (args.clade and args.clade not in logo_dict.keys()):
         sys.exit(
@@ -152,10 +191,18 @@ def main():
     if (args.exact):
         for key in logo_dict:
             print("Calculating Sample Size Correction for {}".format(key))
-            logo_dict[key].calculate_exact(args.exact, args.processes)
+            logo_dict[key].calculate_exact(args.exact)
             if (args.inverse):
                 print("Calculating Sample Size Correction for Inverse {}".format(key))
-                logo_dict[key].calculate_exact(args.exact, args.processes, inverse=True)
+                logo_dict[key].calculate_exact(args.exact, inverse=True)
+            if (args.idlogos):
+                # ID workers sum the exact corrections of permuted backgrounds from these tables
+                total = sum(logo_dict[key].functions.values())
+                for size in range(1, args.exact + 1):
+                    entropy.exact_cache.class_terms(total, size)
+
+    # One pool of workers serves every stage; workers receive the seed, backends and caches set above at startup
+    scheduler.start(args.processes)
 
     # Perform function label swapping permutations and calculate entropy distribution from permutations
     multitest_methods = {'bonferroni': 'b', 'sidak': 's', 'holm': 'h',
@@ -166,15 +213,28 @@ def main():
         perm_dict = {}
         for key in logo_dict:
             print("Generating permuted alignment data for {}".format(key), file=sys.stderr)
-            logo_dict[key].permute(args.permutations, args.processes)
+            logo_dict[key].permute(args.permutations)
         for key in logo_dict:
-            print("Calculating permutation information for {}".format(key), file=sys.stderr)
-            perm_dict[key] = logo_dict[key].permInfo(args.entropy, args.processes)
+            null_file = null_cache_file(args, key)
+            signature = null_signature(args, logo_dict[key])
+            perm_dict[key] = load_null(null_file, args.permutations, signature)
+            if (perm_dict[key] is None):
+                print("Calculating permutation information for {}".format(key), file=sys.stderr)
+                perm_dict[key] = logo_dict[key].permInfo(args.entropy, args.processes, decimals=args.precision)
+                if (null_file):
+                    perm_dict[key].save(null_file, signature)
         if (args.inverse):
             perm_inverse_dict = {}
             for key in logo_dict:
-                print("Calculating inverse permutation information for {}".format(key), file = sys.stderr)
-                perm_inverse_dict[key] = logo_dict[key].permInfo(args.entropy, args.processes, inverse=True)
+                null_file = null_cache_file(args, key, inverse=True)
+                signature = null_signature(args, logo_dict[key], inverse=True)
+                perm_inverse_dict[key] = load_null(null_file, args.permutations, signature)
+                if (perm_inverse_dict[key] is None):
+                    print("Calculating inverse permutation information for {}".format(key), file = sys.stderr)
+                    perm_inverse_dict[key] = logo_dict[key].permInfo(args.entropy, args.processes, inverse=True,
+                                                                     decimals=args.precision)
+                    if (null_file):
+                        perm_inverse_dict[key].save(null_file, signature)
 
     results = {}
 
@@ -187,25 +247,17 @@ def main():
                                                                 logo_dict[key].pairs,
                                                                 logo_dict[key].singles)
 
-    if (args.entropy == "NSB"):
-        for key in logo_dict:
-            print("Calculating information statistics for {} using NSB estimator".format(key), file = sys.stderr)
-            info, height_dict = logo_dict[key].calculate_entropy_NSB()
-            results[key].add_information(info=info, height=height_dict)
-            if (args.inverse):
-                print("Calculating inverse information statistics for {} using NSB estimator".format(key), file
-                      = sys.stderr)
-                info_inverse, height_dict_inverse = logo_dict[key].calculate_entropy_inverse_NSB()
-                results[key].add_information(info=info_inverse, height=height_dict_inverse, inverse=True)
-    elif (args.entropy == "MM"):
-        for key in logo_dict:
-            print("Calculating information statistics using Miller-Maddow estimator")
-            info, height_dict = logo_dict[key].calculate_entropy_MM()
-            results[key].add_information(info=info, height=height_dict)
-            if (args.inverse):
-                print("Calculating inverse using Miller-Maddow estimator")
-                info_inverse, height_dict_inverse = logo_dict[key].calculate_entropy_inverse_MM()
-                results[key].add_information(info=info_inverse, height=height_dict_inverse, inverse=True)
+    description = entropy.estimator(args.entropy).description
+    for key in logo_dict:
+        print("Calculating information statistics for {} using {} estimator".format(key, description),
+              file=sys.stderr)
+        info, height_dict = logo_dict[key].calculate_entropy(args.entropy)
+        results[key].add_information(info=info, height=height_dict)
+        if (args.inverse):
+            print("Calculating inverse information statistics for {} using {} estimator".format(key, description),
+                  file=sys.stderr)
+            info_inverse, height_dict_inverse = logo_dict[key].calculate_entropy(args.entropy, inverse=True)
+            results[key].add_information(info=info_inverse, height=height_dict_inverse, inverse=True)
 
     if (args.permutations):
         print("Calculating p-values using {} multiple test correction".format(args.correction))
@@ -332,7 +384,7 @@ def main():
                 singles = list(set(logo_dict[cpair[0]].singles) & set(logo_dict[cpair[1]].singles))
                 klddifference = MolecularInformation.FunctionLogoDifference(pos, types, pairs, basepairs, singles)
                 logo_dict_pair = {key: logo_dict[key] for key in [cpair[0], cpair[1]]}
-                kld_pvalues, CI_lower, CI_upper, permnum_dic, pmethodtype_dic, bt_dic, ft_dic, shape_dic, scale_dic, excnum_dic, ADtest_dic = klddifference.calculate_kld_significance(
+                kld_pvalues, CI_lower, CI_upper, permnum_dic, pmethodtype_dic, bt_dic, ft_dic, shape_dic, scale_dic, excnum_dic, ADtest_dic, fits_dic = klddifference.calculate_kld_significance(
                     logo_dict_pair, kld_infos, args.kldperms,
                     args.processes, args.pmethod, args.exceedances, args.targetperms, args.peaks, args.alpha, features)
                 kld_pvalues_corrected = klddifference.addstats(kld_pvalues, multitest_methods[args.correction],
@@ -341,7 +393,7 @@ def main():
                 print("Writing text output for KLD significance")
                 klddifference.write_pvalues(kld_pvalues, CI_lower, CI_upper, kld_pvalues_corrected, kld_infos,
                                             logo_dict_pair, "KLD", permnum_dic, pmethodtype_dic, bt_dic, ft_dic,
-                                            shape_dic, scale_dic, excnum_dic, ADtest_dic)
+                                            shape_dic, scale_dic, excnum_dic, ADtest_dic, fits_dic)
 
             if args.idperms:
                 print("Calculating significance of IDs between", cpair[0], "and", cpair[1])
@@ -349,7 +401,7 @@ def main():
                 singles = list(set(logo_dict[cpair[0]].singles) & set(logo_dict[cpair[1]].singles))
                 iddifference = MolecularInformation.FunctionLogoDifference(pos, types, pairs, basepairs, singles)
                 logo_dict_pair = {key: logo_dict[key] for key in [cpair[0], cpair[1]]}
-                id_pvalues, CI_lower, CI_upper, permnum_dic, pmethodtype_dic, bt_dic, ft_dic, shape_dic, scale_dic, excnum_dic, ADtest_dic = iddifference.calculate_id_significance(
+                id_pvalues, CI_lower, CI_upper, permnum_dic, pmethodtype_dic, bt_dic, ft_dic, shape_dic, scale_dic, excnum_dic, ADtest_dic, fits_dic = iddifference.calculate_id_significance(
                     logo_dict_pair, id_infos, args.idperms,
                     args.processes,
                     args.exact,
@@ -358,7 +410,61 @@ def main():
                 print("Writing text output for ID significance")
                 iddifference.write_pvalues(id_pvalues, CI_lower, CI_upper, id_pvalues_corrected, id_infos,
                                            logo_dict_pair, "ID", permnum_dic, pmethodtype_dic, bt_dic, ft_dic,
-                                           shape_dic, scale_dic, excnum_dic, ADtest_dic)
+                                           shape_dic, scale_dic, excnum_dic, ADtest_dic, fits_dic)
+
+    scheduler.stop()
+
+    if (args.cachedir):
+        nsb_entropy.cache.save(nsb_cache_file)
+        permutation.kld_nulls.save(kld_cache_file)
+        entropy.exact_cache.save(exact_cache_file)
+
+
+def null_cache_file(args, key, inverse=False):
+    """
+    Name of the file in CACHEDIR holding the permutation null distribution of
+    clade :obj:`key` for the entropy, exact and precision settings in :obj:`args`.
+    Other settings are checked against :func:`null_signature` when loading.
+    """
+    if (not args.cachedir):
+        return None
+    return os.path.join(args.cachedir, "{}_{}_x{}_p{}{}_null.npz".format(
+        os.path.basename(key), args.entropy, args.exact, args.precision, "_inverse" if inverse else ""))
+
+
+def null_signature(args, logo, inverse=False):
+    """
+    Digest identifying the alignment, structure and settings of :obj:`args`
+    that the permutation null distribution of :obj:`logo` depends on: the
+    encoded alignment, class labels and basepairs, the exact corrections,
+    the estimator and NSB backend, the seed and the precision.
+    """
+    sha = hashlib.sha256()
+    sha.update(logo.counts.digest().encode())
+    corrections = logo.inverse_exact if (inverse) else logo.exact
+    sha.update(np.asarray(corrections, dtype=float).tobytes())
+    sha.update(repr((args.entropy, nsb_entropy.BACKEND, args.seed, args.precision, inverse)).encode())
+    return sha.hexdigest()
+
+
+def load_null(null_file, permutations, signature=None):
+    """
+    Load a saved permutation null distribution if it was estimated from
+    exactly :obj:`permutations` permutations and, unless :obj:`signature` is
+    ``None``, from the alignment and settings of :func:`null_signature`.
+    """
+    if (not null_file or not os.path.exists(null_file)):
+        return None
+    perm_dist = MolecularInformation.FunctionLogoDist()
+    perm_dist.from_file(null_file)
+    if (signature is not None and perm_dist.signature != signature):
+        print("Ignoring permutation distribution saved in {} for a different alignment or settings".format(
+            null_file), file=sys.stderr)
+        return None
+    if (perm_dist.permutations != permutations):
+        return None
+    print("Using permutation distribution saved in {}".format(null_file), file=sys.stderr)
+    return perm_dist
 
 
 if __name__ == "__main__":